@@ -1,6 +1,7 @@
 import paho.mqtt.client as mqtt
 import time
 import json
+import msgpack
 import random
 import logging
 from datetime import datetime
@@ -22,16 +23,21 @@ class State(Enum):
     STATE_SLEEP = "SLEEP"
 
 class ESP32FakeSensor:
-    def __init__(self, device_id=None):
+    def __init__(self, device_id=None, payload_format='json', legacy_topics=False):
         # Device configuration
         self.device_id = device_id or f"Sensor32_{random.randint(10000, 99999)}"
         self.sleep_duration = 30  # Default sleep duration in seconds
+        # 'json', or 'msgpack' for the compact binary readings (short keys, epoch timestamp)
+        self.payload_format = payload_format
+        # Publish each reading to the old per-metric topics instead of mynode/telemetry
+        self.legacy_topics = legacy_topics
         
         # MQTT settings
         self.mqtt_server = "broker.hivemq.com"
         self.mqtt_port = 1883
         
         # MQTT topics
+        self.TOPIC_TELEMETRY = "mynode/telemetry"
         self.TOPIC_TEMP = "mynode/Temperature"
         self.TOPIC_MOISTURE = "mynode/moisture"
         self.TOPIC_AUTH = "mynode/auth"
@@ -163,18 +169,30 @@ class ESP32FakeSensor:
         temperature, humidity = self.generate_sensor_data()
         
         # Prepare data payload
-        data = {
-            'device_id': self.device_id,
-            'temperature': temperature,
-            'moisture': humidity,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        json_data = json.dumps(data)
-        
-        # Publish to both topics
-        if (self.client.publish(self.TOPIC_TEMP, json_data).rc == 0 and
-            self.client.publish(self.TOPIC_MOISTURE, json_data).rc == 0):
+        if self.payload_format == 'msgpack':
+            payload = msgpack.packb({
+                'd': self.device_id,
+                'T': temperature,
+                'M': humidity,
+                'ts': int(time.time())
+            })
+            suffix = '/mp'
+        else:
+            payload = json.dumps({
+                'device_id': self.device_id,
+                'temperature': temperature,
+                'moisture': humidity,
+                'timestamp': datetime.now().isoformat()
+            })
+            suffix = ''
+
+        # One message on the combined topic, or the same one on both legacy topics
+        if self.legacy_topics:
+            topics = [self.TOPIC_TEMP + suffix, self.TOPIC_MOISTURE + suffix]
+        else:
+            topics = [self.TOPIC_TELEMETRY + suffix]
+
+        if all(self.client.publish(topic, payload).rc == 0 for topic in topics):
             logging.info(f"[DATA] Published - T: {temperature}°C, H: {humidity}%")
             self.data_sent = True
             self.set_state(State.STATE_WAIT_ACK)
@@ -0,0 +1,416 @@
+"""
+End-to-end benchmark of the server against a local broker and a scratch database.
+
+Starts mini_broker.MiniBroker in-process and app.py as a subprocess pointed
+at it (FLASK_* environment overrides) with a fresh database in a temporary
+directory, then:
+
+  1. registers the synthetic sensors and pumps and adds an on/off rule pair,
+  2. ingest phase: every sensor publishes telemetry, waits for its ack on
+     mynode/ack and publishes again, while the pumps send water levels,
+  3. rule phase: a trigger sensor alternately crosses the on and off
+     thresholds and the time until the control publish is measured.
+
+The results are written as JSON. With --baseline the run is compared with an
+earlier result and exits non-zero when a metric got worse by more than
+--tolerance:
+
+    python e2e_benchmark.py --sensors 200 --duration 30 --output bench.json
+    python e2e_benchmark.py --baseline bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+import paho.mqtt.client as mqtt
+
+from mini_broker import MiniBroker
+from sensor_swarm import percentiles
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+TRIGGER_SENSOR = "Sensor32_TRIGGER"
+ON_THRESHOLD = 100
+OFF_THRESHOLD = -100
+
+# (metric path, True if higher is better) compared against --baseline
+TRACKED_METRICS = [
+    ('ingest.messages_per_second', True),
+    ('ingest.ack_latency.p50_ms', False),
+    ('ingest.ack_latency.p99_ms', False),
+    ('rules.latency.p50_ms', False),
+    ('rules.latency.p99_ms', False),
+    ('db.bytes_per_reading', False),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def db_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+class ServerProcess:
+    """app.py in a subprocess with a scratch working directory and database"""
+    def __init__(self, broker_port, workdir):
+        self.workdir = workdir
+        self.http_port = free_port()
+        self.database = os.path.join(workdir, 'bench.db')
+        self.base_url = f"http://127.0.0.1:{self.http_port}"
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.env = dict(os.environ,
+                        FLASK_MQTT_BROKER_URL='127.0.0.1',
+                        FLASK_MQTT_BROKER_PORT=str(broker_port),
+                        FLASK_MQTT_KEEPALIVE='60',
+                        FLASK_DATABASE=self.database,
+                        FLASK_HTTP_PORT=str(self.http_port),
+                        FLASK_LOG_LEVEL='WARNING')
+        self.process = None
+        self.log = None
+
+    def start(self, timeout=60):
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'wb')
+        self.process = subprocess.Popen([sys.executable, APP_PATH], cwd=self.workdir, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.process.returncode}, see {self.log.name}")
+            try:
+                self.opener.open(self.base_url + '/login', timeout=2).read()
+                return
+            except OSError:
+                time.sleep(0.5)
+        raise RuntimeError(f"Server did not answer within {timeout}s, see {self.log.name}")
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(20)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    def login(self, username='admin', password='admin123'):
+        data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(self.base_url + '/login', data, timeout=10).read()
+
+    def api(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data,
+                                         {'Content-Type': 'application/json'} if data else {})
+        with self.opener.open(request, timeout=10) as response:
+            return json.loads(response.read())
+
+
+class LoadClient:
+    """Synthetic sensors and pumps over a few broker connections.
+
+    The first connection subscribes to the server's replies; the others only
+    publish. Each sensor keeps one message in flight, like the firmware
+    waiting for its ack, so the ack rate is the sustained ingest rate.
+    """
+    def __init__(self, port, sensors, pumps, connections):
+        self.sensor_ids = [f"Sensor32_BENCH{index:05d}" for index in range(sensors)]
+        self.pump_ids = [f"PUMP_BENCH{index:04d}" for index in range(pumps)]
+        self.clients = [mqtt.Client(f"bench-{index}", clean_session=True) for index in range(connections)]
+        self.next_client = 0
+        self.publish_lock = threading.Lock()
+        self.port = port
+        self.connected = threading.Event()
+
+        self.lock = threading.Lock()
+        self.running = False
+        self.in_flight = {}       # device_id -> publish time
+        self.ack_latencies = []
+        self.resent = 0
+        self.sequence = 0
+        self.approved = set()
+        self.registered = set()
+        self.controls = []        # (receive time, topic, payload)
+        self.control_event = threading.Event()
+
+    def connect(self):
+        listener = self.clients[0]
+        listener.on_connect = self.on_connect
+        listener.on_message = self.on_message
+        for client in self.clients:
+            client.max_inflight_messages_set(1000)
+            client.connect('127.0.0.1', self.port, 60)
+            client.loop_start()
+        if not self.connected.wait(10):
+            raise RuntimeError("Could not connect to the local broker")
+
+    def close(self):
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+    def on_connect(self, client, userdata, flags, rc):
+        client.subscribe([('mynode/ack', 0), ('mynode/auth', 0), ('mynode/pump_auth', 0),
+                          ('mynode/pump_control', 0), ('mynode/+/control', 0)])
+        self.connected.set()
+
+    def on_message(self, client, userdata, msg):
+        received = time.perf_counter()
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError:
+            return
+        device_id = payload.get('device_id')
+        if msg.topic == 'mynode/ack':
+            with self.lock:
+                sent = self.in_flight.pop(device_id, None)
+                if sent is None:
+                    return
+                self.ack_latencies.append(received - sent)
+            if self.running:
+                self.send_telemetry(device_id)
+        elif msg.topic == 'mynode/auth' and payload.get('status') == 'approved':
+            self.approved.add(device_id)
+        elif msg.topic == 'mynode/pump_auth' and payload.get('status') in ('registered', 'confirmed'):
+            self.registered.add(device_id)
+        elif msg.topic.endswith('control') and 'command' in payload:
+            self.controls.append((received, msg.topic, payload))
+            self.control_event.set()
+
+    def publish(self, topic, payload, qos=0):
+        with self.publish_lock:
+            client = self.clients[self.next_client]
+            self.next_client = (self.next_client + 1) % len(self.clients)
+        client.publish(topic, json.dumps(payload), qos=qos)
+
+    def register(self, timeout=30):
+        for sensor_id in self.sensor_ids + [TRIGGER_SENSOR]:
+            self.publish('mynode/auth', {'device_id': sensor_id, 'action': 'auth_request'})
+        for pump_id in self.pump_ids:
+            self.publish('mynode/pump_auth', {'device_id': pump_id, 'status': 'new',
+                                              'timestamp': datetime.now().isoformat()}, qos=1)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if len(self.approved) > len(self.sensor_ids) and len(self.registered) >= len(self.pump_ids):
+                return
+            time.sleep(0.1)
+        raise RuntimeError(f"Registration incomplete: {len(self.approved)} sensors, "
+                           f"{len(self.registered)} pumps")
+
+    def send_telemetry(self, device_id, temperature=None):
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+            self.in_flight[device_id] = time.perf_counter()
+        self.publish('mynode/telemetry', {
+            'device_id': device_id,
+            'temperature': temperature if temperature is not None else 20 + sequence % 10,
+            'moisture': 40 + sequence % 20,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def run_ingest(self, duration, pump_interval, ack_timeout=5):
+        """Closed-loop telemetry for `duration` seconds; returns the ingest metrics"""
+        self.running = True
+        started = time.perf_counter()
+        for sensor_id in self.sensor_ids:
+            self.send_telemetry(sensor_id)
+
+        next_pump_round = started
+        while time.perf_counter() - started < duration:
+            now = time.perf_counter()
+            if self.pump_ids and now >= next_pump_round:
+                next_pump_round += pump_interval
+                for pump_id in self.pump_ids:
+                    level = round(50 + 10 * ((now * 7 + hash(pump_id)) % 1), 2)
+                    self.publish('mynode/water_level', {'device_id': pump_id, 'water_level': level,
+                                                        'timestamp': datetime.now().isoformat()})
+            # A message the server dropped would stall its sensor, so resend it
+            with self.lock:
+                stalled = [device_id for device_id, sent in self.in_flight.items() if now - sent > ack_timeout]
+            for device_id in stalled:
+                self.resent += 1
+                self.send_telemetry(device_id)
+            time.sleep(0.01)
+        self.running = False
+        elapsed = time.perf_counter() - started
+
+        time.sleep(1)  # let the last acks arrive
+        with self.lock:
+            latencies = list(self.ack_latencies)
+            self.in_flight.clear()
+        return {
+            'duration_s': round(elapsed, 2),
+            'acked': len(latencies),
+            'messages_per_second': round(len(latencies) / elapsed, 1),
+            'resent_after_timeout': self.resent,
+            'ack_latency': percentiles(latencies)
+        }
+
+    def run_rules(self, pump_id, rounds, timeout=5):
+        """Cross the on/off thresholds `rounds` times; returns the rule-to-control metrics"""
+        latencies = []
+        missed = 0
+        for round_number in range(rounds):
+            turn_on = round_number % 2 == 0
+            self.control_event.clear()
+            seen = len(self.controls)
+            sent = time.perf_counter()
+            self.send_telemetry(TRIGGER_SENSOR, ON_THRESHOLD + 50 if turn_on else OFF_THRESHOLD - 50)
+            deadline = sent + timeout
+            matched = None
+            while matched is None and time.perf_counter() < deadline:
+                self.control_event.wait(max(0, deadline - time.perf_counter()))
+                self.control_event.clear()
+                matched = next((received for received, _, payload in self.controls[seen:]
+                                if payload.get('device_id') == pump_id
+                                and payload.get('command') == ('on' if turn_on else 'off')), None)
+            if matched is None:
+                missed += 1
+            else:
+                latencies.append(matched - sent)
+        return {'rounds': rounds, 'missed': missed, 'latency': percentiles(latencies)}
+
+
+def metric(result, path):
+    for key in path.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Print metric changes against a baseline; returns the regressed metric names"""
+    regressions = []
+    for path, higher_is_better in TRACKED_METRICS:
+        current, previous = metric(result, path), metric(baseline, path)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        flag = 'REGRESSION' if worse > tolerance else 'ok'
+        print(f"[COMPARE] {path}: {previous} -> {current} ({change:+.1%}) {flag}")
+        if worse > tolerance:
+            regressions.append(path)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(APP_PATH),
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(args):
+    broker = MiniBroker()
+    broker_port = broker.start()
+    workdir = tempfile.mkdtemp(prefix='mqtt-bench-')
+    server = ServerProcess(broker_port, workdir)
+    load = LoadClient(broker_port, args.sensors, args.pumps, args.connections)
+    try:
+        server.start()
+        server.login()
+        load.connect()
+        load.register()
+
+        rule_pump = load.pump_ids[0]
+        for threshold, comparison, action in ((ON_THRESHOLD, 'above', 'on'), (OFF_THRESHOLD, 'below', 'off')):
+            server.api(f'/api/pump/{rule_pump}/rules', {
+                'sensor_id': TRIGGER_SENSOR, 'reading_type': 'temperature',
+                'comparison_type': comparison, 'threshold_value': threshold,
+                'action': action, 'duration': 60
+            })
+
+        time.sleep(1)  # ingest flush of the registration writes
+        size_before = db_size(server.database)
+        logging.info(f"[BENCH] Ingest: {args.sensors} sensors, {args.pumps} pumps for {args.duration}s")
+        ingest = load.run_ingest(args.duration, args.pump_interval)
+        logging.info(f"[BENCH] Rules: {args.rule_rounds} threshold crossings")
+        rules = load.run_rules(rule_pump, args.rule_rounds)
+        server_stats = server.api('/api/stats')
+    finally:
+        load.close()
+        server.stop()
+        broker.stop()
+
+    size_after = db_size(server.database)
+    with sqlite3.connect(server.database) as conn:
+        readings = conn.execute('SELECT COUNT(*) FROM sensor_readings').fetchone()[0]
+    return {
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'sensors': args.sensors, 'pumps': args.pumps, 'connections': args.connections,
+            'duration_s': args.duration, 'pump_interval_s': args.pump_interval,
+            'rule_rounds': args.rule_rounds
+        },
+        'ingest': ingest,
+        'rules': rules,
+        'db': {
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+            'growth_bytes': size_after - size_before,
+            'sensor_readings': readings,
+            'bytes_per_reading': round((size_after - size_before) / readings, 1) if readings else None
+        },
+        'broker': {'messages_in': broker.messages_in, 'messages_out': broker.messages_out},
+        'server': {'mqtt': server_stats.get('mqtt'), 'ingest': server_stats.get('ingest')},
+        'workdir': workdir
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end server benchmark")
+    parser.add_argument('--sensors', type=int, default=100, help='concurrent sensors, one message in flight each')
+    parser.add_argument('--pumps', type=int, default=10, help='pumps sending water levels')
+    parser.add_argument('--pump-interval', type=float, default=1.0, help='seconds between water levels per pump')
+    parser.add_argument('--connections', type=int, default=4, help='broker connections for the load')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of ingest load')
+    parser.add_argument('--rule-rounds', type=int, default=50, help='rule threshold crossings to time')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the JSON result')
+    parser.add_argument('--baseline', help='earlier result to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative change for the worse before failing')
+    args = parser.parse_args()
+    if args.pumps < 1:
+        parser.error('--pumps must be at least 1, the rule phase needs a pump')
+
+    result = run_benchmark(args)
+    with open(args.output, 'w') as output:
+        json.dump(result, output, indent=2)
+    print(json.dumps({key: result[key] for key in ('ingest', 'rules', 'db')}, indent=2))
+    logging.info(f"[BENCH] Result written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(result, json.load(baseline_file), args.tolerance)
+        if regressions:
+            logging.error(f"[BENCH] Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
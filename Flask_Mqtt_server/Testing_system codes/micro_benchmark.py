@@ -0,0 +1,267 @@
+"""
+Microbenchmarks of hot server functions on large synthetic databases.
+
+Builds a database at production scale (1k sensors, 100 pumps, 10k pump
+rules) and grows sensor_readings through the requested row counts. After
+each step the functions below are timed in isolation, in-process, against
+the same database, so the output is a scaling curve per function:
+
+    check_pump_rules (with and without a rule firing), get_all_sensors,
+    get_sensor_readings (one sensor / all), get_latest_pump_readings,
+    build_pump_status (the tank volume calculation), get_unclaimed_sensors
+    (the discovery query) and LatestValueCache.seed (startup).
+
+app.py is imported against mini_broker.MiniBroker so nothing leaves the
+machine. Generating 100M rows takes a while and several GB of disk; keep
+the database with --database and later runs only add what is missing:
+
+    python micro_benchmark.py --rows 100000,1000000,10000000 --output micro.json
+    python micro_benchmark.py --rows 10000000,100000000 --database /data/micro.db
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from mini_broker import MiniBroker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SENSOR_TYPES = ('temperature', 'moisture')
+TICK_SECONDS = 60        # every device reports once per tick
+INSERT_CHUNK = 500000    # rows per generation transaction
+
+# Rule thresholds: 'above' rules sit in 30-40 and 'below' rules in 10-20, so
+# a value of 25 fires nothing and 45 fires every 'above' rule of its sensor
+IDLE_VALUE = 25
+FIRING_VALUE = 45
+
+
+def load_app(database):
+    """Import app.py against a local broker and the benchmark database"""
+    broker = MiniBroker()
+    port = broker.start()
+    os.environ.update(FLASK_MQTT_BROKER_URL='127.0.0.1', FLASK_MQTT_BROKER_PORT=str(port),
+                      FLASK_DATABASE=database, FLASK_LOG_LEVEL='ERROR', FLASK_BACKGROUND_SERVICES='false')
+    sys.path.insert(0, APP_DIR)
+    import app
+    app.init_db()
+    return app, broker
+
+
+class SyntheticDatabase:
+    """Devices, pumps and rules once, then sensor_readings appended to a target row count"""
+    def __init__(self, path, sensors, pumps, rules, seed):
+        self.path = path
+        self.sensor_ids = [f"Sensor32_{index:06X}" for index in range(sensors)]
+        self.pump_ids = [f"PUMP_{index:04d}" for index in range(pumps)]
+        self.rules = rules
+        self.random = random.Random(seed)
+        self.rows_per_tick = len(self.sensor_ids) * len(SENSOR_TYPES) + len(self.pump_ids)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        return conn
+
+    def populate_devices(self):
+        with self.connect() as conn:
+            if conn.execute('SELECT COUNT(*) FROM device_settings').fetchone()[0]:
+                return
+            logging.info(f"[GEN] {len(self.sensor_ids)} sensors, {len(self.pump_ids)} pumps, {self.rules} rules")
+            conn.executemany('INSERT INTO device_settings (device_id, sleep_duration) VALUES (?, ?)',
+                             [(sensor_id, 30) for sensor_id in self.sensor_ids])
+            # One in ten sensors stays unclaimed, so the discovery page has work to do
+            conn.executemany('INSERT INTO sensor_locations (device_id, location, name) VALUES (?, ?, ?)',
+                             [(sensor_id, f"Field {index % 20}", f"Sensor {index}")
+                              for index, sensor_id in enumerate(self.sensor_ids) if index % 10])
+            pumps = []
+            for pump_id in self.pump_ids:
+                box = self.random.random() < 0.5
+                pumps.append((pump_id, pump_id, 'Pump house', 'box' if box else 'cylinder',
+                              self.random.uniform(50, 150) if box else None,
+                              self.random.uniform(50, 150) if box else None,
+                              self.random.uniform(80, 200),
+                              None if box else self.random.uniform(40, 120),
+                              'configured', self.random.uniform(10, 70)))
+            conn.executemany('''
+                INSERT INTO pumps (pump_id, name, location, tank_shape, tank_length, tank_width,
+                                   tank_height, tank_diameter, status, last_reading)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', pumps)
+            claimed = [sensor_id for index, sensor_id in enumerate(self.sensor_ids) if index % 10]
+            rules = []
+            for _ in range(self.rules):
+                above = self.random.random() < 0.5
+                rules.append((self.random.choice(self.pump_ids), self.random.choice(claimed),
+                              self.random.uniform(30, 40) if above else self.random.uniform(10, 20),
+                              self.random.choice(SENSOR_TYPES), 'above' if above else 'below',
+                              'on' if above else 'off', self.random.randint(1, 30)))
+            conn.executemany('''
+                INSERT INTO pump_rules (pump_id, sensor_id, threshold_value, reading_type,
+                                        comparison_type, action, duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rules)
+
+    def reading_count(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM sensor_readings').fetchone()[0]
+
+    def grow(self, target_rows, max_rows):
+        """Append whole ticks of readings until there are at least target_rows"""
+        # Ticks are laid out so the largest run ends at the current time
+        first_tick = datetime.utcnow() - timedelta(seconds=TICK_SECONDS * (max_rows // self.rows_per_tick + 1))
+        rows = self.reading_count()
+        if rows >= target_rows:
+            return rows
+        started = time.perf_counter()
+        conn = self.connect()
+        try:
+            tick = rows // self.rows_per_tick
+            while rows < target_rows:
+                batch = []
+                while len(batch) < INSERT_CHUNK and rows + len(batch) < target_rows:
+                    timestamp = (first_tick + timedelta(seconds=TICK_SECONDS * tick)).strftime('%Y-%m-%d %H:%M:%S')
+                    for sensor_id in self.sensor_ids:
+                        batch.append((sensor_id, 'temperature', round(self.random.uniform(15, 35), 1), timestamp))
+                        batch.append((sensor_id, 'moisture', round(self.random.uniform(20, 80), 1), timestamp))
+                    for pump_id in self.pump_ids:
+                        batch.append((pump_id, 'water_level', round(self.random.uniform(10, 70), 1), timestamp))
+                    tick += 1
+                with conn:
+                    conn.executemany('INSERT INTO sensor_readings (device_id, sensor_type, value, timestamp) '
+                                     'VALUES (?, ?, ?, ?)', batch)
+                rows += len(batch)
+                elapsed = time.perf_counter() - started
+                logging.info(f"[GEN] {rows:,} readings after {elapsed:.0f}s")
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+        return rows
+
+
+def time_call(func, repeat):
+    func()  # warm the page cache and statement cache
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'max_ms': round(max(samples), 3)
+    }
+
+
+def benchmarks(app, db):
+    """name -> zero-argument callable exercising one hot function"""
+    app.rule_index.rebuild()
+    # A sensor that has 'above' rules, so FIRING_VALUE really fires something
+    with app.get_db() as conn:
+        firing_sensor, firing_type = conn.execute('''
+            SELECT sensor_id, reading_type FROM pump_rules
+            WHERE comparison_type = 'above' GROUP BY sensor_id, reading_type
+            ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()
+        pumps = [dict(row) for row in conn.execute('SELECT * FROM pumps')]
+    sensor_id = db.sensor_ids[len(db.sensor_ids) // 2]
+
+    return {
+        'check_pump_rules (no rule fires)':
+            lambda: app.check_pump_rules(firing_sensor, firing_type, IDLE_VALUE),
+        # After the warm-up call the pumps are running, so this is the steady
+        # state of a busy rule: pump lookups plus a rule_actions row per match
+        'check_pump_rules (rules fire)':
+            lambda: app.check_pump_rules(firing_sensor, firing_type, FIRING_VALUE),
+        'get_all_sensors': app.get_all_sensors,
+        'get_sensor_readings(sensor, 10)': lambda: app.get_sensor_readings(sensor_id, 10),
+        'get_sensor_readings(all, 100)': lambda: app.get_sensor_readings(None, 100),
+        'get_latest_pump_readings': app.get_latest_pump_readings,
+        'build_pump_status (all pumps)': lambda: [app.build_pump_status(pump) for pump in pumps],
+        'get_unclaimed_sensors (discovery)': app.get_unclaimed_sensors,
+        'LatestValueCache.seed': app.latest_cache.seed,
+    }
+
+
+def scaling_exponent(curve):
+    """Slope of log(time) over log(rows): ~0 is flat, ~1 grows with the table"""
+    points = [(rows, result['median_ms']) for rows, result in curve if result['median_ms'] > 0]
+    if len(points) < 2 or points[0][0] == points[-1][0]:
+        return None
+    (rows_first, time_first), (rows_last, time_last) = points[0], points[-1]
+    return round(math.log(time_last / time_first) / math.log(rows_last / rows_first), 2)
+
+
+def print_table(results, sizes):
+    width = max(len(name) for name in results)
+    print(f"{'median ms':<{width}}  " + ''.join(f"{size:>14,}" for size in sizes) + '   exponent')
+    for name, curve in results.items():
+        cells = ''.join(f"{result['median_ms']:>14.3f}" for _, result in curve)
+        exponent = scaling_exponent(curve)
+        print(f"{name:<{width}}  {cells}   {exponent if exponent is not None else '-':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-function microbenchmarks on synthetic databases")
+    parser.add_argument('--rows', default='100000,1000000,10000000',
+                        help='comma separated sensor_readings sizes to measure at')
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--pumps', type=int, default=100)
+    parser.add_argument('--rules', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per function and size')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='keep the synthetic database here and reuse it next time')
+    parser.add_argument('--output', default='micro_benchmark.json', help='where to write the JSON result')
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.rows.split(','))
+    database = os.path.abspath(args.database or os.path.join(tempfile.mkdtemp(prefix='mqtt-micro-'), 'micro.db'))
+    app, broker = load_app(database)
+    db = SyntheticDatabase(database, args.sensors, args.pumps, args.rules, args.seed)
+    db.populate_devices()
+
+    results = {}
+    measured = []
+    for size in sizes:
+        rows = db.grow(size, sizes[-1])
+        logging.info(f"[BENCH] Timing at {rows:,} readings")
+        app.db_pool.close_all()  # fresh connections see the new statistics and file size
+        for name, func in benchmarks(app, db).items():
+            results.setdefault(name, []).append((rows, time_call(func, args.repeat)))
+        measured.append(rows)
+
+    print_table(results, measured)
+    with open(args.output, 'w') as output:
+        json.dump({
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'config': {'sensors': args.sensors, 'pumps': args.pumps, 'rules': args.rules,
+                       'repeat': args.repeat, 'seed': args.seed},
+            'database': database,
+            'database_bytes': os.path.getsize(database),
+            'results': {
+                name: {
+                    'curve': [dict(rows=rows, **result) for rows, result in curve],
+                    'scaling_exponent': scaling_exponent(curve)
+                }
+                for name, curve in results.items()
+            }
+        }, output, indent=2)
+    logging.info(f"[BENCH] Result written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Minimal MQTT 3.1.1 broker for local benchmarks and tests.
+
+Just enough of the protocol for paho and Flask-MQTT: CONNECT, SUBSCRIBE and
+UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0 and 1 (acknowledged to
+the publisher, always delivered at QoS 0), PINGREQ and DISCONNECT. No
+retained messages, sessions, authentication or QoS 2. It runs on its own
+asyncio loop in a background thread so a benchmark can start it in-process:
+
+    broker = MiniBroker()
+    port = broker.start()
+    ...
+    broker.stop()
+"""
+import asyncio
+import logging
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def read_string(data, offset):
+    length = struct.unpack_from('!H', data, offset)[0]
+    return data[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+class Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = ''
+        self.filters = set()
+
+
+class MiniBroker:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.sessions = set()
+        self.routes = {}  # topic -> sessions subscribed to it, rebuilt when subscriptions change
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.messages_in = 0
+        self.messages_out = 0
+
+    def start(self):
+        """Start serving in a background thread; returns the port"""
+        self.thread = threading.Thread(target=self._run, name='mini-broker', daemon=True)
+        self.thread.start()
+        self.ready.wait(10)
+        return self.port
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._serve, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"[BROKER] Listening on {self.host}:{self.port}")
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+            self.loop.close()
+
+    async def _serve(self, reader, writer):
+        session = Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b''
+                if not self._handle(session, first[0] >> 4, first[0] & 0x0F, body):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            if session.filters:
+                self.routes.clear()
+            writer.close()
+
+    def _handle(self, session, packet_type, flags, body):
+        """Process one packet; False closes the connection"""
+        writer = session.writer
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = read_string(body, 0)
+            if qos:
+                writer.write(bytes([PUBACK << 4, 2]) + body[offset:offset + 2])
+                offset += 2
+            self._route(topic.decode('utf-8'), body[offset:])
+        elif packet_type == CONNECT:
+            _, offset = read_string(body, 0)                   # protocol name
+            client_id, _ = read_string(body, offset + 4)       # after level, flags, keepalive
+            session.client_id = client_id.decode('utf-8', 'replace')
+            writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                topic_filter, offset = read_string(body, offset)
+                offset += 1  # requested QoS; everything is delivered at 0
+                session.filters.add(topic_filter.decode('utf-8'))
+                granted.append(0)
+            self.routes.clear()
+            writer.write(bytes([SUBACK << 4]) + encode_length(2 + len(granted)) + packet_id + granted)
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = read_string(body, offset)
+                session.filters.discard(topic_filter.decode('utf-8'))
+            self.routes.clear()
+            writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+        elif packet_type == PINGREQ:
+            writer.write(bytes([PINGRESP << 4, 0]))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _route(self, topic, payload):
+        self.messages_in += 1
+        sessions = self.routes.get(topic)
+        if sessions is None:
+            sessions = self.routes[topic] = [
+                session for session in self.sessions
+                if any(topic_matches(topic_filter, topic) for topic_filter in session.filters)
+            ]
+        if not sessions:
+            return
+        topic_bytes = topic.encode('utf-8')
+        body = struct.pack('!H', len(topic_bytes)) + topic_bytes + payload
+        packet = bytes([PUBLISH << 4]) + encode_length(len(body)) + body
+        for session in sessions:
+            session.writer.write(packet)
+            self.messages_out += 1
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Minimal local MQTT broker")
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+    broker = MiniBroker('0.0.0.0', args.port)
+    broker.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,130 @@
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+import msgpack
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Same short keys as PAYLOAD_FIELD_CODES in app.py
+FIELD_CODES = {
+    'd': 'device_id',
+    'ts': 'timestamp',
+    'T': 'temperature',
+    'M': 'moisture',
+    'W': 'water_level',
+    'v': 'value',
+    'a': 'action',
+    's': 'status',
+}
+SHORT_KEYS = {name: code for code, name in FIELD_CODES.items()}
+
+
+def sample_readings(count, seed=1):
+    """Readings shaped like the ones Fake_sensor.py and pump_sim.py send"""
+    rng = random.Random(seed)
+    now = time.time()
+    readings = []
+    for i in range(count):
+        if i % 4 == 3:
+            reading = {
+                'device_id': f"PUMP_{rng.randint(1000, 9999)}",
+                'water_level': round(rng.uniform(5, 95), 1)
+            }
+        else:
+            reading = {
+                'device_id': f"Sensor32_{rng.randint(10000, 99999)}",
+                'temperature': round(rng.uniform(20, 30), 1),
+                'moisture': round(rng.uniform(30, 70), 1)
+            }
+        reading['timestamp'] = now - rng.uniform(0, 3600)
+        readings.append(reading)
+    return readings
+
+
+def encode_json(reading):
+    data = dict(reading)
+    data['timestamp'] = datetime.fromtimestamp(reading['timestamp']).isoformat()
+    return json.dumps(data).encode()
+
+
+def compact_fields(reading):
+    data = {SHORT_KEYS[key]: value for key, value in reading.items()}
+    data['ts'] = int(reading['timestamp'])
+    return data
+
+
+def encode_msgpack(reading):
+    return msgpack.packb(compact_fields(reading))
+
+
+def encode_cbor(reading):
+    return cbor2.dumps(compact_fields(reading))
+
+
+def expand(data):
+    """What app.py does after unpacking a compact payload (the timestamp stays epoch seconds)"""
+    return {FIELD_CODES.get(key, key): value for key, value in data.items()}
+
+
+def decode_json(payload):
+    return json.loads(payload)
+
+
+def decode_msgpack(payload):
+    return expand(msgpack.unpackb(payload))
+
+
+def decode_cbor(payload):
+    return expand(cbor2.loads(payload))
+
+
+def measure(name, encode, decode, readings, rounds):
+    payloads = [encode(reading) for reading in readings]
+    total_bytes = sum(len(payload) for payload in payloads)
+
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for payload in payloads:
+            decode(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'format': name,
+        'avg_bytes': total_bytes / len(payloads),
+        'decode_us': best / len(payloads) * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON and compact binary sensor payloads')
+    parser.add_argument('--count', type=int, default=20000, help='payloads per format')
+    parser.add_argument('--rounds', type=int, default=5, help='decode passes, best one is reported')
+    args = parser.parse_args()
+
+    readings = sample_readings(args.count)
+    formats = [('json', encode_json, decode_json), ('msgpack', encode_msgpack, decode_msgpack)]
+    if cbor2 is not None:
+        formats.append(('cbor', encode_cbor, decode_cbor))
+
+    results = [measure(name, encode, decode, readings, args.rounds) for name, encode, decode in formats]
+    baseline = results[0]
+
+    print(f"{'format':<10}{'avg bytes':>12}{'vs json':>10}{'decode us':>12}{'vs json':>10}")
+    for result in results:
+        print(f"{result['format']:<10}"
+              f"{result['avg_bytes']:>12.1f}"
+              f"{result['avg_bytes'] / baseline['avg_bytes']:>9.0%} "
+              f"{result['decode_us']:>12.2f}"
+              f"{result['decode_us'] / baseline['decode_us']:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 import paho.mqtt.client as mqtt
+import argparse
 import json
+import math
+import queue
 import time
 import random
 import threading
 import logging
+from collections import deque
 from datetime import datetime
 
+import numpy as np
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
@@ -57,7 +63,7 @@ class PumpSimulator:
         """Handle connection to MQTT broker"""
         if rc == 0:
             self.is_connected = True
-            logging.info(f"Connected to MQTT broker")
+            logging.info("Connected to MQTT broker")
             
             # Subscribe to topics
             topics = [
@@ -223,10 +229,271 @@ class PumpSimulator:
             self.client.disconnect()
             raise
 
+class VirtualClock:
+    """Simulation time running `speed` times faster than real time from `epoch`.
+
+    Uses the same formula as ScaledClock in app.py, so a server started with
+    CLOCK_SPEED and CLOCK_EPOCH equal to --speed and --epoch agrees with the
+    fleet on the time without any messages between them.
+    """
+    def __init__(self, speed=1, epoch=None):
+        self.speed = speed
+        self.epoch = epoch if epoch is not None else time.time()
+
+    def time(self):
+        return self.epoch + (time.time() - self.epoch) * self.speed
+
+    def sleep_until(self, virtual_time):
+        delay = self.epoch + (virtual_time - self.epoch) / self.speed - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+RECENT_COMMANDS = 1000  # command keys remembered to drop the copy on the other control topic
+
+
+def parse_range(text):
+    """'80:150' -> (80.0, 150.0); a single number is a fixed value"""
+    low, _, high = text.partition(':')
+    return float(low), float(high or low)
+
+
+class PumpFleet:
+    """Hundreds of simulated pumps stepped together on a virtual clock.
+
+    Tank levels live in numpy arrays and advance in fixed steps of `dt`
+    virtual seconds: inflow always fills the tank, the pump drains it at its
+    outflow rate while running. Every pump gets its geometry, flow rates and
+    starting level from a seeded generator, so a run is reproducible apart
+    from when the server's commands arrive. Commands are applied at the next
+    step boundary. A reading (distance from the sensor to the water, as
+    PumpSimulator reports it) is published when it moved by at least the
+    deadband since the last one.
+    """
+    def __init__(self, pumps, clock, seed=1, dt=1.0, tank_height=(80, 150), diameter=(40, 80),
+                 rectangular_share=0.3, side=(40, 80), inflow=(2, 6), outflow=(10, 25),
+                 noise=0.1, deadband=0.5, broker="broker.hivemq.com", port=1883, qos=1):
+        self.clock = clock
+        self.dt = dt
+        self.noise = noise
+        self.deadband = deadband
+        self.qos = qos
+        self.rng = np.random.default_rng(seed)
+        self.pump_ids = [f"PUMP_{seed:02d}{index:04d}" for index in range(pumps)]
+        self.index = {pump_id: index for index, pump_id in enumerate(self.pump_ids)}
+
+        # Tank geometry in cm; area is the water surface in cm^2
+        self.height = self.rng.uniform(*tank_height, pumps)
+        rectangular = self.rng.random(pumps) < rectangular_share
+        self.shape = np.where(rectangular, 'rectangular', 'cylindrical')
+        self.length = np.where(rectangular, self.rng.uniform(*side, pumps), 0.0)
+        self.width = np.where(rectangular, self.rng.uniform(*side, pumps), 0.0)
+        self.diameter = np.where(rectangular, 0.0, self.rng.uniform(*diameter, pumps))
+        self.area = np.where(rectangular, self.length * self.width, math.pi * (self.diameter / 2) ** 2)
+
+        # Flow rates come in as L/min and are kept in cm^3/s
+        self.inflow = self.rng.uniform(*inflow, pumps) * 1000 / 60
+        self.outflow = self.rng.uniform(*outflow, pumps) * 1000 / 60
+
+        self.level = self.height * self.rng.uniform(0.3, 0.7, pumps)
+        self.running = np.zeros(pumps, dtype=bool)
+        self.last_reported = np.full(pumps, np.nan)
+
+        # Soak-test counters, virtual seconds
+        self.on_seconds = np.zeros(pumps)
+        self.dry_seconds = np.zeros(pumps)       # running with an empty tank: an auto-off came too late
+        self.overflow_seconds = np.zeros(pumps)  # full tank while stopped
+        self.starts = np.zeros(pumps, dtype=np.int64)
+        self.commands = 0
+        self.published = 0
+        self.max_lag = 0.0
+
+        self.pending_commands = queue.Queue()
+        # The server sends some commands to both control topics; the copy is
+        # recognised by (device_id, command, timestamp) and counted once
+        self.recent_commands = set()
+        self.recent_order = deque()
+        self.connected = threading.Event()
+        self.client = mqtt.Client(f"pump-fleet-{seed}", clean_session=True)
+        self.client.max_inflight_messages_set(1000)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.broker = broker
+        self.port = port
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logging.error(f"Connection failed with code {rc}")
+            return
+        client.subscribe([('mynode/pump_control', 1), ('mynode/+/control', 1)])
+        self.connected.set()
+
+    def on_message(self, client, userdata, msg):
+        # paho thread: queue the command, it is applied at the next step
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(payload, dict) or payload.get('device_id') not in self.index:
+            return
+        key = (payload['device_id'], payload.get('command'), payload.get('timestamp'))
+        if key in self.recent_commands:
+            return
+        self.recent_commands.add(key)
+        self.recent_order.append(key)
+        if len(self.recent_order) > RECENT_COMMANDS:
+            self.recent_commands.discard(self.recent_order.popleft())
+        self.pending_commands.put((payload['device_id'], payload.get('command')))
+
+    def publish(self, topic, message):
+        self.client.publish(topic, json.dumps(message), qos=self.qos)
+        self.published += 1
+
+    def timestamp(self, virtual_time):
+        return datetime.fromtimestamp(virtual_time).isoformat()
+
+    def send_auth_requests(self, virtual_time):
+        for pump_id in self.pump_ids:
+            self.publish("mynode/pump_auth", {
+                "device_id": pump_id,
+                "status": "new",
+                "timestamp": self.timestamp(virtual_time)
+            })
+
+    def apply_commands(self, virtual_time):
+        while True:
+            try:
+                pump_id, command = self.pending_commands.get_nowait()
+            except queue.Empty:
+                return
+            if command not in ('on', 'off'):
+                continue
+            self.commands += 1
+            index = self.index[pump_id]
+            running = command == 'on'
+            if running == self.running[index]:
+                continue
+            self.running[index] = running
+            self.starts[index] += running
+            self.publish("mynode/pump_status", {
+                "device_id": pump_id,
+                "status": command,
+                "is_running": running,
+                "timestamp": self.timestamp(virtual_time)
+            })
+            self.last_reported[index] = np.nan  # report the level right away
+
+    def step(self, virtual_time):
+        dt = self.dt
+        flow = self.inflow - self.outflow * self.running
+        self.level = np.clip(self.level + flow * dt / self.area, 0, self.height)
+        self.on_seconds += self.running * dt
+        self.dry_seconds += (self.running & (self.level <= 0)) * dt
+        self.overflow_seconds += (~self.running & (self.level >= self.height)) * dt
+
+        distance = np.clip(self.height - self.level + self.rng.normal(0, self.noise, len(self.level)),
+                           0, self.height).round(2)
+        due = ~(np.abs(distance - self.last_reported) < self.deadband)  # NaN means never reported
+        if not due.any():
+            return
+        timestamp = self.timestamp(virtual_time)
+        for index in np.flatnonzero(due):
+            reading = float(distance[index])
+            self.publish("mynode/water_level", {
+                "device_id": self.pump_ids[index],
+                "water_level": reading,
+                "value": reading,
+                "reading": reading,
+                "is_running": bool(self.running[index]),
+                "timestamp": timestamp
+            })
+        self.last_reported[due] = distance[due]
+
+    def run(self, duration):
+        """Simulate `duration` virtual seconds, paced to the clock; returns the summary"""
+        self.client.connect(self.broker, self.port, 60)
+        self.client.loop_start()
+        if not self.connected.wait(30):
+            raise RuntimeError(f"Could not connect to {self.broker}:{self.port}")
+
+        started_real = time.time()
+        virtual_time = start = self.clock.time()
+        self.send_auth_requests(virtual_time)
+        logging.info(f"Simulating {len(self.pump_ids)} pumps for {duration / 3600:.1f} virtual hours "
+                     f"at {self.clock.speed}x")
+        next_progress = start + 3600
+        try:
+            while virtual_time < start + duration:
+                self.apply_commands(virtual_time)
+                self.step(virtual_time)
+                virtual_time += self.dt
+                self.max_lag = max(self.max_lag, self.clock.time() - virtual_time)
+                if virtual_time >= next_progress:
+                    next_progress += 3600
+                    logging.info(f"[{self.timestamp(virtual_time)}] {int(self.running.sum())} running, "
+                                 f"{self.published} messages, {self.commands} commands")
+                self.clock.sleep_until(virtual_time)
+        except KeyboardInterrupt:
+            logging.info("Stopping fleet simulation")
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+        return self.summary(virtual_time - start, time.time() - started_real)
+
+    def summary(self, virtual_seconds, real_seconds):
+        worst = np.argsort(-self.dry_seconds)[:5]
+        return {
+            'pumps': len(self.pump_ids),
+            'virtual_hours': round(virtual_seconds / 3600, 2),
+            'real_seconds': round(real_seconds, 1),
+            'achieved_speed': round(virtual_seconds / real_seconds, 1) if real_seconds else None,
+            'max_lag_virtual_s': round(self.max_lag, 1),
+            'messages_published': self.published,
+            'commands_received': self.commands,
+            'pump_starts': int(self.starts.sum()),
+            'pump_hours': round(float(self.on_seconds.sum()) / 3600, 2),
+            'dry_run_seconds': round(float(self.dry_seconds.sum()), 1),
+            'overflow_seconds': round(float(self.overflow_seconds.sum()), 1),
+            'worst_dry_runs': {self.pump_ids[index]: round(float(self.dry_seconds[index]), 1)
+                               for index in worst if self.dry_seconds[index] > 0}
+        }
+
+
 def main():
-    """Main function to run a single pump simulator"""
+    """Run a single pump simulator, or a fleet on a virtual clock with --pumps"""
+    parser = argparse.ArgumentParser(description="Pump simulator")
+    parser.add_argument('--pumps', type=int, default=0, help='simulate a fleet of this many pumps')
+    parser.add_argument('--speed', type=float, default=100, help='virtual seconds per real second (fleet)')
+    parser.add_argument('--epoch', type=float, default=None,
+                        help="epoch seconds the virtual clock starts from; use the server's CLOCK_EPOCH")
+    parser.add_argument('--hours', type=float, default=24, help='virtual hours to simulate')
+    parser.add_argument('--dt', type=float, default=1.0, help='simulation step in virtual seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tank-height', type=parse_range, default='80:150', help='cm, min:max')
+    parser.add_argument('--diameter', type=parse_range, default='40:80', help='cylindrical tanks, cm')
+    parser.add_argument('--side', type=parse_range, default='40:80', help='rectangular tank length/width, cm')
+    parser.add_argument('--rectangular-share', type=float, default=0.3)
+    parser.add_argument('--inflow', type=parse_range, default='2:6', help='L/min filling every tank')
+    parser.add_argument('--outflow', type=parse_range, default='10:25', help='L/min drained while pumping')
+    parser.add_argument('--noise', type=float, default=0.1, help='sensor noise standard deviation, cm')
+    parser.add_argument('--deadband', type=float, default=0.5, help='cm of change before a reading is sent')
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=1)
+    parser.add_argument('--broker', default='broker.hivemq.com')
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+
     try:
-        pump = PumpSimulator()
+        if args.pumps:
+            fleet = PumpFleet(
+                args.pumps, VirtualClock(args.speed, args.epoch), seed=args.seed, dt=args.dt,
+                tank_height=args.tank_height, diameter=args.diameter,
+                rectangular_share=args.rectangular_share, side=args.side,
+                inflow=args.inflow, outflow=args.outflow, noise=args.noise, deadband=args.deadband,
+                broker=args.broker, port=args.port, qos=args.qos
+            )
+            print(json.dumps(fleet.run(args.hours * 3600), indent=2))
+            return
+        pump = PumpSimulator(broker=args.broker, port=args.port)
         pump.run()
     except KeyboardInterrupt:
         logging.info("Shutting down...")
@@ -0,0 +1,326 @@
+"""
+Swarm of virtual ESP32 sensors for load-testing the server.
+
+Thousands of sensors run as asyncio tasks in one process and walk the same
+AUTH -> GET_SLEEP -> PUBLISH -> WAIT_ACK -> SLEEP cycle as Fake_sensor.py,
+but share a small pool of broker connections instead of one paho client and
+one thread each. Every sensor draws its readings and wake-time jitter from
+its own random.Random seeded from --seed and its index, so two runs with the
+same arguments send the same traffic.
+
+    python sensor_swarm.py --sensors 10000 --connections 8 --duration 600 --report swarm.csv
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import random
+import statistics
+import time
+from datetime import datetime
+
+import msgpack
+import paho.mqtt.client as mqtt
+
+from Fake_sensor import State
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+TOPIC_TELEMETRY = "mynode/telemetry"
+TOPIC_AUTH = "mynode/auth"
+TOPIC_ACK = "mynode/ack"
+TOPIC_SLEEP = "mynode/default/config/sleep"
+
+# Firmware timeouts, in seconds (same as Fake_sensor.py)
+AUTH_RETRY = 5
+SLEEP_RETRY = 5
+SLEEP_GIVE_UP = 30
+ACK_TIMEOUT = 10
+CYCLE_TIMEOUT = 120
+
+
+class BrokerPool:
+    """A few shared paho connections for the whole swarm.
+
+    Publishes are spread round-robin over the connections. Only the first
+    connection subscribes to the reply topics, so every server reply arrives
+    once and is handed to the sensor it names on the asyncio loop.
+    """
+    def __init__(self, broker, port, connections, client_prefix):
+        self.broker = broker
+        self.port = port
+        self.clients = [mqtt.Client(client_id=f"{client_prefix}-{n}", clean_session=True)
+                        for n in range(connections)]
+        self.next_client = 0
+        self.sensors = {}
+        self.loop = None
+        self.connected = None
+        self.published = 0
+        self.failed = 0
+
+    async def connect(self):
+        self.loop = asyncio.get_running_loop()
+        self.connected = asyncio.Event()
+        listener = self.clients[0]
+        listener.on_connect = self.on_connect
+        listener.on_message = self.on_message
+        for client in self.clients:
+            client.connect(self.broker, self.port, 60)
+            client.loop_start()
+        logging.info(f"[MQTT] Opening {len(self.clients)} connections to {self.broker}:{self.port}")
+        await self.connected.wait()
+
+    def close(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logging.error(f"[MQTT] Connection failed with code {rc}")
+            return
+        client.subscribe([(TOPIC_AUTH, 0), (TOPIC_ACK, 0), (TOPIC_SLEEP, 0)])
+        self.loop.call_soon_threadsafe(self.connected.set)
+
+    def on_message(self, client, userdata, msg):
+        # paho network thread: parse here, deliver on the event loop
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(payload, dict):
+            return
+        sensor = self.sensors.get(payload.get('device_id'))
+        if sensor is not None:
+            self.loop.call_soon_threadsafe(sensor.on_reply, msg.topic, payload)
+
+    def publish(self, topic, payload):
+        client = self.clients[self.next_client]
+        self.next_client = (self.next_client + 1) % len(self.clients)
+        if client.publish(topic, payload).rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published += 1
+            return True
+        self.failed += 1
+        return False
+
+
+class VirtualSensor:
+    """One simulated ESP32 node; its state machine runs as a coroutine"""
+    def __init__(self, device_id, pool, seed, jitter, payload_format='json'):
+        self.device_id = device_id
+        self.pool = pool
+        self.random = random.Random(seed)
+        self.jitter = jitter
+        self.payload_format = payload_format
+        self.sleep_duration = 30
+        self.current_state = State.STATE_INIT
+        self.replies = {}
+
+        # Per-device measurements, seconds
+        self.cycles = []
+        self.ack_latencies = []
+        self.timeouts = 0
+
+    def set_state(self, new_state):
+        self.current_state = new_state
+        logging.debug(f"[STATE] {self.device_id} changed to state: {new_state.value}")
+
+    def on_reply(self, topic, payload):
+        # Auth and sleep requests come back on the same topics; only replies carry these fields
+        if topic == TOPIC_AUTH and payload.get('status') != 'approved':
+            return
+        if topic == TOPIC_SLEEP and 'sleep_time' not in payload:
+            return
+        if topic == TOPIC_ACK and payload.get('status') != 'received':
+            return
+        waiter = self.replies.get(topic)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(payload)
+
+    async def request(self, topic, payload, retry, give_up):
+        """Publish and wait for the reply, re-sending every `retry` seconds; None after `give_up`"""
+        waiter = self.replies[topic] = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + give_up
+        try:
+            while True:
+                self.pool.publish(topic, payload)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    return await asyncio.wait_for(asyncio.shield(waiter), min(retry, remaining))
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            del self.replies[topic]
+
+    def generate_sensor_data(self):
+        temperature = round(self.random.uniform(20, 30), 1)
+        humidity = round(self.random.uniform(30, 70), 1)
+        return temperature, humidity
+
+    def telemetry_payload(self):
+        temperature, humidity = self.generate_sensor_data()
+        if self.payload_format == 'msgpack':
+            return TOPIC_TELEMETRY + '/mp', msgpack.packb({
+                'd': self.device_id,
+                'T': temperature,
+                'M': humidity,
+                'ts': int(time.time())
+            })
+        return TOPIC_TELEMETRY, json.dumps({
+            'device_id': self.device_id,
+            'temperature': temperature,
+            'moisture': humidity,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    async def cycle(self):
+        """One wake-up: AUTH -> GET_SLEEP -> PUBLISH -> WAIT_ACK; False if it timed out"""
+        self.set_state(State.STATE_AUTH)
+        auth = json.dumps({'device_id': self.device_id, 'action': 'auth_request'})
+        if await self.request(TOPIC_AUTH, auth, AUTH_RETRY, CYCLE_TIMEOUT) is None:
+            return False
+
+        self.set_state(State.STATE_GET_SLEEP)
+        sleep_request = json.dumps({'device_id': self.device_id, 'action': 'get_sleep_time'})
+        reply = await self.request(TOPIC_SLEEP, sleep_request, SLEEP_RETRY, SLEEP_GIVE_UP)
+        if reply is not None:
+            self.sleep_duration = int(reply['sleep_time'])
+        else:
+            logging.debug(f"[SLEEP] {self.device_id}: no sleep time received, using default")
+
+        self.set_state(State.STATE_PUBLISH)
+        topic, payload = self.telemetry_payload()
+        waiter = self.replies[TOPIC_ACK] = asyncio.get_running_loop().create_future()
+        sent_at = time.monotonic()
+        try:
+            if not self.pool.publish(topic, payload):
+                return False
+            self.set_state(State.STATE_WAIT_ACK)
+            await asyncio.wait_for(waiter, ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            del self.replies[TOPIC_ACK]
+        self.ack_latencies.append(time.monotonic() - sent_at)
+        return True
+
+    async def run(self, first_wake, stop_at):
+        await asyncio.sleep(first_wake)
+        while time.monotonic() < stop_at:
+            started = time.monotonic()
+            if await self.cycle():
+                self.cycles.append(time.monotonic() - started)
+            else:
+                self.timeouts += 1
+            self.set_state(State.STATE_SLEEP)
+            # Real nodes drift: each sleep is off by up to +-jitter of its length
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(max(0.0, self.sleep_duration * factor))
+
+
+def percentiles(values):
+    if not values:
+        return {'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    if len(values) == 1:
+        p50 = p99 = values[0]
+    else:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        p50, p99 = cuts[49], cuts[98]
+    return {
+        'p50_ms': round(p50 * 1000, 1),
+        'p99_ms': round(p99 * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1)
+    }
+
+
+def write_report(path, sensors):
+    with open(path, 'w', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(['device_id', 'cycles', 'timeouts', 'sleep_s',
+                         'cycle_p50_ms', 'cycle_max_ms', 'ack_p50_ms', 'ack_max_ms'])
+        for sensor in sensors:
+            cycle = percentiles(sensor.cycles)
+            ack = percentiles(sensor.ack_latencies)
+            writer.writerow([sensor.device_id, len(sensor.cycles), sensor.timeouts, sensor.sleep_duration,
+                             cycle['p50_ms'], cycle['max_ms'], ack['p50_ms'], ack['max_ms']])
+
+
+async def run_swarm(args):
+    pool = BrokerPool(args.broker, args.port, args.connections, f"swarm-{args.seed}")
+    await pool.connect()
+
+    sensors = []
+    for index in range(args.sensors):
+        sensor = VirtualSensor(f"Sensor32_SW{args.seed:02d}{index:05d}", pool,
+                               seed=f"{args.seed}:{index}", jitter=args.jitter,
+                               payload_format=args.format)
+        pool.sensors[sensor.device_id] = sensor
+        sensors.append(sensor)
+
+    # Spread the first wake-ups over the ramp so the server sees a steady
+    # rate rather than every node booting in the same instant
+    ramp = random.Random(args.seed)
+    stop_at = time.monotonic() + args.duration
+    logging.info(f"[SWARM] Starting {len(sensors)} sensors over {args.ramp}s for {args.duration}s")
+    tasks = [asyncio.create_task(sensor.run(ramp.uniform(0, args.ramp), stop_at)) for sensor in sensors]
+
+    started = time.monotonic()
+    try:
+        while time.monotonic() < stop_at:
+            await asyncio.sleep(min(10, max(0.0, stop_at - time.monotonic())))
+            done = sum(len(sensor.cycles) for sensor in sensors)
+            timeouts = sum(sensor.timeouts for sensor in sensors)
+            logging.info(f"[SWARM] {done} cycles, {timeouts} timeouts, {pool.published} messages published "
+                         f"({pool.published / (time.monotonic() - started):.1f}/s)")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pool.close()
+
+    summary = {
+        'sensors': len(sensors),
+        'connections': args.connections,
+        'duration_s': args.duration,
+        'cycles': sum(len(sensor.cycles) for sensor in sensors),
+        'timeouts': sum(sensor.timeouts for sensor in sensors),
+        'messages_published': pool.published,
+        'publish_failures': pool.failed,
+        'cycle_time': percentiles([t for sensor in sensors for t in sensor.cycles]),
+        'ack_latency': percentiles([t for sensor in sensors for t in sensor.ack_latencies])
+    }
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        write_report(args.report, sensors)
+        logging.info(f"[SWARM] Per-device cycle times written to {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=1000, help='number of virtual sensors')
+    parser.add_argument('--connections', type=int, default=8, help='broker connections shared by the swarm')
+    parser.add_argument('--seed', type=int, default=1, help='seed for device ids, readings and jitter')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help='wake-time jitter as a fraction of the sleep duration')
+    parser.add_argument('--ramp', type=float, default=30, help='seconds over which sensors first wake up')
+    parser.add_argument('--duration', type=float, default=300, help='seconds to run')
+    parser.add_argument('--format', choices=['json', 'msgpack'], default='json', help='telemetry payload format')
+    parser.add_argument('--broker', default='broker.hivemq.com')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--report', help='CSV file for per-device cycle and ack times')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_swarm(args))
+    except KeyboardInterrupt:
+        logging.info("Shutting down swarm...")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,51 @@
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
 import json
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+import click
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, make_response
+from flask.helpers import get_debug_flag
 from flask_mqtt import Mqtt
 from flask_socketio import SocketIO
 from flask_bootstrap import Bootstrap
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.serving import is_running_from_reloader
 import os
+import shutil
+from urllib.parse import quote, unquote
 from datetime import datetime
 import sqlite3
 import threading
-import schedule
+import queue
+import itertools
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import contextmanager
+from collections import deque, namedtuple
+import atexit
+import signal
+import gzip
+import struct
+import zlib
+from functools import wraps
+import heapq
 import time as time_module
-from datetime import datetime, timedelta
+from bisect import bisect_left, bisect_right
+import numpy as np
+import msgpack
+try:
+    import brotli
+except ImportError:  # optional, responses fall back to gzip
+    brotli = None
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional, old readings then stay in SQLite
+    pa = pc = pq = None
+from datetime import datetime, timedelta, timezone
 
 
 app = Flask(__name__)
@@ -27,125 +58,516 @@ app.config['MQTT_PASSWORD'] = ''
 app.config['MQTT_KEEPALIVE'] = 5
 app.config['MQTT_TLS_ENABLED'] = False
 app.config['DATABASE'] = 'sensor_data.db'
+app.config['SQLITE_POOL_SIZE'] = 8           # idle connections kept open
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'   # safe with WAL, avoids an fsync per commit
+app.config['SQLITE_CACHE_SIZE'] = -16000      # negative means KiB, i.e. 16 MB per connection
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['SQLITE_BUSY_TIMEOUT'] = 5000      # ms
+app.config['INGEST_BATCH_SIZE'] = 500         # readings per write transaction
+app.config['INGEST_FLUSH_INTERVAL'] = 0.5     # max seconds a reading waits in the buffer
+app.config['RETENTION_DAYS'] = {              # age in days after which rows are purged; None keeps them
+    'sensor_readings': 30,
+    'rule_actions': 180,
+    'sensor_rollups': {'1m': 90, '1h': 730, '1d': None}
+}
+app.config['ARCHIVE_DIR'] = 'archive'         # Parquet cold storage, needs pyarrow
+app.config['ARCHIVE_AFTER_DAYS'] = 14         # readings older than this move to the archive; None disables
+app.config['ARCHIVE_COMPRESSION'] = 'zstd'
+app.config['PURGE_INTERVAL'] = 3600           # seconds between retention passes
+app.config['PURGE_CHUNK_SIZE'] = 2000         # rows deleted per write transaction
+app.config['PURGE_PAUSE'] = 0.05              # seconds between chunks so other writers get the lock
+app.config['VACUUM_CHUNK_PAGES'] = 500        # pages returned to the OS per incremental vacuum step
+app.config['ROLLUP_MAX_ROWS'] = 2000          # range queries pick the finest rollup under this
+app.config['READINGS_RAW_MAX_SPAN'] = 6 * 3600  # longer chart ranges are served from rollups
+app.config['READINGS_MAX_POINTS'] = 1000      # default points per series after downsampling
+app.config['MQTT_WORKER_LANES'] = {           # worker threads per class of MQTT handler
+    'auth': 1,
+    'telemetry': 4,
+    'pump': 2,
+    'config': 1
+}
+app.config['MQTT_LANE_QUEUE_SIZE'] = 1000     # messages waiting per worker before new ones are dropped
+app.config['BATCH_UPLOAD_MAX_READINGS'] = 500  # oldest readings per upload message, the rest wait for the next one
+app.config['TELEMETRY_DEDUP_WINDOW'] = 10      # seconds a reading is remembered to drop its copy on another topic
+app.config['CLOCK_SPEED'] = 1                 # >1 runs timers and schedules faster than real time (soak tests only)
+app.config['CLOCK_EPOCH'] = None              # epoch seconds the sped-up clock starts from; pass the same to pump_sim.py
+app.config['MQTT_CAPTURE_FILE'] = None        # append every received message here for `flask replay-capture`
+app.config['MQTT_CAPTURE_QUEUE_SIZE'] = 10000  # messages waiting for the capture writer before new ones are dropped
+app.config['LIVE_FRAME_INTERVAL'] = 0.25      # seconds between coalesced Socket.IO frames
+app.config['LIVE_FRAME_MAX_DELTAS'] = 5000    # readings carried per frame before the oldest are dropped
+app.config['COMPRESS_MIN_SIZE'] = 1024        # bytes; smaller JSON responses are sent uncompressed
+app.config['COMPRESS_LEVEL'] = 6              # gzip level (brotli uses quality 5)
+app.config['LOG_LEVEL'] = 'INFO'              # default level for every log category
+app.config['LOG_LEVELS'] = {}                 # per-category overrides, e.g. {'mqtt': 'DEBUG'}
+app.config['LOG_SAMPLE_RATE'] = 100           # keep 1 in N per-message DEBUG lines of each category
+app.config['LOG_JSON'] = False                # one JSON object per line instead of plain text
+app.config['HTTP_PORT'] = 5000
+app.config['BACKGROUND_SERVICES'] = True      # start ingest, timers and MQTT workers on import; False leaves it to the caller
+# Any setting can be overridden from the environment as FLASK_<NAME>, values
+# parsed as JSON, e.g. FLASK_DATABASE=/tmp/bench.db FLASK_MQTT_BROKER_PORT=1884
+app.config.from_prefixed_env()
 
 # Initialize extensions
 mqtt = Mqtt(app)
 socketio = SocketIO(app)
 bootstrap = Bootstrap(app)
 login_manager = LoginManager(app)
+
+
+# Logging
+# Categories: mqtt, sensor, rules, pump, scheduler, storage, auth, web.
+# Every category logs through a QueueHandler, so the message path only
+# enqueues a record; formatting and stdout I/O happen on the listener thread.
+class SamplingFilter(logging.Filter):
+    """Let through 1 in `rate` DEBUG records per logger; INFO and above always pass"""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        counter = self.counters.get(record.name)
+        if counter is None:
+            counter = self.counters.setdefault(record.name, itertools.count())
+        return next(counter) % self.rate == 0
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers"""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves the %-formatting to the listener thread"""
+    def prepare(self, record):
+        return record
+
+def setup_logging(config):
+    """Attach the queue handler to the 'server' logger and start the listener"""
+    output = logging.StreamHandler()
+    if config['LOG_JSON']:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+
+    log_queue = queue.Queue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config['LOG_SAMPLE_RATE']))
+
+    server_log = logging.getLogger('server')
+    server_log.handlers = [queue_handler]
+    server_log.setLevel(config['LOG_LEVEL'])
+    server_log.propagate = False
+    for category, level in config['LOG_LEVELS'].items():
+        logging.getLogger(f'server.{category}').setLevel(level)
+
+    listener = QueueListener(log_queue, output)
+    listener.start()
+    return listener
+
+log_listener = setup_logging(app.config)
+atexit.register(log_listener.stop)
+
+mqtt_log = logging.getLogger('server.mqtt')
+sensor_log = logging.getLogger('server.sensor')
+rules_log = logging.getLogger('server.rules')
+pump_log = logging.getLogger('server.pump')
+scheduler_log = logging.getLogger('server.scheduler')
+storage_log = logging.getLogger('server.storage')
+auth_log = logging.getLogger('server.auth')
+web_log = logging.getLogger('server.web')
 login_manager.login_view = 'login'
-db_lock = threading.Lock()
+db_lock = threading.RLock()  # single-writer discipline, see get_db(write=True)
 
 # Database Functions
-def get_db():
-    db = sqlite3.connect(app.config['DATABASE'])
-    db.row_factory = sqlite3.Row
-    return db
+class ConnectionPool:
+    """Long-lived SQLite connections shared by routes, MQTT handlers and workers.
 
-def init_db():
-    with app.app_context():
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
-            # Create tables
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL
-                )
-            ''')
+    Connections are opened once, configured for WAL so dashboard reads never
+    wait on the MQTT write path, and returned to the pool after each use.
+    Writers are serialized by write_lock instead of spinning on SQLITE_BUSY.
+    """
+    def __init__(self, database, write_lock, max_idle=8, synchronous='NORMAL',
+                 cache_size=-16000, mmap_size=256 * 1024 * 1024, busy_timeout=5000):
+        self.database = database
+        self.write_lock = write_lock
+        self.max_idle = max_idle
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.idle = []
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sensor_locations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT UNIQUE NOT NULL,
-                    location TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Lets the retention purger give freed pages back. Only takes effect
+        # while the file is still empty, so before WAL; see `flask compact-db`
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        return conn
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sensor_readings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
-                    sensor_type TEXT NOT NULL,
-                    value REAL NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def acquire(self):
+        try:
+            return self.idle.pop()
+        except IndexError:
+            return self._connect()
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS device_settings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT UNIQUE NOT NULL,
-                    sleep_duration INTEGER NOT NULL DEFAULT 30,
-                    last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if len(self.idle) < self.max_idle:
+            self.idle.append(conn)
+        else:
+            conn.close()
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS pumps (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    pump_id TEXT NOT NULL UNIQUE,
-                    name TEXT NOT NULL,
-                    location TEXT,
-                    tank_shape TEXT NOT NULL,
-                    tank_length REAL,
-                    tank_width REAL,
-                    tank_height REAL,
-                    tank_diameter REAL,
-                    status TEXT DEFAULT 'pending',
-                    last_reading REAL,
-                    last_update TIMESTAMP,
-                    is_running BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    @contextmanager
+    def connection(self, write=False):
+        """Borrow a connection; the block commits on success and rolls back on error"""
+        conn = self.acquire()
+        try:
+            if write:
+                with self.write_lock:
+                    with conn:
+                        yield conn
+            else:
+                with conn:
+                    yield conn
+        finally:
+            self.release(conn)
 
-            #Schduling record tables
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS schedules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    pump_id TEXT NOT NULL,
-                    schedule_date TEXT NOT NULL,
-                    schedule_time TEXT NOT NULL,
-                    duration INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (pump_id) REFERENCES pumps(pump_id)
-                )
-            ''')
+    def close_all(self):
+        while self.idle:
+            self.idle.pop().close()
 
 
-            #Tables for automation rules
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS pump_rules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    pump_id TEXT NOT NULL,
-                    sensor_id TEXT NOT NULL,
-                    threshold_value REAL NOT NULL,
-                    reading_type TEXT NOT NULL DEFAULT 'temperature',  -- Added comma here
-                    comparison_type TEXT NOT NULL,  -- 'above' or 'below'
-                    action TEXT NOT NULL,  -- 'on' or 'off'
-                    duration INTEGER NOT NULL,  -- duration in minutes
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (pump_id) REFERENCES pumps(pump_id),
-                    FOREIGN KEY (sensor_id) REFERENCES sensor_locations(device_id)
-                )
-            ''')
+db_pool = ConnectionPool(
+    app.config['DATABASE'],
+    write_lock=db_lock,
+    max_idle=app.config['SQLITE_POOL_SIZE'],
+    synchronous=app.config['SQLITE_SYNCHRONOUS'],
+    cache_size=app.config['SQLITE_CACHE_SIZE'],
+    mmap_size=app.config['SQLITE_MMAP_SIZE'],
+    busy_timeout=app.config['SQLITE_BUSY_TIMEOUT']
+)
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS rule_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    rule_id INTEGER NOT NULL,
-                    sensor_value REAL NOT NULL,
-                    action_taken TEXT NOT NULL,
-                    executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (rule_id) REFERENCES pump_rules(id)
-                )
-            ''')
+# Conditional GET
+class ResourceVersions:
+    """Write counters behind the ETags of the JSON APIs.
+
+    Every write bumps the resources it changes, e.g. 'pumps' and
+    'pump:PUMP_1'. An ETag is built from the versions of the resources a
+    view reads, so an unchanged ETag proves the response is unchanged
+    without running the view. The epoch keeps ETags from an earlier
+    process, whose counters started from the same zeros, from matching.
+    """
+    def __init__(self):
+        self.epoch = format(int(time_module.time()), 'x')
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def bump(self, *resources):
+        with self.lock:
+            for resource in resources:
+                self.versions[resource] = self.versions.get(resource, 0) + 1
+
+    def get(self, resource):
+        return self.versions.get(resource, 0)
+
+
+resource_versions = ResourceVersions()
+
+def touch_pump(pump_id):
+    """Bump the versions of everything served from a pump's row"""
+    resource_versions.bump('pumps', f'pump:{pump_id}')
+
+def conditional(*resources, vary_seconds=None):
+    """Serve a view with a strong ETag derived from resource versions.
+
+    Resource names may use the view arguments, e.g. 'pump:{pump_id}'. When
+    If-None-Match carries the current ETag the view is not called at all
+    and a 304 is returned. vary_seconds also changes the ETag every that
+    many seconds, for views whose result depends on the clock.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            parts = [resource_versions.epoch]
+            parts += [str(resource_versions.get(resource.format(**kwargs))) for resource in resources]
+            if vary_seconds:
+                parts.append(str(int(time_module.time() // vary_seconds)))
+            parts.append(format(zlib.crc32(request.full_path.encode()), 'x'))
+            etag = '.'.join(parts)
+
+            # Compressed responses carry the encoding in their ETag
+            for candidate in (etag, f'{etag}-gzip', f'{etag}-br'):
+                if request.if_none_match.contains(candidate):
+                    response = app.response_class(status=304)
+                    response.set_etag(candidate)
+                    response.vary.add('Accept-Encoding')
+                    return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+def get_db(write=False):
+    """Use as `with get_db() as conn:`; pass write=True for blocks that modify data"""
+    return db_pool.connection(write=write)
+
+def write_in_os_thread(conn, func, *args):
+    """Run func(conn, *args) and commit on eventlet's pool of native threads; returns its result.
+
+    eventlet.monkey_patch() makes every threading.Thread here a green
+    thread, and a sqlite3 call holds the one OS thread they share: while a
+    large write or an fsync runs, MQTT keepalives, Socket.IO and all other
+    workers wait. Bulk writes go through this instead. func may only use
+    conn (no green locks, queues or sockets); take get_db(write=True) in
+    the caller as usual.
+    """
+    def run():
+        result = func(conn, *args)
+        conn.commit()
+        return result
+    return tpool.execute(run)
+
+def create_schema(cursor):
+    """Create all tables and indexes (idempotent, also used on existing databases)"""
+    # Create tables
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_locations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT UNIQUE NOT NULL,
+            location TEXT NOT NULL,
+            name TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            sensor_type TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT UNIQUE NOT NULL,
+            sleep_duration INTEGER NOT NULL DEFAULT 30,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_batch_seq INTEGER NOT NULL DEFAULT 0  -- highest batch upload sequence stored
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pumps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pump_id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            location TEXT,
+            tank_shape TEXT NOT NULL,
+            tank_length REAL,
+            tank_width REAL,
+            tank_height REAL,
+            tank_diameter REAL,
+            status TEXT DEFAULT 'pending',
+            last_reading REAL,
+            last_update TIMESTAMP,
+            is_running BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    #Schduling record tables
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pump_id TEXT NOT NULL,
+            schedule_date TEXT NOT NULL,
+            schedule_time TEXT NOT NULL,
+            duration INTEGER NOT NULL,
+            recurrence TEXT NOT NULL DEFAULT 'once',  -- 'once', 'daily', 'weekdays' or 'hourly'
+            interval_hours INTEGER,  -- hours between 'hourly' runs
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (pump_id) REFERENCES pumps(pump_id)
+        )
+    ''')
+
+
+    #Tables for automation rules
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pump_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pump_id TEXT NOT NULL,
+            sensor_id TEXT NOT NULL,
+            threshold_value REAL NOT NULL,
+            reading_type TEXT NOT NULL DEFAULT 'temperature',  -- Added comma here
+            comparison_type TEXT NOT NULL,  -- 'above' or 'below'
+            action TEXT NOT NULL,  -- 'on' or 'off'
+            duration INTEGER NOT NULL,  -- duration in minutes
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (pump_id) REFERENCES pumps(pump_id),
+            FOREIGN KEY (sensor_id) REFERENCES sensor_locations(device_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rule_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER NOT NULL,
+            sensor_value REAL NOT NULL,
+            action_taken TEXT NOT NULL,
+            executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (rule_id) REFERENCES pump_rules(id)
+        )
+    ''')
+
+    # Pending automatic turn-offs, reloaded on startup so a restart cannot leave a pump running
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pump_timers (
+            pump_id TEXT PRIMARY KEY,
+            off_at REAL NOT NULL,  -- unix seconds
+            scheduled BOOLEAN NOT NULL DEFAULT FALSE,  -- started by a schedule rather than a rule
+            FOREIGN KEY (pump_id) REFERENCES pumps(pump_id)
+        )
+    ''')
+
+    # Pre-aggregated readings per device and type at 1m / 1h / 1d resolution
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_rollups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            sensor_type TEXT NOT NULL,
+            resolution TEXT NOT NULL,  -- '1m', '1h' or '1d'
+            bucket_start INTEGER NOT NULL,  -- unix seconds (UTC) at the start of the bucket
+            min_value REAL NOT NULL,
+            max_value REAL NOT NULL,
+            mean_value REAL NOT NULL,
+            count INTEGER NOT NULL,
+            last_value REAL NOT NULL,
+            last_timestamp DATETIME NOT NULL,
+            UNIQUE (device_id, sensor_type, resolution, bucket_start)
+        )
+    ''')
+
+    # Columns added after the first release
+    add_missing_columns(cursor, 'device_settings', {
+        'last_batch_seq': 'INTEGER NOT NULL DEFAULT 0'
+    })
+    add_missing_columns(cursor, 'schedules', {
+        'recurrence': "TEXT NOT NULL DEFAULT 'once'",
+        'interval_hours': 'INTEGER'
+    })
+
+    create_indexes(cursor)
+
+
+def add_missing_columns(cursor, table, columns):
+    """ALTER TABLE ... ADD COLUMN for every {name: definition} the table lacks"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def create_indexes(cursor):
+    """Secondary indexes for every query path; each is checked by `flask check-query-plans`"""
+    # Latest value per device and type (dashboard, sensor list, pump readings)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_type_time
+        ON sensor_readings (device_id, sensor_type, timestamp)
+    ''')
+    # Per-device history and latest reading of any type (discovery)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_time
+        ON sensor_readings (device_id, timestamp)
+    ''')
+    # Newest readings of one type across all devices
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_type_time
+        ON sensor_readings (sensor_type, timestamp)
+    ''')
+    # Newest readings across everything
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_time
+        ON sensor_readings (timestamp)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pump_rules_sensor_type_active
+        ON pump_rules (sensor_id, reading_type, is_active)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pump_rules_pump
+        ON pump_rules (pump_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_schedules_pump_date_time
+        ON schedules (pump_id, schedule_date, schedule_time)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_schedules_date_time
+        ON schedules (schedule_date, schedule_time)
+    ''')
+    # Recurring schedules are few; this keeps them out of the dated one-shot rows
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_schedules_recurring
+        ON schedules (pump_id) WHERE recurrence != 'once'
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rule_actions_rule_time
+        ON rule_actions (rule_id, executed_at)
+    ''')
+    # Retention purges by age
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rule_actions_time
+        ON rule_actions (executed_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_rollups_resolution_bucket
+        ON sensor_rollups (resolution, bucket_start)
+    ''')
+
+
+def init_db():
+    with app.app_context():
+        with get_db(write=True) as conn:
+            cursor = conn.cursor()
+            
+            # Create tables and indexes
+            create_schema(cursor)
 
             # Add default admin user if not exists
             cursor.execute('SELECT * FROM users WHERE username = ?', ('admin',))
@@ -186,6 +608,33 @@ def load_user(user_id):
     return None
 
 # Routes
+@app.after_request
+def compress_response(response):
+    """gzip (or brotli when installed) JSON responses above COMPRESS_MIN_SIZE"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']:
+        encoding, body = 'br', brotli.compress(data, quality=5)
+    elif request.accept_encodings['gzip']:
+        encoding, body = 'gzip', gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'])
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -229,31 +678,40 @@ def analytics():
 def sensor_management():
     return render_template('sensor_management.html')
 
+UNCLAIMED_DEVICES_SQL = '''
+    SELECT ds.device_id, ds.last_seen
+    FROM device_settings ds
+    LEFT JOIN sensor_locations sl ON ds.device_id = sl.device_id
+    WHERE sl.device_id IS NULL
+'''
+
+def get_unclaimed_sensors():
+    """Unclaimed sensors with their latest values, as shown on the discovery page"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(UNCLAIMED_DEVICES_SQL)
+        devices = cursor.fetchall()
+
+    # Latest values come from the in-memory cache, not sensor_readings
+    unclaimed_sensors = []
+    for device in devices:
+        temperature = latest_cache.get(device['device_id'], 'temperature')
+        moisture = latest_cache.get(device['device_id'], 'moisture')
+        unclaimed_sensors.append({
+            'device_id': device['device_id'],
+            'last_seen': device['last_seen'],
+            'temperature': temperature[0] if temperature else None,
+            'humidity': moisture[0] if moisture else None
+        })
+    return unclaimed_sensors
+
 @app.route('/discovery')
 @login_required
 def discovery():
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT ds.device_id, ds.last_seen,
-                       sr.sensor_type, sr.value, sr.timestamp
-                FROM device_settings ds
-                LEFT JOIN (
-                    SELECT device_id, MAX(timestamp) as max_time
-                    FROM sensor_readings
-                    GROUP BY device_id
-                ) latest ON ds.device_id = latest.device_id
-                LEFT JOIN sensor_readings sr ON latest.device_id = sr.device_id 
-                    AND latest.max_time = sr.timestamp
-                LEFT JOIN sensor_locations sl ON ds.device_id = sl.device_id
-                WHERE sl.device_id IS NULL
-                GROUP BY ds.device_id
-            ''')
-            unclaimed_sensors = cursor.fetchall()
-            return render_template('sensor_discovery.html', unclaimed_sensors=unclaimed_sensors)
+        return render_template('sensor_discovery.html', unclaimed_sensors=get_unclaimed_sensors())
     except Exception as e:
-        print(f"Error loading unclaimed sensors: {str(e)}")
+        web_log.error("Error loading unclaimed sensors: %s", e)
         flash('Error loading unclaimed sensors')
         return render_template('sensor_discovery.html', unclaimed_sensors=[])
     
@@ -284,7 +742,7 @@ def claim_sensor():
                 'message': 'Missing required fields'
             }), 400
         
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             # First check if sensor exists and is unclaimed
             cursor.execute('''
@@ -305,14 +763,18 @@ def claim_sensor():
                 VALUES (?, ?, ?)
             ''', (device_id, location, name))
             conn.commit()
-            
-            return jsonify({
-                'success': True, 
-                'message': 'Sensor claimed successfully'
-            })
+
+        latest_cache.invalidate(device_id)
+        resource_versions.bump('sensors')
+        publish_unclaimed_sensors()
+
+        return jsonify({
+            'success': True, 
+            'message': 'Sensor claimed successfully'
+        })
             
     except Exception as e:
-        print(f"Error claiming sensor: {str(e)}")
+        web_log.error("Error claiming sensor: %s", e)
         return jsonify({
             'success': False, 
             'message': f'Error claiming sensor: {str(e)}'
@@ -320,26 +782,86 @@ def claim_sensor():
 
 @app.route('/api/get-readings')
 @login_required
+@conditional('readings', 'sensors', vary_seconds=60)
 def get_readings():
+    """Latest readings, or a downsampled series per sensor type when a time range is given"""
     sensor_id = request.args.get('sensor', 'all')
-    readings = get_sensor_readings(sensor_id)
-    return jsonify({'success': True, 'readings': readings})
+    has_range = any(arg in request.args for arg in ('range', 'start', 'end'))
+
+    # The sensor list ('all') and legacy callers get the latest raw readings
+    if sensor_id == 'all' or not has_range:
+        readings = get_sensor_readings(sensor_id)
+        return jsonify({'success': True, 'readings': readings})
+
+    try:
+        start, end = parse_time_range(request.args)
+        max_points = request.args.get('max_points', app.config['READINGS_MAX_POINTS'], type=int)
+        max_points = max(3, min(max_points, 5000))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    resolution, series = get_reading_series(sensor_id, start, end, max_points)
+    return jsonify({
+        'success': True,
+        'sensor': sensor_id,
+        'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+        'resolution': resolution,
+        'series': series
+    })
+
 
+@app.route('/api/stats')
+@login_required
+def get_stats():
+    """Internal counters of the ingestion pipeline and caches"""
+    return jsonify({
+        'ingest_queue': {
+            'pending': ingest_queue.pending_count(),
+            'batch_size': ingest_queue.batch_size,
+            'flush_interval': ingest_queue.flush_interval
+        },
+        'latest_cache': latest_cache.stats(),
+        'rule_index': {
+            'active_rules': rule_index.rule_count,
+            'sensor_inputs': len(rule_index.index)
+        },
+        'mqtt': topic_router.get_stats(),
+        'timers': {
+            'pending': len(timer_service.timers),
+            'fired': timer_service.fired
+        },
+        'retention': retention_purger.stats(),
+        'archive': reading_archive.stats(),
+        'capture': message_capture.stats(),
+        'live_frames': live_broadcaster.stats(),
+        'state_events_sent': state_notifier.events_sent
+    })
+
+
+@app.route('/api/timers')
+@login_required
+def get_timers():
+    """Pending pump turn-offs and schedules on the timer service"""
+    return jsonify(timer_service.pending())
 
 
 # Autmation Rouets
+PUMP_RULES_SQL = '''
+    SELECT pr.*, sl.name as sensor_name, sl.location as sensor_location
+    FROM pump_rules pr
+    JOIN sensor_locations sl ON pr.sensor_id = sl.device_id
+    WHERE pr.pump_id = ?
+    ORDER BY pr.created_at DESC
+'''
+
 @app.route('/api/pump/<pump_id>/rules', methods=['GET'])
 @login_required
+@conditional('rules', 'sensors')
 def get_pump_rules(pump_id):
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT pr.*, sl.name as sensor_name, sl.location as sensor_location
-            FROM pump_rules pr
-            JOIN sensor_locations sl ON pr.sensor_id = sl.device_id
-            WHERE pr.pump_id = ?
-            ORDER BY pr.created_at DESC
-        ''', (pump_id,))
+        cursor.execute(PUMP_RULES_SQL, (pump_id,))
         rules = [dict(row) for row in cursor.fetchall()]
         return jsonify(rules)
 
@@ -357,7 +879,7 @@ def add_pump_rule(pump_id):
         return jsonify({'error': 'Invalid reading type'}), 400
 
     # Add the rule to database
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO pump_rules (
@@ -368,21 +890,28 @@ def add_pump_rule(pump_id):
               data['threshold_value'], data['comparison_type'],
               data['action'], data['duration']))
         conn.commit()
-        return jsonify({'success': True, 'id': cursor.lastrowid})
+        new_rule_id = cursor.lastrowid
+
+    rule_index.rebuild()
+    resource_versions.bump('rules')
+    return jsonify({'success': True, 'id': new_rule_id})
     
 @app.route('/api/pump/rule/<rule_id>', methods=['DELETE'])
 @login_required
 def delete_pump_rule(rule_id):
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM pump_rules WHERE id = ?', (rule_id,))
         conn.commit()
-        return jsonify({'success': True})
+
+    rule_index.rebuild()
+    resource_versions.bump('rules')
+    return jsonify({'success': True})
 
 @app.route('/api/pump/rule/<rule_id>/toggle', methods=['POST'])
 @login_required
 def toggle_rule(rule_id):
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE pump_rules 
@@ -390,26 +919,92 @@ def toggle_rule(rule_id):
             WHERE id = ?
         ''', (rule_id,))
         conn.commit()
-        return jsonify({'success': True})
+
+    rule_index.rebuild()
+    resource_versions.bump('rules')
+    return jsonify({'success': True})
+
+RULE_HISTORY_SQL = '''
+    SELECT ra.*, pr.sensor_id, pr.threshold_value, 
+            pr.comparison_type, sl.name as sensor_name
+    FROM rule_actions ra
+    JOIN pump_rules pr ON ra.rule_id = pr.id
+    JOIN sensor_locations sl ON pr.sensor_id = sl.device_id
+    WHERE pr.pump_id = ?
+    ORDER BY ra.executed_at DESC
+    LIMIT 50
+'''
 
 @app.route('/api/pump/<pump_id>/rule-history', methods=['GET'])
 @login_required
+@conditional('rule_actions', 'rules', 'sensors')
 def get_rule_history(pump_id):
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT ra.*, pr.sensor_id, pr.threshold_value, 
-                    pr.comparison_type, sl.name as sensor_name
-            FROM rule_actions ra
-            JOIN pump_rules pr ON ra.rule_id = pr.id
-            JOIN sensor_locations sl ON pr.sensor_id = sl.device_id
-            WHERE pr.pump_id = ?
-            ORDER BY ra.executed_at DESC
-            LIMIT 50
-        ''', (pump_id,))
+        cursor.execute(RULE_HISTORY_SQL, (pump_id,))
         history = [dict(row) for row in cursor.fetchall()]
         return jsonify(history)
 
+ACTIVE_RULES_SQL = '''
+    SELECT * FROM pump_rules
+    WHERE is_active = TRUE
+'''
+
+class RuleIndex:
+    """Active pump rules compiled for lookup by (sensor_id, reading_type).
+
+    Each key holds its 'above' and 'below' rules sorted by threshold, so the
+    rules a value triggers are found with one bisect per direction instead
+    of a query and a linear scan. rebuild() builds a complete new index and
+    swaps it in with a single assignment, so readers never see a partial one.
+    """
+    def __init__(self):
+        self.index = {}
+        self.rule_count = 0
+        self.rebuild_lock = threading.Lock()
+
+    def rebuild(self):
+        """Reload active rules from the database after they change"""
+        with self.rebuild_lock:
+            with get_db() as conn:
+                rows = conn.execute(ACTIVE_RULES_SQL).fetchall()
+
+            grouped = {}
+            for row in rows:
+                rule = dict(row)
+                rule['threshold_value'] = float(rule['threshold_value'])
+                above, below = grouped.setdefault((rule['sensor_id'], rule['reading_type']), ([], []))
+                (above if rule['comparison_type'] == 'above' else below).append(rule)
+
+            index = {}
+            for key, (above, below) in grouped.items():
+                above.sort(key=lambda rule: rule['threshold_value'])
+                below.sort(key=lambda rule: rule['threshold_value'])
+                index[key] = (
+                    [rule['threshold_value'] for rule in above], above,
+                    [rule['threshold_value'] for rule in below], below
+                )
+
+            self.index = index
+            self.rule_count = len(rows)
+        rules_log.info("Compiled %d active rules for %d sensor inputs", len(rows), len(index))
+
+    def match(self, sensor_id, reading_type, value):
+        """Rules triggered by a value, in rule id order"""
+        entry = self.index.get((sensor_id, reading_type))
+        if entry is None:
+            return []
+        above_thresholds, above, below_thresholds, below = entry
+        # 'above' triggers when value > threshold, 'below' when value < threshold
+        triggered = (above[:bisect_left(above_thresholds, value)]
+                     + below[bisect_right(below_thresholds, value):])
+        if len(triggered) > 1:
+            triggered.sort(key=lambda rule: rule['id'])
+        return triggered
+
+
+rule_index = RuleIndex()
+
 # Add function to check sensor readings against rules
 def check_pump_rules(sensor_id, reading_type, value):
     """
@@ -425,31 +1020,19 @@ def check_pump_rules(sensor_id, reading_type, value):
     reading_type: e.g., "water_level", "temperature", etc.
     value: Numeric sensor value.
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
+    # Only the rules whose threshold this value crosses; the database is
+    # touched only when at least one of them fires
+    rules = rule_index.match(sensor_id, reading_type, value)
+    if not rules:
+        return
 
-        # Find all active rules matching sensor_id, reading_type
-        cursor.execute('''
-            SELECT * FROM pump_rules
-            WHERE sensor_id = ?
-              AND reading_type = ?
-              AND is_active = TRUE
-        ''', (sensor_id, reading_type))
-        rules = cursor.fetchall()
+    switched = set()  # pumps whose is_running changed, pushed to open pages below
+    with get_db(write=True) as conn:
+        cursor = conn.cursor()
 
         for rule in rules:
-            # Determine if rule should trigger
-            if rule['comparison_type'] == 'above':
-                should_trigger = value > rule['threshold_value']
-            else:
-                should_trigger = value < rule['threshold_value']
-
-            if not should_trigger:
-                # If the condition isn't met, do nothing for this rule
-                continue
-
             # Rule triggered: log evaluation
-            print(f"[RULE TRIGGERED] Rule ID: {rule['id']} - Sensor ID: {sensor_id} - Value: {value}")
+            rules_log.info("Rule %s triggered by sensor %s, value %s", rule['id'], sensor_id, value)
 
             # ------------------------------------------------------------------
             # 1) Fetch the current pump status from DB
@@ -463,7 +1046,7 @@ def check_pump_rules(sensor_id, reading_type, value):
 
             # If pump not found or invalid, continue or handle as error
             if not pump_row:
-                print(f"[ERROR] Pump {rule['pump_id']} not found in DB.")
+                rules_log.error("Pump %s not found in DB", rule['pump_id'])
                 continue
 
             is_running = pump_row['is_running']  # Boolean: True/False
@@ -475,7 +1058,7 @@ def check_pump_rules(sensor_id, reading_type, value):
                 # Condition A: Pump already ON?
                 if is_running:
                     # Record error: pump is already ON, ignoring turn-on command
-                    print(f"[ERROR] Pump {rule['pump_id']} is already ON. Ignoring turn-on command.")
+                    rules_log.warning("Pump %s is already ON, ignoring turn-on command", rule['pump_id'])
                     cursor.execute('''
                         INSERT INTO rule_actions (rule_id, sensor_value, action_taken)
                         VALUES (?, ?, ?)
@@ -487,7 +1070,7 @@ def check_pump_rules(sensor_id, reading_type, value):
                 # (Assuming reading_type == "water_level" and we treat < 10 as <10%)
                 # Adjust the numeric threshold as needed for your logic.
                 if reading_type.lower() == 'water_level' and value < 10:
-                    print(f"[ERROR] Water level too low ({value}%). Ignoring turn-on command for pump {rule['pump_id']}.")
+                    rules_log.warning("Water level too low (%s%%), ignoring turn-on command for pump %s", value, rule['pump_id'])
                     cursor.execute('''
                         INSERT INTO rule_actions (rule_id, sensor_value, action_taken)
                         VALUES (?, ?, ?)
@@ -496,7 +1079,7 @@ def check_pump_rules(sensor_id, reading_type, value):
                     continue
 
                 # Otherwise, turn pump ON & schedule turn OFF if a duration is set
-                print(f"Turning ON pump {rule['pump_id']}")
+                rules_log.info("Turning ON pump %s", rule['pump_id'])
 
                 # Record the action
                 cursor.execute('''
@@ -511,7 +1094,18 @@ def check_pump_rules(sensor_id, reading_type, value):
                            last_update = CURRENT_TIMESTAMP
                      WHERE pump_id = ?
                 ''', (rule['pump_id'],))
+
+                # Schedule turn OFF after duration (in minutes)
+                # Only schedule if the duration > 0. If you prefer to always schedule, remove the check.
+                off_at = None
+                if rule['duration'] > 0:
+                    duration_seconds = rule['duration'] * 60
+                    off_at = schedule_pump_off(cursor, rule['pump_id'], duration_seconds)
+                    pump_log.info("Turn OFF scheduled for pump %s in %s seconds", rule['pump_id'], duration_seconds)
                 conn.commit()
+                if off_at is not None:
+                    arm_pump_off(rule['pump_id'], off_at)
+                switched.add(rule['pump_id'])
 
                 # Publish ON command
                 control_msg = {
@@ -520,16 +1114,8 @@ def check_pump_rules(sensor_id, reading_type, value):
                     'timestamp': datetime.now().isoformat()
                 }
                 topic = f'mynode/{rule["pump_id"]}/control'
-                print(f"[MQTT] Publishing ON command to topic: {topic}, Message: {control_msg}")
+                mqtt_log.info("Publishing ON command to topic: %s, message: %s", topic, control_msg)
                 mqtt.publish(topic, json.dumps(control_msg), qos=1)
-
-                # Schedule turn OFF after duration (in minutes)
-                # Only schedule if the duration > 0. If you prefer to always schedule, remove the check.
-                if rule['duration'] > 0:
-                    duration_seconds = rule['duration'] * 60
-                    timer = threading.Timer(duration_seconds, turn_off_pump, [rule['pump_id']])
-                    timer.start()
-                    print(f"[TIMER] Turn OFF scheduled for pump {rule['pump_id']} in {duration_seconds} seconds.")
             
             elif rule['action'] == 'off':
                 # If the pump is already OFF, there's nothing to do
@@ -546,7 +1132,7 @@ def check_pump_rules(sensor_id, reading_type, value):
                     continue
 
                 # If the pump is ON, turn it off immediately (no scheduling)
-                print(f"Turning OFF pump {rule['pump_id']} immediately.")
+                rules_log.info("Turning OFF pump %s immediately", rule['pump_id'])
                 cursor.execute('''
                     INSERT INTO rule_actions (rule_id, sensor_value, action_taken)
                     VALUES (?, ?, ?)
@@ -557,7 +1143,9 @@ def check_pump_rules(sensor_id, reading_type, value):
                            last_update = CURRENT_TIMESTAMP
                      WHERE pump_id = ?
                 ''', (rule['pump_id'],))
+                cancel_pump_off(cursor, rule['pump_id'])
                 conn.commit()
+                switched.add(rule['pump_id'])
 
                 off_msg = {
                     'device_id': rule['pump_id'],
@@ -570,9 +1158,52 @@ def check_pump_rules(sensor_id, reading_type, value):
             # If other actions or logic exist, handle them here.
             # End of for-loop (rules)
 
-def turn_off_pump(pump_id):
-    """Turn off the pump after the scheduled duration ends."""
+    resource_versions.bump('rule_actions')
+    for rule in rules:
+        touch_pump(rule['pump_id'])
+    # The pump's own status echo matches the database by now and emits nothing
+    for pump_id in switched:
+        publish_pump_status(pump_id)
+
+PUMP_TIMERS_SQL = 'SELECT pump_id, off_at, scheduled FROM pump_timers'
+
+def schedule_pump_off(cursor, pump_id, delay_seconds, scheduled=False):
+    """Store a turn-off in delay_seconds with the caller's transaction; returns its deadline.
+
+    The caller passes the deadline to arm_pump_off once the transaction has
+    committed, so a rolled back turn-on never leaves a timer behind.
+    """
+    off_at = clock.time() + delay_seconds
+    cursor.execute('''
+        INSERT OR REPLACE INTO pump_timers (pump_id, off_at, scheduled)
+        VALUES (?, ?, ?)
+    ''', (pump_id, off_at, scheduled))
+    return off_at
+
+def arm_pump_off(pump_id, off_at, scheduled=False):
+    """Put a committed pump_timers row on the timer service"""
+    timer_service.call_at(('pump_off', pump_id), off_at, turn_off_pump, pump_id, scheduled=scheduled)
+
+def cancel_pump_off(cursor, pump_id):
+    """Drop a pending automatic turn-off, e.g. when the pump is switched off another way"""
+    cursor.execute('DELETE FROM pump_timers WHERE pump_id = ?', (pump_id,))
+    timer_service.cancel(('pump_off', pump_id))
+
+def load_pump_timers():
+    """Put every stored turn-off back on the timer service; overdue ones fire immediately"""
     with get_db() as conn:
+        rows = conn.execute(PUMP_TIMERS_SQL).fetchall()
+    timer_service.call_many([
+        (('pump_off', row['pump_id']), row['off_at'], turn_off_pump,
+         (row['pump_id'],), {'scheduled': bool(row['scheduled'])})
+        for row in rows
+    ])
+    overdue = sum(1 for row in rows if row['off_at'] <= clock.time())
+    pump_log.info("Restored %d pending pump turn-offs (%d overdue)", len(rows), overdue)
+
+def turn_off_pump(pump_id, scheduled=False):
+    """Turn off the pump after the scheduled duration ends."""
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE pumps
@@ -580,16 +1211,23 @@ def turn_off_pump(pump_id):
                    last_update = CURRENT_TIMESTAMP
              WHERE pump_id = ?
         ''', (pump_id,))
+        cursor.execute('DELETE FROM pump_timers WHERE pump_id = ?', (pump_id,))
         conn.commit()
+    touch_pump(pump_id)
+    publish_pump_status(pump_id)
 
     off_msg = {
         'device_id': pump_id,
         'command': 'off',
         'timestamp': datetime.now().isoformat()
     }
+    if scheduled:
+        off_msg['scheduled'] = True
     # Publish an OFF command to the relevant MQTT topic
     mqtt.publish(f'mynode/pump_control', json.dumps(off_msg), qos=1)
-    print(f"[TIMER] Pump {pump_id} turned off after scheduled duration.")
+    if scheduled:
+        mqtt.publish(f'mynode/{pump_id}/control', json.dumps(off_msg), qos=1)
+    pump_log.info("Pump %s turned off after scheduled duration", pump_id)
 
 
 @app.route('/api/delete-sensor', methods=['POST'])
@@ -599,13 +1237,25 @@ def delete_sensor():
         data = request.get_json()
         device_id = data.get('device_id')
         
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
-            # Delete sensor settings and readings
+            # Delete sensor settings; its history can be large and is
+            # purged in chunks in the background
             cursor.execute('DELETE FROM device_settings WHERE device_id = ?', (device_id,))
-            cursor.execute('DELETE FROM sensor_readings WHERE device_id = ?', (device_id,))
             cursor.execute('DELETE FROM sensor_locations WHERE device_id = ?', (device_id,))
+            # Bounded by id so readings from a device that re-registers later are kept
+            max_reading_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM sensor_readings').fetchone()[0]
+            max_rollup_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM sensor_rollups').fetchone()[0]
             conn.commit()
+
+        retention_purger.enqueue('sensor_readings', 'device_id = ? AND id <= ?', (device_id, max_reading_id))
+        retention_purger.enqueue('sensor_rollups', 'device_id = ? AND id <= ?', (device_id, max_rollup_id))
+        if reading_archive.enabled:
+            retention_purger.enqueue_call(reading_archive.delete_device, device_id)
+
+        latest_cache.invalidate(device_id)
+        resource_versions.bump('sensors', 'readings')
+        publish_unclaimed_sensors()
             
         return jsonify({'success': True, 'message': 'Sensor deleted successfully'})
     except Exception as e:
@@ -623,7 +1273,7 @@ def set_sleep_time():
         if not device_id or not isinstance(sleep_time, (int, float)) or sleep_time < 1:
             return jsonify({'success': False, 'message': 'Invalid parameters'}), 400
 
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE device_settings 
@@ -638,6 +1288,7 @@ def set_sleep_time():
                 ''', (device_id, sleep_time))
             
             conn.commit()
+        resource_versions.bump('sensors')
 
         mqtt.publish(f'mynode/{device_id}/config/sleep', json.dumps({
             'device_id': device_id,
@@ -649,85 +1300,220 @@ def set_sleep_time():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Helper functions
+
+SENSOR_DEVICES_SQL = '''
+    SELECT 
+        d.device_id,
+        d.sleep_duration as sleep_time,
+        d.last_seen,
+        sl.name,
+        sl.location
+    FROM device_settings d
+    LEFT JOIN sensor_locations sl ON d.device_id = sl.device_id
+'''
+
+SENSOR_READINGS_BY_DEVICE_SQL = '''
+    SELECT 
+        sr.device_id,
+        sr.sensor_type,
+        sr.value,
+        sr.timestamp,
+        sl.name,
+        sl.location,
+        ds.sleep_duration as sleep_time
+    FROM sensor_readings sr
+    LEFT JOIN sensor_locations sl ON sr.device_id = sl.device_id
+    LEFT JOIN device_settings ds ON sr.device_id = ds.device_id
+    WHERE sr.device_id = ?
+    ORDER BY sr.timestamp DESC
+    LIMIT ?
+'''
+
+SENSOR_READINGS_SQL = '''
+    SELECT 
+        sr.device_id,
+        sr.sensor_type,
+        sr.value,
+        sr.timestamp,
+        sl.name,
+        sl.location,
+        ds.sleep_duration as sleep_time
+    FROM sensor_readings sr
+    LEFT JOIN sensor_locations sl ON sr.device_id = sl.device_id
+    LEFT JOIN device_settings ds ON sr.device_id = ds.device_id
+    ORDER BY sr.timestamp DESC
+    LIMIT ?
+'''
+
 def get_all_sensors():
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                d.device_id,
-                d.sleep_duration as sleep_time,
-                t.value as temperature,
-                h.value as moisture,
-                COALESCE(d.last_seen, t.timestamp, h.timestamp) as last_update,
-                sl.name,
-                sl.location
-            FROM device_settings d
-            LEFT JOIN sensor_locations sl ON d.device_id = sl.device_id
-            LEFT JOIN (
-                SELECT device_id, value, timestamp
-                FROM sensor_readings
-                WHERE sensor_type = 'temperature'
-                AND timestamp IN (
-                    SELECT MAX(timestamp)
-                    FROM sensor_readings
-                    WHERE sensor_type = 'temperature'
-                    GROUP BY device_id
-                )
-            ) t ON d.device_id = t.device_id
-            LEFT JOIN (
-                SELECT device_id, value, timestamp
-                FROM sensor_readings
-                WHERE sensor_type = 'moisture'
-                AND timestamp IN (
-                    SELECT MAX(timestamp)
-                    FROM sensor_readings
-                    WHERE sensor_type = 'moisture'
-                    GROUP BY device_id
-                )
-            ) h ON d.device_id = h.device_id
-        ''')
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.execute(SENSOR_DEVICES_SQL)
+        devices = cursor.fetchall()
+
+    sensors = []
+    for device in devices:
+        temperature = latest_cache.get(device['device_id'], 'temperature')
+        moisture = latest_cache.get(device['device_id'], 'moisture')
+        sensors.append({
+            'device_id': device['device_id'],
+            'sleep_time': device['sleep_time'],
+            'temperature': temperature[0] if temperature else None,
+            'moisture': moisture[0] if moisture else None,
+            'last_update': (device['last_seen']
+                            or (temperature[1] if temperature else None)
+                            or (moisture[1] if moisture else None)),
+            'name': device['name'],
+            'location': device['location']
+        })
+    return sensors
+
+SENSOR_INFO_SQL = '''
+    SELECT ds.device_id, sl.name, sl.location, ds.sleep_duration as sleep_time
+    FROM device_settings ds
+    LEFT JOIN sensor_locations sl ON ds.device_id = sl.device_id
+'''
 
 def get_sensor_readings(sensor_id=None, limit=10):
     """Get sensor readings with location information"""
     with get_db() as conn:
         cursor = conn.cursor()
         if sensor_id and sensor_id != 'all':
-            cursor.execute('''
-                SELECT 
-                    sr.device_id,
-                    sr.sensor_type,
-                    sr.value,
-                    sr.timestamp,
-                    sl.name,
-                    sl.location,
-                    ds.sleep_duration as sleep_time
-                FROM sensor_readings sr
-                LEFT JOIN sensor_locations sl ON sr.device_id = sl.device_id
-                LEFT JOIN device_settings ds ON sr.device_id = ds.device_id
-                WHERE sr.device_id = ?
-                ORDER BY sr.timestamp DESC
-                LIMIT ?
-            ''', (sensor_id, limit))
+            cursor.execute(SENSOR_READINGS_BY_DEVICE_SQL, (sensor_id, limit))
         else:
-            cursor.execute('''
-                SELECT 
-                    sr.device_id,
-                    sr.sensor_type,
-                    sr.value,
-                    sr.timestamp,
-                    sl.name,
-                    sl.location,
-                    ds.sleep_duration as sleep_time
-                FROM sensor_readings sr
-                LEFT JOIN sensor_locations sl ON sr.device_id = sl.device_id
-                LEFT JOIN device_settings ds ON sr.device_id = ds.device_id
-                ORDER BY sr.timestamp DESC
-                LIMIT ?
-            ''', (limit,))
+            cursor.execute(SENSOR_READINGS_SQL, (limit,))
         
         # Convert rows to dictionaries
-        return [dict(row) for row in cursor.fetchall()]
+        readings = [dict(row) for row in cursor.fetchall()]
+
+        # Live rows are newer than anything archived, so the archive only
+        # fills the remainder of the page
+        if len(readings) < limit and reading_archive.enabled:
+            archived = reading_archive.latest(
+                limit - len(readings),
+                device_ids={sensor_id} if sensor_id and sensor_id != 'all' else None
+            )
+            if archived:
+                info = {row['device_id']: row for row in cursor.execute(SENSOR_INFO_SQL)}
+                for reading in archived:
+                    reading.pop('id')
+                    device = info.get(reading['device_id'])
+                    reading['name'] = device['name'] if device else None
+                    reading['location'] = device['location'] if device else None
+                    reading['sleep_time'] = device['sleep_time'] if device else None
+                    readings.append(reading)
+        return readings
+
+RANGE_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+SENSOR_READINGS_RANGE_SQL = '''
+    SELECT sensor_type, value, timestamp
+    FROM sensor_readings
+    WHERE device_id = ?
+      AND timestamp >= ?
+      AND timestamp < ?
+    ORDER BY timestamp
+'''
+
+def parse_utc_isoformat(text):
+    """ISO 8601 string -> naive UTC datetime.
+
+    A string with an offset (or a trailing Z) is converted to UTC; one
+    without is taken to be UTC already, like CURRENT_TIMESTAMP in the
+    database. Raises ValueError for a malformed value.
+    """
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_time_range(args):
+    """(start, end) as naive UTC datetimes from range ('24h', '7d', ...) and/or start/end"""
+    end = parse_utc_isoformat(args['end']) if args.get('end') else datetime.utcnow()
+    if args.get('start'):
+        start = parse_utc_isoformat(args['start'])
+    else:
+        time_range = args.get('range', '24h')
+        unit = RANGE_UNITS.get(time_range[-1:])
+        if unit is None or not time_range[:-1].isdigit():
+            raise ValueError(f'Invalid range: {time_range}')
+        start = end - timedelta(seconds=int(time_range[:-1]) * unit)
+    if start >= end:
+        raise ValueError('start must be before end')
+    return start, end
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Bucket averages come from prefix sums and each bucket's triangle areas
+    are computed as one numpy expression, so the Python loop only runs once
+    per output point.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the interior points; first and last are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = edges[1:] - edges[:-1]
+    avg_x = np.append((sum_x[edges[1:]] - sum_x[edges[:-1]]) / counts, x[-1])
+    avg_y = np.append((sum_y[edges[1:]] - sum_y[edges[:-1]]) / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def get_reading_series(device_id, start, end, max_points):
+    """Downsampled {sensor_type: {'timestamps': [...], 'values': [...]}} for a time range.
+
+    Short ranges are read from sensor_readings, longer ones from the finest
+    rollup that fits, so the rows touched stay bounded as history grows.
+    """
+    points = {}
+    if (end - start).total_seconds() <= app.config['READINGS_RAW_MAX_SPAN']:
+        resolution = 'raw'
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SENSOR_READINGS_RANGE_SQL, (
+                device_id,
+                start.strftime('%Y-%m-%d %H:%M:%S'),
+                end.strftime('%Y-%m-%d %H:%M:%S')
+            ))
+            for row in cursor:
+                points.setdefault(row['sensor_type'], []).append((to_epoch(row['timestamp']), row['value']))
+        # Archived days come before the live rows of the same range
+        for sensor_type, archived in reading_archive.read_range(device_id, start, end).items():
+            pairs = points.get(sensor_type, [])
+            points[sensor_type] = sorted(archived + pairs)
+    else:
+        resolution = pick_rollup_resolution(start, end)
+        for sensor_type in ('temperature', 'moisture'):
+            rows = get_rollup_readings(device_id, sensor_type, start, end, resolution)
+            if rows:
+                points[sensor_type] = [(row['bucket_start'], row['mean_value']) for row in rows]
+
+    series = {}
+    for sensor_type, pairs in points.items():
+        data = np.array(pairs, dtype=np.float64)
+        keep = lttb_indices(data[:, 0], data[:, 1], max_points)
+        series[sensor_type] = {
+            'timestamps': [datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                           for t in data[keep, 0]],
+            'values': data[keep, 1].round(2).tolist()
+        }
+    return resolution, series
 
 def get_locations():
     with get_db() as conn:
@@ -738,7 +1524,7 @@ def get_locations():
 # MQTT Auth Handler
 def handle_sensor_request(device_id, data):
     """Handle authentication requests for sensors"""
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         try:
             # Handle sensor authentication
@@ -747,6 +1533,7 @@ def handle_sensor_request(device_id, data):
                 (device_id, sleep_duration, last_seen)
                 VALUES (?, 30, CURRENT_TIMESTAMP)
             ''', (device_id,))
+            new_device = cursor.rowcount == 1
             
             conn.commit()
             
@@ -756,13 +1543,17 @@ def handle_sensor_request(device_id, data):
                 'status': 'approved'
             }
             mqtt.publish('mynode/auth', json.dumps(response))
-            print(f"[AUTH] Sent approval to sensor: {device_id}")
+            auth_log.info("Sent approval to sensor: %s", device_id)
             
         except Exception as e:
-            print(f"[ERROR] Database error in auth: {str(e)}")
+            auth_log.error("Database error in sensor auth: %s", e)
             conn.rollback()
             raise
 
+    if new_device:
+        resource_versions.bump('sensors')
+        publish_unclaimed_sensors()
+
 # MQTT handlers
 @mqtt.on_connect()
 def handle_connect(client, userdata, flags, rc):
@@ -778,10 +1569,10 @@ def handle_connect(client, userdata, flags, rc):
         5: "Connection refused - not authorized"
     }
     
-    print(f"[MQTT] Connection status: {connection_status.get(rc, f'Unknown error code: {rc}')}")
+    mqtt_log.info("Connection status: %s", connection_status.get(rc, f'Unknown error code: {rc}'))
     
     if rc != 0:
-        print("[MQTT] Connection failed! Check broker settings and network connection")
+        mqtt_log.error("Connection failed! Check broker settings and network connection")
         return
         
     try:
@@ -789,15 +1580,22 @@ def handle_connect(client, userdata, flags, rc):
         topics = [
             # Sensor topics
             ('mynode/auth', 0),                  # Sensor auth
-            ('mynode/Temperature', 0),           # Temperature readings
-            ('mynode/moisture', 0),              # Moisture readings
+            ('mynode/telemetry', 0),             # All sensor readings in one message
+            ('mynode/telemetry/batch', 0),       # Readings buffered while offline
+            ('mynode/Temperature', 0),           # Temperature readings (legacy)
+            ('mynode/moisture', 0),              # Moisture readings (legacy)
             ('mynode/default/config/sleep', 0),  # Sensor sleep config
             
             # Pump topics
             ('mynode/pump_auth', 0),             # Pump auth channel
             ('mynode/water_level', 0),           # Water level readings
             ('mynode/pump_status', 0),           # Pump status updates
-            ('mynode/pump_control', 0)           # Pump control commands
+            ('mynode/pump_control', 0),          # Pump control commands
+
+            # Compact binary variants of the topics above
+            ('mynode/+' + BINARY_TOPIC_SUFFIX, 0),
+            ('mynode/telemetry/batch' + BINARY_TOPIC_SUFFIX, 0),
+            ('mynode/default/config/sleep' + BINARY_TOPIC_SUFFIX, 0)
         ]
         
         # Subscribe to each topic
@@ -805,27 +1603,25 @@ def handle_connect(client, userdata, flags, rc):
             try:
                 result, mid = client.subscribe(topic, qos)
                 if result == 0:
-                    print(f"[MQTT] Subscribed to: {topic} (MID: {mid})")
+                    mqtt_log.info("Subscribed to: %s (MID: %s)", topic, mid)
                 else:
-                    print(f"[MQTT] Failed to subscribe to: {topic} (Result: {result})")
+                    mqtt_log.error("Failed to subscribe to: %s (Result: %s)", topic, result)
             except ValueError as e:
-                print(f"[MQTT] Invalid topic filter: {topic} - {str(e)}")
+                mqtt_log.error("Invalid topic filter: %s - %s", topic, e)
             except Exception as e:
-                print(f"[MQTT] Error subscribing to {topic}: {str(e)}")
+                mqtt_log.error("Error subscribing to %s: %s", topic, e)
         
-        print("[MQTT] Topic subscription completed")
+        mqtt_log.info("Topic subscription completed")
         
     except Exception as e:
-        print(f"[MQTT] Error during connection setup: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        mqtt_log.exception("Error during connection setup: %s", e)
 
 def handle_sleep_config(device_id, action, data):
     """Handle sleep time configuration requests"""
     if action != 'get_sleep_time':
         return
         
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
         cursor.execute(
             'SELECT sleep_duration FROM device_settings WHERE device_id = ?',
@@ -846,61 +1642,1048 @@ def handle_sleep_config(device_id, action, data):
         'sleep_time': sleep_time
     }
     mqtt.publish('mynode/default/config/sleep', json.dumps(response))
-    print(f"[SLEEP] Sent sleep time {sleep_time} to device: {device_id}")
+    sensor_log.debug("Sent sleep time %s to device: %s", sleep_time, device_id)
 
 
-def handle_sensor_data(topic, device_id, data):
-    sensor_type = topic.split('/')[-1].lower()
-    value = data.get(sensor_type.lower())
-    
-    if value is not None:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO sensor_readings (device_id, sensor_type, value)
-                VALUES (?, ?, ?)
-            ''', (device_id, sensor_type, float(value)))
-            
-            cursor.execute('''
-                UPDATE device_settings 
-                SET last_seen = CURRENT_TIMESTAMP 
-                WHERE device_id = ?
-            ''', (device_id,))
-            
-            conn.commit()
+# Rollups: bucket width in seconds for each resolution kept in sensor_rollups
+ROLLUP_RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
 
-        #Check the preset rules by the user 
-        print(f"[SENSOR] Calling check_pump_rules for {device_id}, Type: {sensor_type}, Value: {value}")
-        check_pump_rules(device_id, sensor_type, float(value))
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO sensor_rollups (
+        device_id, sensor_type, resolution, bucket_start,
+        min_value, max_value, mean_value, count, last_value, last_timestamp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device_id, sensor_type, resolution, bucket_start) DO UPDATE SET
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value),
+        mean_value = (mean_value * count + excluded.mean_value * excluded.count)
+                     / (count + excluded.count),
+        count = count + excluded.count,
+        last_value = CASE WHEN excluded.last_timestamp >= last_timestamp
+                          THEN excluded.last_value ELSE last_value END,
+        last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+'''
 
+ROLLUP_RANGE_SQL = '''
+    SELECT sensor_type, bucket_start, min_value, max_value, mean_value,
+           count, last_value, last_timestamp
+    FROM sensor_rollups
+    WHERE device_id = ?
+      AND sensor_type = ?
+      AND resolution = ?
+      AND bucket_start >= ?
+      AND bucket_start < ?
+    ORDER BY bucket_start
+'''
 
-        # Send acknowledgment
-        mqtt.publish('mynode/ack', json.dumps({
-            'device_id': device_id,
-            'status': 'received'
-        }))
-        print(f"[DATA] Acknowledged {sensor_type} reading from {device_id}")
+def to_epoch(timestamp):
+    """Unix seconds for a 'YYYY-MM-DD HH:MM:SS' UTC timestamp as stored by SQLite"""
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
 
-        # Emit to websocket clients
-        socketio.emit('mqtt_message', {
-            'device_id': device_id,
-            'topic': topic,
-            'value': value,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-#pump_stuff
-pump_readings = {}
-pending_pumps = {}
+def aggregate_rollups(readings):
+    """Fold (device_id, sensor_type, value, timestamp) readings into rollup upsert rows"""
+    buckets = {}
+    for device_id, sensor_type, value, timestamp in readings:
+        epoch = to_epoch(timestamp)
+        for resolution, width in ROLLUP_RESOLUTIONS.items():
+            key = (device_id, sensor_type, resolution, epoch - epoch % width)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [value, value, value, 1, value, timestamp]
+                continue
+            if value < bucket[0]:
+                bucket[0] = value
+            if value > bucket[1]:
+                bucket[1] = value
+            bucket[2] += value
+            bucket[3] += 1
+            if timestamp >= bucket[5]:
+                bucket[4] = value
+                bucket[5] = timestamp
 
+    return [
+        key + (low, high, total / count, count, last_value, last_timestamp)
+        for key, (low, high, total, count, last_value, last_timestamp) in buckets.items()
+    ]
 
-def handle_water_level(pump_id, data):
-    """Handle and store water level readings"""
-    try:
-        # Extract reading from different possible field names
-        reading = None
-        for field in ['reading', 'water_level', 'value']:
-            if field in data and data[field] is not None:
+def update_rollups(conn, readings):
+    """Merge a batch of readings into sensor_rollups inside the caller's transaction"""
+    conn.executemany(ROLLUP_UPSERT_SQL, aggregate_rollups(readings))
+
+def write_sensor_readings(conn, readings):
+    """Insert (device_id, sensor_type, value, timestamp) rows with last_seen and rollups, in the caller's transaction"""
+    last_seen = {}
+    for device_id, _, _, timestamp in readings:
+        if timestamp > last_seen.get(device_id, ''):
+            last_seen[device_id] = timestamp
+
+    conn.executemany('''
+        INSERT INTO sensor_readings (device_id, sensor_type, value, timestamp)
+        VALUES (?, ?, ?, ?)
+    ''', readings)
+    conn.executemany('''
+        UPDATE device_settings
+        SET last_seen = MAX(COALESCE(last_seen, ''), ?)
+        WHERE device_id = ?
+    ''', [(timestamp, device_id) for device_id, timestamp in last_seen.items()])
+    update_rollups(conn, readings)
+
+def pick_rollup_resolution(start, end, max_rows=None):
+    """Finest resolution that covers [start, end) in at most max_rows buckets"""
+    max_rows = max_rows or app.config['ROLLUP_MAX_ROWS']
+    span = max((end - start).total_seconds(), 1)
+    for resolution, width in ROLLUP_RESOLUTIONS.items():
+        if span / width <= max_rows:
+            return resolution
+    return '1d'
+
+def get_rollup_readings(device_id, sensor_type, start, end, resolution=None):
+    """Pre-aggregated readings for one device and type between two UTC datetimes"""
+    resolution = resolution or pick_rollup_resolution(start, end)
+    start_epoch = int(start.replace(tzinfo=timezone.utc).timestamp())
+    end_epoch = int(end.replace(tzinfo=timezone.utc).timestamp())
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(ROLLUP_RANGE_SQL, (device_id, sensor_type, resolution, start_epoch, end_epoch))
+        return [dict(row, resolution=resolution) for row in cursor.fetchall()]
+
+
+class IngestQueue:
+    """Write-behind buffer for sensor readings.
+
+    handle_sensor_data only appends to the buffer; a background thread
+    writes everything pending with executemany in a single transaction
+    once batch_size readings are waiting or the oldest one has waited
+    flush_interval seconds. The same transaction updates sensor_rollups.
+    """
+    def __init__(self, batch_size=500, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.first_pending_at = None
+        self.condition = threading.Condition()
+        self.running = False
+        self.flush_thread = None
+
+    def start(self):
+        """Start the flush thread"""
+        if not self.running:
+            self.running = True
+            self.flush_thread = threading.Thread(target=self._run_flusher)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+            storage_log.info("Ingest flush thread started (batch size %d, interval %ss)",
+                             self.batch_size, self.flush_interval)
+
+    def stop(self):
+        """Stop the flush thread and write out everything still buffered"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.flush_thread is not None:
+            self.flush_thread.join(timeout=10)
+            self.flush_thread = None
+        # Anything left (thread never started or join timed out) is written here
+        batch = self._take_batch()
+        if batch:
+            self._write_batch(batch)
+        storage_log.info("Ingest queue drained")
+
+    def put(self, device_id, sensor_type, value, timestamp=None):
+        """Buffer a reading; timestamp defaults to now in CURRENT_TIMESTAMP format (UTC)"""
+        if timestamp is None:
+            timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        self.put_many([(device_id, sensor_type, value, timestamp)])
+
+    def put_many(self, readings):
+        """Buffer (device_id, sensor_type, value, timestamp) tuples so they land in the same write"""
+        with self.condition:
+            if not self.pending:
+                # Wake the flusher so it starts the latency deadline for this batch
+                self.first_pending_at = time_module.monotonic()
+                self.condition.notify()
+            self.pending.extend(readings)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.pending)
+
+    def _take_batch(self):
+        with self.condition:
+            batch = self.pending
+            self.pending = []
+            self.first_pending_at = None
+            return batch
+
+    def _run_flusher(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.pending:
+                        if len(self.pending) >= self.batch_size:
+                            break
+                        wait_time = self.first_pending_at + self.flush_interval - time_module.monotonic()
+                        if wait_time <= 0:
+                            break
+                        self.condition.wait(wait_time)
+                    else:
+                        self.condition.wait()
+                if not self.running:
+                    return
+            batch = self._take_batch()
+            if batch and not self._write_batch(batch):
+                # Put the readings back in front of newer ones and retry later
+                with self.condition:
+                    self.pending[:0] = batch
+                    self.first_pending_at = time_module.monotonic()
+                time_module.sleep(1)
+
+    def _write_batch(self, batch):
+        """Insert a batch of readings and refresh last_seen in one transaction"""
+        try:
+            with get_db(write=True) as conn:
+                write_in_os_thread(conn, write_sensor_readings, batch)
+            resource_versions.bump('readings')
+            return True
+        except sqlite3.Error as e:
+            storage_log.error("Failed to write batch of %d readings: %s", len(batch), e)
+            return False
+
+
+ingest_queue = IngestQueue(
+    batch_size=app.config['INGEST_BATCH_SIZE'],
+    flush_interval=app.config['INGEST_FLUSH_INTERVAL']
+)
+
+
+# Column holding the row age for each table under retention
+RETENTION_AGE_COLUMNS = {
+    'sensor_readings': 'timestamp',
+    'rule_actions': 'executed_at'
+}
+
+# Resource versions that change when rows of a table are purged
+PURGED_RESOURCES = {
+    'sensor_readings': ('readings',),
+    'sensor_rollups': ('readings',),
+    'rule_actions': ('rule_actions',)
+}
+
+
+def purge_sql(table, where):
+    """One purge chunk: delete up to ? rows of table matching where"""
+    return f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)'
+
+
+ARCHIVE_OLDEST_SQL = 'SELECT MIN(timestamp) FROM sensor_readings'
+
+ARCHIVE_DAY_SQL = '''
+    SELECT id, device_id, sensor_type, value, timestamp
+    FROM sensor_readings
+    WHERE timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+'''
+
+
+class ReadingArchive:
+    """Cold storage of old sensor_readings as compressed Parquet files.
+
+    Layout: <root>/day=YYYY-MM-DD/device=<device_id>/part-<first id>.parquet,
+    one file per device for each archived day. Whole days older than
+    after_days are written out and then deleted from SQLite in chunks.
+    Reads only open the partitions of the days in the requested range and
+    memory-map them. Days older than the sensor_readings retention are
+    removed by drop_expired. Without pyarrow the archive is disabled and
+    all readings stay in SQLite.
+    """
+    def __init__(self, root, after_days, compression='zstd', chunk_size=2000, pause=0.05):
+        self.root = root
+        self.after_days = after_days
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.enabled = pa is not None and after_days is not None
+        self.archived_rows = 0
+        self.dropped_days = 0
+        self.newest_day = None
+        self.newest_day_loaded = False
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, f'day={day.isoformat()}')
+
+    def _device_dir(self, day, device_id):
+        return os.path.join(self._day_dir(day), f"device={quote(device_id, safe='')}")
+
+    def days(self):
+        """Archived days, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(datetime.strptime(entry.name[4:], '%Y-%m-%d').date()
+                      for entry in os.scandir(self.root)
+                      if entry.is_dir() and entry.name.startswith('day='))
+
+    def covers(self, start):
+        """True if archived readings may exist at or after start (naive UTC)"""
+        if not self.enabled:
+            return False
+        if not self.newest_day_loaded:
+            days = self.days()
+            self.newest_day = days[-1] if days else None
+            self.newest_day_loaded = True
+        return self.newest_day is not None and start.date() <= self.newest_day
+
+    def remove_partial_files(self):
+        """Delete .tmp files left by a write that crashed, and partitions they leave empty"""
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for directory, _, files in os.walk(self.root, topdown=False):
+            for name in files:
+                if name.endswith('.tmp'):
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+            if directory != self.root and not os.listdir(directory):
+                os.rmdir(directory)
+        if removed:
+            self.newest_day_loaded = False
+            storage_log.warning("Removed %d partial archive files", removed)
+        return removed
+
+    def drop_expired(self, retention_days, now=None):
+        """Remove whole archived days older than retention_days; returns the days removed"""
+        if not self.enabled or retention_days is None:
+            return 0
+        cutoff_day = ((now or datetime.utcnow()) - timedelta(days=retention_days)).date()
+        expired = [day for day in self.days() if day < cutoff_day]
+        for day in expired:
+            shutil.rmtree(self._day_dir(day), ignore_errors=True)
+        if expired:
+            self.dropped_days += len(expired)
+            self.newest_day_loaded = False
+            resource_versions.bump('readings')
+            storage_log.info("Dropped %d archived days before %s", len(expired), cutoff_day)
+        return len(expired)
+
+    def archive_expired(self, should_continue=lambda: True, now=None):
+        """Move every whole day older than after_days out of SQLite; returns rows archived"""
+        if not self.enabled:
+            return 0
+        cutoff_day = (now or datetime.utcnow()).date() - timedelta(days=self.after_days)
+        total = 0
+        while should_continue():
+            with get_db() as conn:
+                oldest = conn.execute(ARCHIVE_OLDEST_SQL).fetchone()[0]
+            if oldest is None:
+                break
+            day = datetime.fromisoformat(oldest).date()
+            if day >= cutoff_day:
+                break
+            total += self.archive_day(day)
+        return total
+
+    def archive_day(self, day):
+        """Write one day of readings to Parquet, then delete exactly those rows"""
+        with get_db() as conn:
+            rows = conn.execute(ARCHIVE_DAY_SQL, (day.strftime('%Y-%m-%d'),
+                                                  (day + timedelta(days=1)).strftime('%Y-%m-%d'))).fetchall()
+        by_device = {}
+        for row in rows:
+            by_device.setdefault(row['device_id'], []).append(row)
+        for device_id, device_rows in by_device.items():
+            # Parquet encoding and file writes would block the hub like SQLite does
+            tpool.execute(self._write_part, day, device_id, device_rows)
+
+        # Readings for this day that arrive meanwhile (batch uploads) keep
+        # their new ids and are archived on the next run
+        ids = [row['id'] for row in rows]
+        for i in range(0, len(ids), self.chunk_size):
+            chunk = ids[i:i + self.chunk_size]
+            with get_db(write=True) as conn:
+                write_in_os_thread(conn, lambda conn: conn.execute(
+                    f"DELETE FROM sensor_readings WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+            time_module.sleep(self.pause)
+
+        self.archived_rows += len(rows)
+        if self.newest_day is None or day > self.newest_day:
+            self.newest_day = day
+        resource_versions.bump('readings')
+        storage_log.info("Archived %d readings of %s from %d devices", len(rows), day, len(by_device))
+        return len(rows)
+
+    def _write_part(self, day, device_id, rows):
+        directory = self._device_dir(day, device_id)
+        os.makedirs(directory, exist_ok=True)
+        table = pa.table({
+            'id': pa.array([row['id'] for row in rows], pa.int64()),
+            'sensor_type': pa.array([row['sensor_type'] for row in rows]).dictionary_encode(),
+            'value': pa.array([row['value'] for row in rows], pa.float64()),
+            'timestamp': pa.array([to_epoch(row['timestamp']) for row in rows], pa.int64())
+        })
+        # Named after the first id so rewriting the same rows after a crash replaces the file
+        path = os.path.join(directory, f"part-{min(row['id'] for row in rows)}.parquet")
+        pq.write_table(table, path + '.tmp', compression=self.compression)
+        os.replace(path + '.tmp', path)
+
+    def _read_partition(self, directory, start_epoch=None, end_epoch=None, sensor_type=None):
+        """Rows of one day/device partition as a pyarrow Table, filtered to [start, end)"""
+        tables = [pq.read_table(entry.path, memory_map=True)
+                  for entry in os.scandir(directory) if entry.name.endswith('.parquet')]
+        if not tables:
+            return None
+        table = pa.concat_tables(tables, promote_options='default') if len(tables) > 1 else tables[0]
+        mask = None
+        for condition in (
+            pc.greater_equal(table['timestamp'], start_epoch) if start_epoch is not None else None,
+            pc.less(table['timestamp'], end_epoch) if end_epoch is not None else None,
+            pc.equal(table['sensor_type'].cast(pa.string()), sensor_type) if sensor_type else None
+        ):
+            if condition is not None:
+                mask = condition if mask is None else pc.and_(mask, condition)
+        return table.filter(mask) if mask is not None else table
+
+    def read_range(self, device_id, start, end):
+        """{sensor_type: [(epoch, value), ...]} for one device between naive UTC datetimes"""
+        points = {}
+        if not self.covers(start):
+            return points
+        start_epoch = int(start.replace(tzinfo=timezone.utc).timestamp())
+        end_epoch = int(end.replace(tzinfo=timezone.utc).timestamp())
+        day = start.date()
+        while day <= min(end.date(), self.newest_day):
+            directory = self._device_dir(day, device_id)
+            table = self._read_partition(directory, start_epoch, end_epoch) if os.path.isdir(directory) else None
+            if table is not None:
+                for sensor_type, epoch, value in zip(table['sensor_type'].to_pylist(),
+                                                     table['timestamp'].to_pylist(),
+                                                     table['value'].to_pylist()):
+                    points.setdefault(sensor_type, []).append((epoch, value))
+            day += timedelta(days=1)
+        return points
+
+    def latest(self, limit, device_ids=None, sensor_type=None):
+        """Newest archived readings first, as dicts shaped like sensor_readings rows"""
+        if not self.enabled or limit <= 0:
+            return []
+        readings = []
+        for day in reversed(self.days()):
+            day_dir = self._day_dir(day)
+            for entry in os.scandir(day_dir):
+                device_id = unquote(entry.name[len('device='):])
+                if device_ids is not None and device_id not in device_ids:
+                    continue
+                table = self._read_partition(entry.path, sensor_type=sensor_type)
+                if table is None:
+                    continue
+                for reading_id, reading_type, epoch, value in zip(table['id'].to_pylist(),
+                                                                  table['sensor_type'].to_pylist(),
+                                                                  table['timestamp'].to_pylist(),
+                                                                  table['value'].to_pylist()):
+                    readings.append({
+                        'id': reading_id,
+                        'device_id': device_id,
+                        'sensor_type': reading_type,
+                        'value': value,
+                        'timestamp': datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                    })
+            # Days are disjoint, so once a day fills the limit older ones cannot contribute
+            if len(readings) >= limit:
+                break
+        readings.sort(key=lambda reading: reading['timestamp'], reverse=True)
+        return readings[:limit]
+
+    def delete_device(self, device_id):
+        """Remove every archived partition of a device"""
+        for day in self.days():
+            shutil.rmtree(self._device_dir(day, device_id), ignore_errors=True)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'after_days': self.after_days,
+            'archived_rows': self.archived_rows,
+            'dropped_days': self.dropped_days,
+            'newest_day': self.newest_day.isoformat() if self.newest_day else None
+        }
+
+
+reading_archive = ReadingArchive(
+    root=app.config['ARCHIVE_DIR'],
+    after_days=app.config['ARCHIVE_AFTER_DAYS'],
+    compression=app.config['ARCHIVE_COMPRESSION'],
+    chunk_size=app.config['PURGE_CHUNK_SIZE'],
+    pause=app.config['PURGE_PAUSE']
+)
+
+
+class RetentionPurger:
+    """Deletes expired and orphaned rows in small chunks from a background thread.
+
+    Every chunk is one short write transaction that deletes up to
+    chunk_size rowids picked through an index; the writer lock is then
+    released for `pause` seconds so ingest and request writes get in
+    between. Rowids are selected by the age/device index rather than as
+    fixed id ranges because batch uploads insert old readings with new
+    ids. Freed pages are handed back with incremental vacuum.
+    Retention passes run every `interval` seconds and first move readings
+    past the archive cutoff to `archive`, then drop archived days past the
+    sensor_readings retention; delete_sensor queues one-off purges with
+    enqueue().
+    """
+    def __init__(self, retention, interval=3600, chunk_size=2000, pause=0.05, vacuum_pages=500,
+                 archive=None):
+        self.retention = retention
+        self.archive = archive
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.tasks = deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.deleted = {}
+        self.last_pass = None
+
+    def start(self):
+        """Start the purge thread; the first retention pass runs right away"""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+            storage_log.info("Retention purger started (every %ss, %d rows per chunk)",
+                             self.interval, self.chunk_size)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def enqueue(self, table, where, params=()):
+        """Purge the rows of table matching the SQL condition, ahead of the next retention pass"""
+        self.enqueue_call(self.purge, table, where, tuple(params))
+
+    def enqueue_call(self, func, *args):
+        """Run func(*args) on the purge thread, e.g. archive cleanup for a deleted device"""
+        with self.condition:
+            self.tasks.append((func, args))
+            self.condition.notify()
+
+    def retention_tasks(self, now=None):
+        """(table, where, params) for every configured retention period"""
+        now = now or datetime.utcnow()
+        tasks = []
+        for table, days in self.retention.items():
+            if table == 'sensor_rollups':
+                for resolution, resolution_days in (days or {}).items():
+                    if resolution_days is not None:
+                        cutoff = now - timedelta(days=resolution_days)
+                        tasks.append((table, 'resolution = ? AND bucket_start < ?',
+                                      (resolution, int(cutoff.replace(tzinfo=timezone.utc).timestamp()))))
+            elif days is not None:
+                cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+                tasks.append((table, f'{RETENTION_AGE_COLUMNS[table]} < ?', (cutoff,)))
+        return tasks
+
+    def purge(self, table, where, params=()):
+        """Delete matching rows chunk by chunk; returns the number deleted"""
+        sql = purge_sql(table, where)
+        total = 0
+        while self.running:
+            try:
+                with get_db(write=True) as conn:
+                    count = write_in_os_thread(conn, lambda conn: conn.execute(sql, params + (self.chunk_size,)).rowcount)
+            except sqlite3.Error as e:
+                storage_log.error("Purge of %s failed after %d rows: %s", table, total, e)
+                break
+            total += count
+            if count < self.chunk_size:
+                break
+            time_module.sleep(self.pause)
+
+        if total:
+            self.deleted[table] = self.deleted.get(table, 0) + total
+            resource_versions.bump(*PURGED_RESOURCES.get(table, ()))
+            storage_log.info("Purged %d rows from %s (%s)", total, table, where)
+        return total
+
+    def vacuum(self):
+        """Return free pages to the file system a few at a time (auto_vacuum = INCREMENTAL only)"""
+        with get_db() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return
+        while self.running:
+            with get_db(write=True) as conn:
+                free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not free_pages:
+                    return
+                # executescript steps the pragma to completion; execute() frees a single page
+                write_in_os_thread(conn, lambda conn: conn.executescript(
+                    f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})'))
+                if conn.execute('PRAGMA freelist_count').fetchone()[0] >= free_pages:
+                    return
+            time_module.sleep(self.pause)
+
+    def stats(self):
+        with self.condition:
+            pending = len(self.tasks)
+        return {
+            'pending_tasks': pending,
+            'deleted': dict(self.deleted),
+            'last_pass': self.last_pass
+        }
+
+    def _run(self):
+        next_pass = time_module.monotonic()
+        while True:
+            with self.condition:
+                while self.running and not self.tasks and time_module.monotonic() < next_pass:
+                    self.condition.wait(next_pass - time_module.monotonic())
+                if not self.running:
+                    return
+                task = self.tasks.popleft() if self.tasks else None
+
+            try:
+                if task is not None:
+                    func, args = task
+                    func(*args)
+                else:
+                    if self.archive is not None:
+                        self.archive.archive_expired(should_continue=lambda: self.running)
+                        self.archive.drop_expired(self.retention.get('sensor_readings'))
+                    for table, where, params in self.retention_tasks():
+                        self.purge(table, where, params)
+                    self.last_pass = datetime.now().isoformat(timespec='seconds')
+                    next_pass = time_module.monotonic() + self.interval
+                self.vacuum()
+            except Exception as e:
+                storage_log.exception("Retention purge failed: %s", e)
+                next_pass = time_module.monotonic() + self.interval
+
+
+retention_purger = RetentionPurger(
+    retention=app.config['RETENTION_DAYS'],
+    interval=app.config['PURGE_INTERVAL'],
+    chunk_size=app.config['PURGE_CHUNK_SIZE'],
+    pause=app.config['PURGE_PAUSE'],
+    vacuum_pages=app.config['VACUUM_CHUNK_PAGES'],
+    archive=reading_archive
+)
+
+
+LATEST_READING_SQL = '''
+    SELECT value, timestamp FROM sensor_readings
+    WHERE device_id = ? AND sensor_type = ?
+    ORDER BY timestamp DESC
+    LIMIT 1
+'''
+
+# Latest temperature and moisture of every known device, one index probe each
+SEED_LATEST_SQL = '''
+    SELECT d.device_id, types.sensor_type, sr.value, sr.timestamp
+    FROM device_settings d
+    CROSS JOIN (SELECT 'temperature' AS sensor_type UNION ALL SELECT 'moisture') types
+    JOIN sensor_readings sr ON sr.id = (
+        SELECT id FROM sensor_readings
+        WHERE device_id = d.device_id AND sensor_type = types.sensor_type
+        ORDER BY timestamp DESC
+        LIMIT 1
+    )
+'''
+
+class LatestValueCache:
+    """Latest (value, timestamp) per (device_id, sensor_type).
+
+    Seeded from the database at startup and kept current by
+    handle_sensor_data, so the dashboard, sensor list and discovery view
+    never have to search sensor_readings for the newest row. A miss falls
+    back to a single index probe and caches the result, including 'no
+    readings yet'.
+    """
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def seed(self):
+        """Load the latest reading of every known device"""
+        with get_db() as conn:
+            rows = conn.execute(SEED_LATEST_SQL).fetchall()
+        with self.lock:
+            for row in rows:
+                self.values[(row['device_id'], row['sensor_type'])] = (row['value'], row['timestamp'])
+        storage_log.info("Seeded %d latest values", len(rows))
+
+    def update(self, device_id, sensor_type, value, timestamp):
+        key = (device_id, sensor_type)
+        with self.lock:
+            current = self.values.get(key)
+            if current is None or current[1] is None or timestamp >= current[1]:
+                self.values[key] = (value, timestamp)
+
+    def get(self, device_id, sensor_type):
+        """(value, timestamp) of the newest reading, or None if the device has none"""
+        key = (device_id, sensor_type)
+        with self.lock:
+            if key in self.values:
+                self.hits += 1
+                cached = self.values[key]
+                return cached if cached[1] is not None else None
+            self.misses += 1
+
+        with get_db() as conn:
+            row = conn.execute(LATEST_READING_SQL, key).fetchone()
+        cached = (row['value'], row['timestamp']) if row else (None, None)
+        with self.lock:
+            # A live update may have landed while we were reading
+            self.values.setdefault(key, cached)
+            cached = self.values[key]
+        return cached if cached[1] is not None else None
+
+    def invalidate(self, device_id):
+        """Forget everything cached for a device (deleted or claimed)"""
+        with self.lock:
+            for key in [key for key in self.values if key[0] == device_id]:
+                del self.values[key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.values),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+latest_cache = LatestValueCache()
+
+
+class LiveBroadcaster:
+    """Coalesces live updates into one Socket.IO 'live_frame' per tick.
+
+    A frame carries the latest value of every sensor that reported during
+    the tick ('latest': {device_id: {sensor_type: {value, timestamp}}}),
+    every reading of the tick in arrival order ('deltas', capped at
+    max_deltas, oldest dropped first) and the latest state of every pump
+    that reported ('pumps': {pump_id: payload}). Nothing is emitted for an
+    idle tick.
+    """
+    def __init__(self, tick, max_deltas):
+        self.tick = tick
+        self.max_deltas = max_deltas
+        self.latest = {}
+        self.deltas = deque(maxlen=max_deltas)
+        self.pumps = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.frames_sent = 0
+        self.updates_coalesced = 0
+        self.running = False
+
+    def add_reading(self, device_id, sensor_type, value, timestamp):
+        update = {'value': value, 'timestamp': timestamp}
+        with self.lock:
+            self.latest.setdefault(device_id, {})[sensor_type] = update
+            if len(self.deltas) == self.max_deltas:
+                self.dropped += 1
+            self.deltas.append({'device_id': device_id, 'type': sensor_type, **update})
+            self.updates_coalesced += 1
+
+    def add_pump(self, pump_id, payload):
+        with self.lock:
+            self.pumps[pump_id] = payload
+            self.updates_coalesced += 1
+
+    def start(self):
+        """Start emitting frames"""
+        if not self.running:
+            self.running = True
+            socketio.start_background_task(self._run)
+            web_log.info("Live broadcaster started (tick %ss)", self.tick)
+
+    def stop(self):
+        self.running = False
+
+    def _take_frame(self):
+        with self.lock:
+            if not (self.latest or self.pumps):
+                return None
+            self.seq += 1
+            frame = {
+                'seq': self.seq,
+                'latest': self.latest,
+                'deltas': list(self.deltas),
+                'pumps': self.pumps,
+                'truncated': self.dropped
+            }
+            self.latest, self.pumps, self.dropped = {}, {}, 0
+            self.deltas.clear()
+        return frame
+
+    def _run(self):
+        while self.running:
+            socketio.sleep(self.tick)
+            frame = self._take_frame()
+            if frame is None:
+                continue
+            try:
+                socketio.emit('live_frame', frame)
+                self.frames_sent += 1
+            except Exception as e:
+                web_log.error("Failed to emit live frame: %s", e)
+
+    def stats(self):
+        return {
+            'tick': self.tick,
+            'frames_sent': self.frames_sent,
+            'updates_coalesced': self.updates_coalesced
+        }
+
+
+live_broadcaster = LiveBroadcaster(
+    tick=app.config['LIVE_FRAME_INTERVAL'],
+    max_deltas=app.config['LIVE_FRAME_MAX_DELTAS']
+)
+
+
+class StateNotifier:
+    """Pushes page state to browsers as Socket.IO events, only when it changed.
+
+    The last payload sent for each (event, key) is remembered and an
+    identical one is not sent again, so callers can publish after every
+    write without flooding the pages.
+    """
+    def __init__(self):
+        self.last_sent = {}
+        self.lock = threading.Lock()
+        self.events_sent = 0
+
+    def publish(self, event, payload, key=None):
+        with self.lock:
+            if self.last_sent.get((event, key)) == payload:
+                return False
+            self.last_sent[(event, key)] = payload
+        try:
+            socketio.emit(event, payload)
+            self.events_sent += 1
+        except Exception as e:
+            web_log.error("Failed to emit %s: %s", event, e)
+        return True
+
+
+state_notifier = StateNotifier()
+
+def publish_pump_list():
+    """'pumps': every pump with the fields shown in the pump list"""
+    with get_db() as conn:
+        rows = conn.execute('''
+            SELECT pump_id, name, location, status FROM pumps ORDER BY created_at DESC
+        ''').fetchall()
+    state_notifier.publish('pumps', [dict(row) for row in rows])
+
+def publish_pending_pumps():
+    """'pending_pumps': ids of pumps waiting to be configured"""
+    state_notifier.publish('pending_pumps', list(pending_pumps.keys()))
+
+def publish_pump_status(pump_id):
+    """'pump_status': same payload as /api/pump/<pump_id>/status"""
+    with get_db() as conn:
+        pump = conn.execute('SELECT * FROM pumps WHERE pump_id = ?', (pump_id,)).fetchone()
+    if pump:
+        state_notifier.publish('pump_status', build_pump_status(dict(pump)), key=pump_id)
+
+def publish_unclaimed_sensors():
+    """'unclaimed_sensors': same rows as the discovery page"""
+    state_notifier.publish('unclaimed_sensors', get_unclaimed_sensors())
+
+
+SENSOR_METRICS = ('temperature', 'moisture')
+
+
+class RecentMessages:
+    """Keys seen in the last `window` seconds, with the topic they came from.
+
+    Legacy sensors publish the same document to mynode/Temperature and
+    mynode/moisture, so the copy arriving on the other topic is recognised
+    here and dropped. The same key on the same topic is a new reading (a
+    fast sensor reporting unchanged values) and is never dropped.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.seen = {}     # key -> (monotonic time, topic)
+        self.order = deque()
+        self.lock = threading.Lock()
+
+    def check_and_add(self, key, topic):
+        """True if key was seen on another topic within the window, otherwise remember it"""
+        now = time_module.monotonic()
+        with self.lock:
+            while self.order and self.order[0][0] <= now - self.window:
+                expired_at, expired_key = self.order.popleft()
+                if self.seen.get(expired_key, (None,))[0] == expired_at:
+                    del self.seen[expired_key]
+            seen = self.seen.get(key)
+            if seen is not None and seen[1] != topic:
+                # The pair is complete; a later reading with equal values starts a new one
+                del self.seen[key]
+                return True
+            self.seen[key] = (now, topic)
+            self.order.append((now, key))
+            return False
+
+    def __len__(self):
+        with self.lock:
+            return len(self.seen)
+
+
+recent_telemetry = RecentMessages(app.config['TELEMETRY_DEDUP_WINDOW'])
+
+
+def handle_sensor_data(topic, device_id, data):
+    """Store every metric in a sensor payload, run its rules and ack once.
+
+    mynode/telemetry is the combined topic and every message on it is a
+    reading. The legacy per-metric topics carry the same document twice, so
+    a payload already handled from the other legacy topic (same device,
+    timestamp and values) is skipped, but still acknowledged: the device
+    waits for an ack after each publish.
+    """
+    values = [(sensor_type, float(data[sensor_type]))
+              for sensor_type in SENSOR_METRICS if data.get(sensor_type) is not None]
+    if not values:
+        sensor_log.warning("No sensor values in message on %s from %s", topic, device_id)
+        return
+
+    if topic != 'mynode/telemetry' and recent_telemetry.check_and_add(
+            (device_id, data.get('timestamp'), tuple(values)), topic):
+        sensor_log.debug("Duplicate reading from %s on %s skipped", device_id, topic)
+    else:
+        # Stored together by the ingest queue's next batch write
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        ingest_queue.put_many([(device_id, sensor_type, value, timestamp) for sensor_type, value in values])
+
+        for sensor_type, value in values:
+            latest_cache.update(device_id, sensor_type, value, timestamp)
+
+            #Check the preset rules by the user 
+            sensor_log.debug("Calling check_pump_rules for %s, type: %s, value: %s", device_id, sensor_type, value)
+            check_pump_rules(device_id, sensor_type, value)
+
+            # Sent to browsers with the next coalesced live frame
+            live_broadcaster.add_reading(device_id, sensor_type, value, timestamp)
+
+    # Send acknowledgment
+    mqtt.publish('mynode/ack', json.dumps({
+        'device_id': device_id,
+        'status': 'received'
+    }))
+    sensor_log.debug("Acknowledged %d readings from %s", len(values), device_id)
+
+
+def store_batch_readings(conn, device_id, entries, last_seq):
+    """Write parsed (seq, timestamp, values) batch entries and remember the last seq stored"""
+    write_sensor_readings(conn, [
+        (device_id, sensor_type, value, timestamp)
+        for _, timestamp, values in entries
+        for sensor_type, value in values
+    ])
+    conn.execute('UPDATE device_settings SET last_batch_seq = ? WHERE device_id = ?', (last_seq, device_id))
+
+def handle_sensor_batch(device_id, data):
+    """Store readings a sensor buffered while it could not reach the broker.
+
+    The payload is {'device_id', 'readings': [{'seq', 'timestamp', 'temperature',
+    'moisture'}, ...]} with UTC device timestamps. Everything is written in one
+    transaction and acknowledged with the highest sequence number stored, so a
+    device that missed the ack can resend and the repeats are skipped. A
+    batch whose newest seq is below the stored one comes from a device that
+    restarted its numbering; it is stored in full and becomes the new
+    baseline. Rules only see the newest reading; the rest is history.
+    """
+    entries = data.get('readings')
+    if not isinstance(entries, list) or not entries:
+        sensor_log.warning("Batch upload from %s has no readings", device_id)
+        return
+
+    parsed = []
+    for entry in entries:
+        try:
+            seq = int(entry['seq'])
+            timestamp = payload_timestamp(entry)
+            values = [(sensor_type, float(entry[sensor_type]))
+                      for sensor_type in SENSOR_METRICS if entry.get(sensor_type) is not None]
+        except (KeyError, TypeError, ValueError, OverflowError, OSError) as e:
+            sensor_log.warning("Skipping malformed batch reading from %s: %s (%s)", device_id, entry, e)
+            continue
+        if timestamp is None or not values:
+            sensor_log.warning("Skipping batch reading from %s without timestamp or values: %s", device_id, entry)
+            continue
+        parsed.append((seq, timestamp.strftime('%Y-%m-%d %H:%M:%S'), values))
+
+    # Oldest first; anything over the limit is left for the device's next upload
+    parsed.sort(key=lambda item: item[0])
+    newest_seq = parsed[-1][0] if parsed else None
+    del parsed[app.config['BATCH_UPLOAD_MAX_READINGS']:]
+
+    with get_db(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT last_batch_seq FROM device_settings WHERE device_id = ?', (device_id,))
+        row = cursor.fetchone()
+        if row is None:
+            sensor_log.warning("Batch upload from unknown device %s ignored", device_id)
+            return
+        stored_seq = row['last_batch_seq']
+
+        # A resend always reaches the acked seq, so a batch that stops short of it
+        # means the device rebooted and counts from 1 again
+        if newest_seq is not None and newest_seq < stored_seq:
+            sensor_log.warning("Batch seq from %s went back from %d to %d, treating it as a device restart",
+                               device_id, stored_seq, newest_seq)
+            new_entries = parsed
+        else:
+            new_entries = [item for item in parsed if item[0] > stored_seq]
+        if new_entries:
+            stored_seq = new_entries[-1][0]
+            write_in_os_thread(conn, store_batch_readings, device_id, new_entries, stored_seq)
+
+    mqtt.publish('mynode/ack', json.dumps({
+        'device_id': device_id,
+        'status': 'received',
+        'seq': stored_seq
+    }))
+    sensor_log.info("Stored %d of %d buffered readings from %s (acked seq %d)",
+                    len(new_entries), len(entries), device_id, stored_seq)
+
+    if not new_entries:
+        return
+    resource_versions.bump('readings')
+
+    # Only the newest reading is current enough to act on
+    _, timestamp, values = max(new_entries, key=lambda item: item[1])
+    for sensor_type, value in values:
+        latest_cache.update(device_id, sensor_type, value, timestamp)
+        check_pump_rules(device_id, sensor_type, value)
+        live_broadcaster.add_reading(device_id, sensor_type, value, timestamp)
+        
+
+#pump_stuff
+pump_readings = {}
+pending_pumps = {}
+
+
+def handle_water_level(pump_id, data):
+    """Handle and store water level readings"""
+    try:
+        # Extract reading from different possible field names
+        reading = None
+        for field in ['reading', 'water_level', 'value']:
+            if field in data and data[field] is not None:
                 try:
                     reading = float(data[field])
                     break
@@ -908,19 +2691,19 @@ def handle_water_level(pump_id, data):
                     continue
                 
         if reading is None:
-            print(f"[ERROR] No valid reading found in data: {data}")
+            pump_log.warning("No valid reading found in data: %s", data)
             return
 
-        timestamp = datetime.now()
+        timestamp = clock.utcnow()
         if 'timestamp' in data:
             try:
-                timestamp = datetime.fromisoformat(data['timestamp'])
-            except (ValueError, TypeError):
-                print(f"[WARNING] Invalid timestamp format, using current time")
+                timestamp = payload_timestamp(data) or timestamp
+            except (ValueError, TypeError, OverflowError, OSError):
+                pump_log.warning("Invalid timestamp format, using current time")
 
-        print(f"[PUMP] Processing reading: {reading} for pump: {pump_id}")
+        pump_log.debug("Processing reading: %s for pump: %s", reading, pump_id)
             
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
             # Update pump's last reading and status
@@ -937,112 +2720,57 @@ def handle_water_level(pump_id, data):
             
             conn.commit()
 
+            touch_pump(pump_id)
+
             # Get updated pump info
             cursor.execute('SELECT * FROM pumps WHERE pump_id = ?', (pump_id,))
             pump = cursor.fetchone()
             
             if pump:
-                # Calculate volume and emit update via websocket
-                volume_info = calculate_volume(pump_id)
-                if volume_info:
-                    socketio.emit('pump_reading', {
-                        'pump_id': pump_id,
-                        'reading': reading,
-                        'timestamp': timestamp.isoformat(),
-                        'volume': volume_info,
-                        'is_running': bool(pump['is_running']),
-                        'status': pump['status']
-                    })
-                    print(f"[PUMP] Emitted reading update for {pump_id}")
+                # Same payload as /api/pump/<pump_id>/status, sent with the next live frame
+                status = build_pump_status(dict(pump))
+                status['reading'] = reading
+                status['timestamp'] = timestamp.isoformat()
+                live_broadcaster.add_pump(pump_id, status)
+                pump_log.debug("Queued reading update for %s", pump_id)
 
     except Exception as e:
-        print(f"[ERROR] Error handling water level reading: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        pump_log.exception("Error handling water level reading: %s", e)
 
 def handle_pump_status(pump_id, data):
     try:
         if pump_id not in pump_readings:
             pump_readings[pump_id] = {}
             
+        is_running = data.get('status') == 'on'
         pump_readings[pump_id].update({
-            'is_running': data.get('status') == 'on',
+            'is_running': is_running,
             'last_active': data.get('timestamp', datetime.now().isoformat())
         })
-        
-        print(f"[PUMP] Updated status for {pump_id}: {data.get('status')}")
-        
-    except Exception as e:
-        print(f"[ERROR] Error handling pump status: {str(e)}")
 
-
-def calculate_volume(pump_id):
-    """Calculate water volume and percentage for a pump based on last_reading"""
-    try:
-        with get_db() as conn:
+        # Keep the stored state in line with what the pump reports
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
-            
-            # Get pump info directly from pumps table
             cursor.execute('''
-                SELECT * FROM pumps WHERE pump_id = ?
-            ''', (pump_id,))
-            
-            result = cursor.fetchone()
-            
-            if not result or result['last_reading'] is None:
-                logging.warning(f"[VOLUME] No data available for pump {pump_id}")
-                return None
-                
-            water_level = float(result['last_reading'])
-            max_height = float(result['tank_height'] or 100)
-            
-            # Calculate volume based on tank shape
-            volume = None
-            try:
-                if result['tank_shape'] == 'box':
-                    if not all([result['tank_length'], result['tank_width']]):
-                        logging.warning(f"[VOLUME] Missing box dimensions for pump {pump_id}")
-                        return None
-                        
-                    volume = (float(result['tank_length']) * 
-                            float(result['tank_width']) * 
-                            (max_height - water_level)) / 1000  # Convert to liters
-                            
-                elif result['tank_shape'] == 'cylinder':
-                    if not result['tank_diameter']:
-                        logging.warning(f"[VOLUME] Missing cylinder dimensions for pump {pump_id}")
-                        return None
-                        
-                    radius = float(result['tank_diameter']) / 2
-                    volume = (3.14159 * radius * radius * 
-                            (max_height - water_level)) / 1000  # Convert to liters
-                            
-            except (TypeError, ValueError) as e:
-                logging.error(f"[VOLUME] Error calculating volume: {str(e)}")
-                return None
-            
-            # Calculate percentage (inverted as water_level is distance from sensor)
-            try:
-                percentage = ((max_height - water_level) / max_height) * 100
-                percentage = max(0, min(100, percentage))  # Clamp between 0 and 100
-            except (TypeError, ValueError) as e:
-                logging.error(f"[VOLUME] Error calculating percentage: {str(e)}")
-                return None
-            
-            return {
-                'volume': round(volume, 2) if volume is not None else None,
-                'percentage': round(percentage, 1),
-                'water_level': round(water_level, 1),
-                'max_height': round(max_height, 1),
-                'tank_shape': result['tank_shape']
-            }
-            
+                UPDATE pumps SET is_running = ?
+                WHERE pump_id = ? AND is_running IS NOT ?
+            ''', (is_running, pump_id, is_running))
+            changed = cursor.rowcount > 0
+            conn.commit()
+
+        if changed:
+            touch_pump(pump_id)
+            publish_pump_status(pump_id)
+        
+        pump_log.debug("Updated status for %s: %s", pump_id, data.get('status'))
+        
     except Exception as e:
-        logging.error(f"[ERROR] Error calculating volume for pump {pump_id}: {str(e)}")
-        return None
+        pump_log.error("Error handling pump status: %s", e)
+
 
 # API Routes
 @app.route('/api/pumps', methods=['GET'])
+@conditional('pumps')
 def get_pumps():
     with get_db() as conn:
         cursor = conn.cursor()
@@ -1061,12 +2789,15 @@ def get_pending_pumps():
     
     for pump_id in to_remove:
         del pending_pumps[pump_id]
+    if to_remove:
+        publish_pending_pumps()
         
     return jsonify(list(pending_pumps.keys()))
 
 
 @app.route('/api/pump/<pump_id>/readings')
 @login_required
+@conditional('readings', 'pump:{pump_id}')
 def get_pump_reading_history(pump_id):
     """Get historical readings for a specific pump"""
     try:
@@ -1084,6 +2815,7 @@ def get_pump_reading_history(pump_id):
 
 @app.route('/api/pumps/readings')
 @login_required
+@conditional('readings', 'pumps')
 def get_all_pump_readings():
     """Get latest readings for all pumps"""
     try:
@@ -1098,57 +2830,75 @@ def get_all_pump_readings():
             'error': str(e)
         }), 500
 
+PUMP_READINGS_BY_PUMP_SQL = '''
+    SELECT sr.*, p.name, p.location, p.tank_shape,
+           p.tank_height, p.tank_length, p.tank_width, p.tank_diameter
+    FROM sensor_readings sr
+    JOIN pumps p ON sr.device_id = p.pump_id
+    WHERE sr.device_id = ?
+      AND sr.sensor_type = 'water_level'
+    ORDER BY sr.timestamp DESC
+    LIMIT ?
+'''
+
+PUMP_READINGS_SQL = '''
+    SELECT sr.*, p.name, p.location, p.tank_shape,
+           p.tank_height, p.tank_length, p.tank_width, p.tank_diameter
+    FROM sensor_readings sr
+    JOIN pumps p ON sr.device_id = p.pump_id
+    WHERE sr.sensor_type = 'water_level'
+    ORDER BY sr.timestamp DESC
+    LIMIT ?
+'''
+
+# Driven from the small pumps table: one index probe per pump instead of a
+# GROUP BY over every water level reading
+LATEST_PUMP_READINGS_SQL = '''
+    SELECT sr.*, p.name, p.location, p.tank_shape,
+           p.tank_height, p.tank_length, p.tank_width, p.tank_diameter,
+           p.is_running, p.last_update
+    FROM pumps p
+    JOIN sensor_readings sr ON sr.id = (
+        SELECT id FROM sensor_readings
+        WHERE device_id = p.pump_id AND sensor_type = 'water_level'
+        ORDER BY timestamp DESC
+        LIMIT 1
+    )
+'''
+
+PUMP_INFO_SQL = '''
+    SELECT pump_id, name, location, tank_shape,
+           tank_height, tank_length, tank_width, tank_diameter
+    FROM pumps
+'''
+
 def get_pump_readings(pump_id=None, limit=100):
     """Get historical pump readings"""
     with get_db() as conn:
         cursor = conn.cursor()
         
         if pump_id:
-            cursor.execute('''
-                SELECT sr.*, p.name, p.location, p.tank_shape,
-                       p.tank_height, p.tank_length, p.tank_width, p.tank_diameter
-                FROM sensor_readings sr
-                JOIN pumps p ON sr.device_id = p.pump_id
-                WHERE sr.device_id = ?
-                  AND sr.sensor_type = 'water_level'
-                ORDER BY sr.timestamp DESC
-                LIMIT ?
-            ''', (pump_id, limit))
+            cursor.execute(PUMP_READINGS_BY_PUMP_SQL, (pump_id, limit))
         else:
-            cursor.execute('''
-                SELECT sr.*, p.name, p.location, p.tank_shape,
-                       p.tank_height, p.tank_length, p.tank_width, p.tank_diameter
-                FROM sensor_readings sr
-                JOIN pumps p ON sr.device_id = p.pump_id
-                WHERE sr.sensor_type = 'water_level'
-                ORDER BY sr.timestamp DESC
-                LIMIT ?
-            ''', (limit,))
+            cursor.execute(PUMP_READINGS_SQL, (limit,))
             
-        return [dict(row) for row in cursor.fetchall()]
+        readings = [dict(row) for row in cursor.fetchall()]
+
+        if len(readings) < limit and reading_archive.enabled:
+            pumps = {row['pump_id']: dict(row) for row in cursor.execute(PUMP_INFO_SQL)}
+            device_ids = {pump_id} & pumps.keys() if pump_id else pumps.keys()
+            for reading in reading_archive.latest(limit - len(readings), device_ids=device_ids,
+                                                  sensor_type='water_level'):
+                pump = pumps[reading['device_id']]
+                reading.update((key, value) for key, value in pump.items() if key != 'pump_id')
+                readings.append(reading)
+        return readings
     
 def get_latest_pump_readings():
     """Get latest readings for all pumps"""
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            WITH LatestReadings AS (
-                SELECT device_id, 
-                       MAX(timestamp) as max_timestamp
-                FROM sensor_readings
-                WHERE sensor_type = 'water_level'
-                GROUP BY device_id
-            )
-            SELECT sr.*, p.name, p.location, p.tank_shape,
-                   p.tank_height, p.tank_length, p.tank_width, p.tank_diameter,
-                   p.is_running, p.last_update
-            FROM sensor_readings sr
-            JOIN LatestReadings lr 
-                ON sr.device_id = lr.device_id 
-                AND sr.timestamp = lr.max_timestamp
-            JOIN pumps p ON sr.device_id = p.pump_id
-            WHERE sr.sensor_type = 'water_level'
-        ''')
+        cursor.execute(LATEST_PUMP_READINGS_SQL)
         return [dict(row) for row in cursor.fetchall()]
     
 
@@ -1159,12 +2909,12 @@ def handle_pump_auth(pump_id, data):
     try:
         # Add initial validation
         if not pump_id or not pump_id.startswith('PUMP_'):
-            print(f"[ERROR] Invalid pump ID: {pump_id}")
+            auth_log.error("Invalid pump ID: %s", pump_id)
             return
 
-        print(f"[PUMP] Processing auth request for: {pump_id}")
+        auth_log.info("Processing auth request for pump: %s", pump_id)
         
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
             # First check if pump exists
@@ -1172,7 +2922,7 @@ def handle_pump_auth(pump_id, data):
             existing_pump = cursor.fetchone()
             
             if existing_pump:
-                print(f"[PUMP] Found existing pump: {pump_id}")
+                auth_log.info("Found existing pump: %s", pump_id)
                 # Send confirmation for existing pump
                 response = {
                     'device_id': pump_id,
@@ -1184,12 +2934,13 @@ def handle_pump_auth(pump_id, data):
                 # Remove from pending if it was there
                 if pump_id in pending_pumps:
                     del pending_pumps[pump_id]
-                    print(f"[PUMP] Removed {pump_id} from pending pumps")
+                    auth_log.info("Removed %s from pending pumps", pump_id)
+                    publish_pending_pumps()
                 
             else:
                 # Only add to pending if it's a new request
                 if data.get('status') == 'new':
-                    print(f"[PUMP] Registering new pump: {pump_id}")
+                    auth_log.info("Registering new pump: %s", pump_id)
                     
                     # Add to pending pumps
                     pending_pumps[pump_id] = {
@@ -1203,6 +2954,7 @@ def handle_pump_auth(pump_id, data):
                         VALUES (?, ?, ?, ?)
                     ''', (pump_id, pump_id, 'pending', 'none'))
                     conn.commit()
+                    touch_pump(pump_id)
                     
                     # Send registration confirmation
                     response = {
@@ -1211,15 +2963,18 @@ def handle_pump_auth(pump_id, data):
                         'message': 'Ready for setup'
                     }
                     mqtt.publish('mynode/pump_auth', json.dumps(response), qos=1)
-                    print(f"[PUMP] Sent registration confirmation to {pump_id}")
+                    auth_log.info("Sent registration confirmation to %s", pump_id)
+
+        publish_pump_list()
+        publish_pending_pumps()
 
     except sqlite3.Error as e:
-        print(f"[ERROR] Database error in pump auth: {str(e)}")
+        auth_log.error("Database error in pump auth: %s", e)
         # Cleanup pending pumps entry if database operation fails
         if pump_id in pending_pumps:
             del pending_pumps[pump_id]
     except Exception as e:
-        print(f"[ERROR] Error in pump auth: {str(e)}")
+        auth_log.error("Error in pump auth: %s", e)
         if pump_id in pending_pumps:
             del pending_pumps[pump_id]
 
@@ -1231,7 +2986,7 @@ def setup_pump(pump_id):
 
     try:
         data = request.get_json()
-        print(f"Received setup data for pump {pump_id}: {data}")
+        pump_log.info("Received setup data for pump %s: %s", pump_id, data)
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -1240,7 +2995,7 @@ def setup_pump(pump_id):
         if not pump_id.startswith('PUMP_'):
             return jsonify({'error': 'Invalid pump ID format'}), 400
 
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
             # Check if pump exists
@@ -1293,6 +3048,7 @@ def setup_pump(pump_id):
                 
                 cursor.execute(query, params)
                 conn.commit()
+                touch_pump(pump_id)
                 
                 # Verify the update
                 cursor.execute('SELECT * FROM pumps WHERE pump_id = ?', (pump_id,))
@@ -1307,6 +3063,8 @@ def setup_pump(pump_id):
                     'status': 'confirmed',
                     'configured': True
                 }), qos=1)
+                publish_pump_list()
+                publish_pump_status(pump_id)
                 
                 # Return success response
                 return jsonify({
@@ -1316,11 +3074,11 @@ def setup_pump(pump_id):
                 })
                 
             except sqlite3.Error as e:
-                print(f"Database error: {str(e)}")
+                pump_log.error("Database error in pump setup: %s", e)
                 return jsonify({'error': 'Database error occurred'}), 500
                 
     except Exception as e:
-        print(f"Setup error for pump {pump_id}: {str(e)}")
+        pump_log.error("Setup error for pump %s: %s", pump_id, e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -1338,7 +3096,7 @@ def control_pump(pump_id):
             return jsonify({'error': 'Invalid command. Must be "on" or "off"'}), 400
         
         # Update pump status in database
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE pumps 
@@ -1346,6 +3104,9 @@ def control_pump(pump_id):
                     last_update = CURRENT_TIMESTAMP 
                 WHERE pump_id = ?
             ''', (command == 'on', pump_id))
+            if command == 'off':
+                # A manual off overrides a pending automatic one
+                cancel_pump_off(cursor, pump_id)
             conn.commit()
         
         # Send control command via MQTT
@@ -1359,7 +3120,9 @@ def control_pump(pump_id):
         mqtt.publish(f'mynode/pump_control', json.dumps(control_msg), qos=1)
         mqtt.publish(f'mynode/{pump_id}/control', json.dumps(control_msg), qos=1)
         
-        print(f"[PUMP] Sent control command {command} to {pump_id}")
+        pump_log.info("Sent control command %s to %s", command, pump_id)
+        touch_pump(pump_id)
+        publish_pump_status(pump_id)
         
         return jsonify({
             'status': 'success',
@@ -1367,12 +3130,72 @@ def control_pump(pump_id):
         })
         
     except Exception as e:
-        print(f"[ERROR] Failed to control pump: {str(e)}")
+        pump_log.error("Failed to control pump: %s", e)
         return jsonify({
             'error': f'Failed to control pump: {str(e)}'
         }), 500
 
+def build_pump_status(pump_dict):
+    """Pump state with water volume calculated from last_reading, as served by get_status"""
+    # Build status response
+    status = {
+        'pump_id': pump_dict['pump_id'],
+        'name': pump_dict['name'],
+        'location': pump_dict['location'],
+        'status': pump_dict['status'],
+        'is_running': bool(pump_dict['is_running']),
+        'last_update': pump_dict['last_update']
+    }
+    
+    # Calculate volume using last_reading from pumps table
+    if pump_dict['last_reading'] is not None:
+        try:
+            tank_volume = None
+            water_level = float(pump_dict['last_reading'])
+            max_height = float(pump_dict['tank_height'] or 100)
+            
+            # Calculate volume based on tank shape
+            if pump_dict['tank_shape'] == 'box':
+                if pump_dict['tank_length'] and pump_dict['tank_width']:
+                    volume = (float(pump_dict['tank_length']) * 
+                            float(pump_dict['tank_width']) * 
+                            (max_height - water_level)) / 1000  # Convert to liters
+                    
+                    tank_volume = {
+                        'volume': round(volume, 2),
+                        'percentage': round(((max_height - water_level) / max_height) * 100, 1),
+                        'tank_shape': 'box',
+                        'water_level': round(water_level, 1),
+                        'max_height': round(max_height, 1)
+                    }
+                    
+            elif pump_dict['tank_shape'] == 'cylinder':
+                if pump_dict['tank_diameter']:
+                    radius = float(pump_dict['tank_diameter']) / 2
+                    volume = (3.14159 * radius * radius * 
+                            (max_height - water_level)) / 1000  # Convert to liters
+                    
+                    tank_volume = {
+                        'volume': round(volume, 2),
+                        'percentage': round(((max_height - water_level) / max_height) * 100, 1),
+                        'tank_shape': 'cylinder',
+                        'water_level': round(water_level, 1),
+                        'max_height': round(max_height, 1)
+                    }
+            
+            if tank_volume:
+                # Ensure percentage is between 0 and 100
+                tank_volume['percentage'] = max(0, min(100, tank_volume['percentage']))
+                status['volume'] = tank_volume
+                
+        except (TypeError, ValueError) as e:
+            pump_log.error("Error calculating volume for pump %s: %s", pump_dict['pump_id'], e)
+
+    return status
+
+
 @app.route('/api/pump/<pump_id>/status')
+@conditional('pump:{pump_id}')
 def get_status(pump_id):
     """Get current pump status including water level and volume calculations"""
     try:
@@ -1389,180 +3212,364 @@ def get_status(pump_id):
             if not pump:
                 return jsonify({'error': 'Pump not found'}), 404
             
-            # Convert to dictionary for easier manipulation
-            pump_dict = dict(pump)
-            
-            # Build status response
-            status = {
-                'pump_id': pump_dict['pump_id'],
-                'name': pump_dict['name'],
-                'location': pump_dict['location'],
-                'status': pump_dict['status'],
-                'is_running': bool(pump_dict['is_running']),
-                'last_update': pump_dict['last_update']
-            }
-            
-            # Calculate volume using last_reading from pumps table
-            if pump_dict['last_reading'] is not None:
-                try:
-                    tank_volume = None
-                    water_level = float(pump_dict['last_reading'])
-                    max_height = float(pump_dict['tank_height'] or 100)
-                    
-                    # Calculate volume based on tank shape
-                    if pump_dict['tank_shape'] == 'box':
-                        if pump_dict['tank_length'] and pump_dict['tank_width']:
-                            volume = (float(pump_dict['tank_length']) * 
-                                    float(pump_dict['tank_width']) * 
-                                    (max_height - water_level)) / 1000  # Convert to liters
-                            
-                            tank_volume = {
-                                'volume': round(volume, 2),
-                                'percentage': round(((max_height - water_level) / max_height) * 100, 1),
-                                'tank_shape': 'box',
-                                'water_level': round(water_level, 1),
-                                'max_height': round(max_height, 1)
-                            }
-                            
-                    elif pump_dict['tank_shape'] == 'cylinder':
-                        if pump_dict['tank_diameter']:
-                            radius = float(pump_dict['tank_diameter']) / 2
-                            volume = (3.14159 * radius * radius * 
-                                    (max_height - water_level)) / 1000  # Convert to liters
-                            
-                            tank_volume = {
-                                'volume': round(volume, 2),
-                                'percentage': round(((max_height - water_level) / max_height) * 100, 1),
-                                'tank_shape': 'cylinder',
-                                'water_level': round(water_level, 1),
-                                'max_height': round(max_height, 1)
-                            }
-                    
-                    if tank_volume:
-                        # Ensure percentage is between 0 and 100
-                        tank_volume['percentage'] = max(0, min(100, tank_volume['percentage']))
-                        status['volume'] = tank_volume
-                        
-                except (TypeError, ValueError) as e:
-                    logging.error(f"Error calculating volume for pump {pump_id}: {str(e)}")
-            
-            return jsonify(status)
+            return jsonify(build_pump_status(dict(pump)))
             
     except Exception as e:
-        logging.error(f"[ERROR] Failed to get pump status: {str(e)}")
+        pump_log.error("Failed to get pump status: %s", e)
         return jsonify({
             'error': f'Error getting pump status: {str(e)}'
         }), 500
 
 
 
-# Add this after initializing other components (like mqtt, socketio, etc.)
+# Schedule dates and times are local (the UI and add_schedule validate against
+# datetime.now()), so "now" is passed in as (date, date, 'HH:MM') parameters.
+NEXT_ONE_SHOT_SQL = '''
+    SELECT * FROM schedules
+    WHERE pump_id = ? AND recurrence = 'once'
+    AND (schedule_date > ? OR (schedule_date = ? AND schedule_time > ?))
+    ORDER BY schedule_date, schedule_time
+    LIMIT 1
+'''
+
+# The same for every pump at once: one indexed lookup per pump
+NEXT_ONE_SHOT_PER_PUMP_SQL = '''
+    SELECT s.* FROM pumps p
+    JOIN schedules s ON s.id = (
+        SELECT id FROM schedules
+        WHERE pump_id = p.pump_id AND recurrence = 'once'
+        AND (schedule_date > ? OR (schedule_date = ? AND schedule_time > ?))
+        ORDER BY schedule_date, schedule_time
+        LIMIT 1
+    )
+'''
+
+RECURRING_SCHEDULES_SQL = '''
+    SELECT * FROM schedules WHERE recurrence != 'once'
+'''
+
+PUMP_RECURRING_SCHEDULES_SQL = '''
+    SELECT * FROM schedules WHERE recurrence != 'once' AND pump_id = ?
+'''
+
+PUMP_SCHEDULES_SQL = '''
+    SELECT * FROM schedules 
+    WHERE pump_id = ? 
+    AND (recurrence != 'once'
+         OR schedule_date > DATE('now', 'localtime')
+         OR (schedule_date = DATE('now', 'localtime')
+             AND schedule_time > STRFTIME('%H:%M', 'now', 'localtime')))
+    ORDER BY schedule_date, schedule_time
+'''
+
+SCHEDULE_EXISTS_SQL = '''
+    SELECT 1 FROM schedules 
+    WHERE pump_id = ? 
+    AND schedule_date = ? 
+    AND schedule_time = ?
+'''
+
+class ScaledClock:
+    """Wall clock for pump timers and schedules, optionally sped up for soak tests.
+
+    At speed 1 this is plain time.time() / datetime.now(). With a higher
+    speed, virtual time equals real time at `epoch` and then runs `speed`
+    times faster. pump_sim.py computes the same formula, so a fleet
+    simulator started with the same speed and epoch shares the clock
+    without exchanging messages.
+    """
+    def __init__(self, speed=1, epoch=None):
+        self.speed = speed
+        self.epoch = epoch if epoch is not None else time_module.time()
+
+    def time(self):
+        if self.speed == 1:
+            return time_module.time()
+        return self.epoch + (time_module.time() - self.epoch) * self.speed
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def utcnow(self):
+        return datetime.fromtimestamp(self.time(), timezone.utc).replace(tzinfo=None)
+
+    def real_seconds(self, seconds):
+        """Real time that passes while the clock advances by seconds"""
+        return seconds / self.speed
+
+
+clock = ScaledClock(speed=app.config['CLOCK_SPEED'], epoch=app.config['CLOCK_EPOCH'])
+
+
+class TimerService:
+    """Runs callbacks at their deadlines from one thread.
+
+    Deadlines sit in a min-heap and the thread sleeps until the earliest
+    one, so pending pump turn-offs and schedules cost no threads or
+    wakeups of their own. Every timer has a key; scheduling an existing
+    key replaces it, and cancel/reschedule look it up by key. Callbacks
+    run on the timer thread and must not block for long.
+    """
+    max_sleep = 60  # re-check at least this often (clock seconds) in case the wall clock jumps
+
+    def __init__(self):
+        self.heap = []     # (deadline, seq, key); superseded entries are skipped when popped
+        self.timers = {}   # key -> (deadline, seq, callback, args, kwargs)
+        self.seq = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.fired = 0
+
+    def start(self):
+        """Start the timer thread"""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+            scheduler_log.info("Timer service started")
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def call_at(self, key, deadline, callback, *args, **kwargs):
+        """Run callback(*args, **kwargs) at the epoch time deadline, replacing any timer with this key"""
+        with self.condition:
+            seq = next(self.seq)
+            self.timers[key] = (deadline, seq, callback, args, kwargs)
+            heapq.heappush(self.heap, (deadline, seq, key))
+            if self.heap[0][1] == seq:
+                # New earliest deadline, wake the thread to shorten its sleep
+                self.condition.notify()
+
+    def call_later(self, key, delay, callback, *args, **kwargs):
+        self.call_at(key, clock.time() + delay, callback, *args, **kwargs)
+
+    def call_many(self, entries):
+        """Add (key, deadline, callback, args, kwargs) timers with a single heapify"""
+        with self.condition:
+            for key, deadline, callback, args, kwargs in entries:
+                seq = next(self.seq)
+                self.timers[key] = (deadline, seq, callback, tuple(args), kwargs)
+                self.heap.append((deadline, seq, key))
+            heapq.heapify(self.heap)
+            self.condition.notify()
+
+    def cancel(self, key):
+        """Drop the timer with this key; False if there was none"""
+        with self.condition:
+            return self.timers.pop(key, None) is not None
+
+    def reschedule(self, key, deadline):
+        """Move an existing timer to a new epoch deadline; False if there is none"""
+        with self.condition:
+            timer = self.timers.get(key)
+            if timer is None:
+                return False
+            _, _, callback, args, kwargs = timer
+            self.call_at(key, deadline, callback, *args, **kwargs)
+            return True
+
+    def pending(self):
+        """Pending timers, earliest first"""
+        now = clock.time()
+        with self.condition:
+            timers = sorted(self.timers.items(), key=lambda item: item[1][0])
+        return [
+            {
+                'key': ':'.join(str(part) for part in key) if isinstance(key, tuple) else str(key),
+                'due': datetime.fromtimestamp(deadline).isoformat(timespec='seconds'),
+                'in_seconds': round(deadline - now, 1),
+                'callback': callback.__name__
+            }
+            for key, (deadline, _, callback, _, _) in timers
+        ]
+
+    def _next_due(self):
+        """Pop the next timer that is due, waiting for it; None once stopped"""
+        with self.condition:
+            while self.running:
+                while self.heap:
+                    deadline, seq, key = self.heap[0]
+                    timer = self.timers.get(key)
+                    if timer is not None and timer[1] == seq:
+                        break
+                    heapq.heappop(self.heap)  # cancelled or rescheduled
+
+                if not self.heap:
+                    self.condition.wait(clock.real_seconds(self.max_sleep))
+                    continue
+
+                delay = self.heap[0][0] - clock.time()
+                if delay > 0:
+                    self.condition.wait(clock.real_seconds(min(delay, self.max_sleep)))
+                    continue
+
+                _, _, key = heapq.heappop(self.heap)
+                return self.timers.pop(key)
+            return None
+
+    def _run(self):
+        while True:
+            timer = self._next_due()
+            if timer is None:
+                return
+            _, _, callback, args, kwargs = timer
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                scheduler_log.exception("Timer callback %s failed: %s", callback.__name__, e)
+            self.fired += 1
+
+
+timer_service = TimerService()
+
+
+SCHEDULE_RECURRENCES = ('once', 'daily', 'weekdays', 'hourly')
+
+def next_occurrence(recurrence, start, after, interval_hours=None):
+    """First run of a schedule strictly after `after`, or None once a one-shot has passed.
+
+    start is the first run (schedule_date + schedule_time). Recurring runs
+    are start plus a whole number of periods, found by division rather
+    than by stepping through every missed one.
+    """
+    if start > after:
+        candidate = start
+    elif recurrence == 'once':
+        return None
+    else:
+        period = timedelta(hours=interval_hours) if recurrence == 'hourly' else timedelta(days=1)
+        candidate = start + ((after - start) // period + 1) * period
+
+    if recurrence == 'weekdays':
+        while candidate.weekday() >= 5:  # Saturday, Sunday
+            candidate += timedelta(days=1)
+    return candidate
+
+def schedule_start(schedule):
+    return datetime.strptime(f"{schedule['schedule_date']} {schedule['schedule_time']}", '%Y-%m-%d %H:%M')
+
+
 class PumpScheduler:
-    def __init__(self):
-        self.scheduler_thread = None
-        self.running = False
-        self.jobs = {}
-        self.load_existing_schedules()
-    
+    """Keeps each pump's next scheduled run on the timer service.
+
+    Only one timer per pump exists: the earliest upcoming run among its
+    one-shot and recurring schedules. It carries every schedule due at that
+    instant, so a one-shot falling on the same minute as a recurring run is
+    run (and deleted) with it. When it fires the pump is re-armed from the
+    database, so memory and startup time follow the number of pumps, not
+    the number of dated rows.
+    """
+    @staticmethod
+    def job_key(pump_id):
+        return ('schedule', pump_id)
+
+    @staticmethod
+    def now_params(now):
+        today = now.strftime('%Y-%m-%d')
+        return today, today, now.strftime('%H:%M')
+
     def load_existing_schedules(self):
-        """Load existing schedules from database on startup"""
+        """Arm every pump with schedules (startup) and drop one-shots that were missed"""
+        now = clock.now()
         try:
-            with get_db() as conn:
+            with get_db(write=True) as conn:
                 cursor = conn.cursor()
-                # Only load future schedules and today's remaining schedules
-                cursor.execute('''
-                    SELECT pump_id, schedule_time, duration 
-                    FROM schedules 
-                    WHERE schedule_date > DATE('now')
-                    OR (schedule_date = DATE('now') AND schedule_time > TIME('now'))
-                ''')
+                cursor.execute(NEXT_ONE_SHOT_PER_PUMP_SQL, self.now_params(now))
                 schedules = cursor.fetchall()
-                
-                for schedule in schedules:
-                    self.add_job(
-                        pump_id=schedule['pump_id'],
-                        schedule_time=schedule['schedule_time'],
-                        duration=schedule['duration']
-                    )
-                print(f"[SCHEDULER] Loaded {len(schedules)} existing schedules")
-                
+                cursor.execute(RECURRING_SCHEDULES_SQL)
+                schedules += cursor.fetchall()
+
                 # Clean up any old schedules
                 cursor.execute('''
                     DELETE FROM schedules 
-                    WHERE schedule_date < DATE('now')
-                    OR (schedule_date = DATE('now') AND schedule_time <= TIME('now'))
-                ''')
+                    WHERE recurrence = 'once'
+                    AND (schedule_date < ? OR (schedule_date = ? AND schedule_time <= ?))
+                ''', self.now_params(now))
                 conn.commit()
-                
+
+            by_pump = {}
+            for schedule in schedules:
+                by_pump.setdefault(schedule['pump_id'], []).append(schedule)
+            runs = {pump_id: self.next_runs(pump_schedules, now) for pump_id, pump_schedules in by_pump.items()}
+            runs = {pump_id: run for pump_id, run in runs.items() if run is not None}
+
+            timer_service.call_many([
+                (self.job_key(pump_id), run_at.timestamp(), handle_scheduled_pump, (),
+                 {'pump_id': pump_id, 'due': due})
+                for pump_id, (run_at, due) in runs.items()
+            ])
+            scheduler_log.info("Armed next scheduled run for %d pumps", len(runs))
+
         except Exception as e:
-            print(f"[SCHEDULER ERROR] Failed to load existing schedules: {str(e)}")
-    
-    def start(self):
-        """Start the scheduler thread"""
-        if not self.running:
-            self.running = True
-            self.scheduler_thread = threading.Thread(target=self._run_scheduler)
-            self.scheduler_thread.daemon = True
-            self.scheduler_thread.start()
-            print("[SCHEDULER] Scheduler thread started")
-    
-    def _run_scheduler(self):
-        """Run the scheduler loop with proper error handling"""
-        print("[SCHEDULER] Scheduler loop starting")
-        while self.running:
-            try:
-                schedule.run_pending()
-                time_module.sleep(1)
-            except Exception as e:
-                print(f"[SCHEDULER ERROR] Error in scheduler loop: {str(e)}")
-                time_module.sleep(5)  # Wait before retrying
-    
-    def add_job(self, pump_id, schedule_time, duration):
-        """Add a new scheduled job with logging"""
+            scheduler_log.error("Failed to load existing schedules: %s", e)
+
+    @staticmethod
+    def next_run(schedule, now):
+        """(datetime, schedule) of the schedule's next run after now, or None"""
         try:
-            job_id = f"{pump_id}_{schedule_time}"
-            print(f"[SCHEDULER] Adding job {job_id} for pump {pump_id}")
-            
-            # Cancel existing job if any
-            if job_id in self.jobs:
-                print(f"[SCHEDULER] Cancelling existing job {job_id}")
-                schedule.cancel_job(self.jobs[job_id])
-            
-            # Create new job with explicit function call
-            job = schedule.every().day.at(schedule_time).do(
-                handle_scheduled_pump,
-                pump_id=pump_id,
-                duration=duration
-            )
-            
-            self.jobs[job_id] = job
-            print(f"[SCHEDULER] Successfully added job {job_id}")
-            return True
-            
-        except Exception as e:
-            print(f"[SCHEDULER ERROR] Failed to add job {pump_id}_{schedule_time}: {str(e)}")
-            return False
+            run_at = next_occurrence(schedule['recurrence'], schedule_start(schedule), now,
+                                     schedule['interval_hours'])
+        except (TypeError, ValueError) as e:
+            scheduler_log.error("Ignoring invalid schedule %s: %s", schedule['id'], e)
+            return None
+        return (run_at, schedule) if run_at is not None else None
+
+    def next_runs(self, schedules, now):
+        """(datetime, [(schedule_id, duration, recurrence), ...]) of every schedule due at the earliest next run"""
+        runs = [run for run in (self.next_run(schedule, now) for schedule in schedules) if run]
+        if not runs:
+            return None
+        run_at = min(run[0] for run in runs)
+        return run_at, [(schedule['id'], schedule['duration'], schedule['recurrence'])
+                        for at, schedule in runs if at == run_at]
+
+    def arm(self, pump_id):
+        """Put the pump's earliest upcoming run on the timer service, or clear it if there is none"""
+        now = clock.now()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(NEXT_ONE_SHOT_SQL, (pump_id,) + self.now_params(now))
+            schedules = cursor.fetchall()
+            cursor.execute(PUMP_RECURRING_SCHEDULES_SQL, (pump_id,))
+            schedules += cursor.fetchall()
+
+        run = self.next_runs(schedules, now)
+        if run is None:
+            timer_service.cancel(self.job_key(pump_id))
+            return None
 
-def handle_scheduled_pump(pump_id, duration):
-    """Handle scheduled pump operation with cleanup after completion"""
-    print(f"[SCHEDULE] Starting scheduled pump operation for {pump_id}, duration: {duration} minutes")
+        run_at, due = run
+        timer_service.call_at(self.job_key(pump_id), run_at.timestamp(), handle_scheduled_pump,
+                              pump_id=pump_id, due=due)
+        scheduler_log.info("Next scheduled run of pump %s at %s", pump_id, run_at.isoformat(timespec='minutes'))
+        return run_at
+
+
+pump_scheduler = PumpScheduler()
+
+
+def handle_scheduled_pump(pump_id, due):
+    """Handle scheduled pump operation with cleanup after completion.
+
+    due lists (schedule_id, duration, recurrence) of every schedule starting
+    at this instant; the pump runs once, for the longest of their durations.
+    """
+    duration = max(schedule_duration for _, schedule_duration, _ in due)
+    scheduler_log.info("Starting scheduled pump operation for %s, duration: %s minutes", pump_id, duration)
     
     try:
-        # Get the current schedule time before we delete it
-        current_time = datetime.now().strftime("%H:%M")
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        
-        # First remove the completed schedule from database
-        with get_db() as conn:
+        # First remove the completed schedules from database
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
-            # Delete the schedule that's being executed
-            cursor.execute('''
-                DELETE FROM schedules 
-                WHERE pump_id = ? 
-                AND schedule_date = ? 
-                AND schedule_time = ?
-            ''', (pump_id, current_date, current_time))
+            # A one-shot schedule is done once it runs; recurring ones stay
+            cursor.executemany('DELETE FROM schedules WHERE id = ?',
+                               [(schedule_id,) for schedule_id, _, recurrence in due if recurrence == 'once'])
             
             # Update pump status
             cursor.execute('''
@@ -1571,9 +3578,17 @@ def handle_scheduled_pump(pump_id, duration):
                     last_update = CURRENT_TIMESTAMP 
                 WHERE pump_id = ?
             ''', (pump_id,))
+
+            # Schedule turn off after duration
+            off_at = schedule_pump_off(cursor, pump_id, duration * 60, scheduled=True)
             
             conn.commit()
-            print(f"[SCHEDULE] Removed completed schedule for pump {pump_id}")
+            arm_pump_off(pump_id, off_at, scheduled=True)
+            resource_versions.bump(f'schedules:{pump_id}')
+            touch_pump(pump_id)
+            publish_pump_status(pump_id)
+            scheduler_log.info("Ran schedules %s for pump %s",
+                               ', '.join(f'{schedule_id} ({recurrence})' for schedule_id, _, recurrence in due), pump_id)
         
         # Send MQTT command to turn on pump
         control_msg = {
@@ -1586,57 +3601,19 @@ def handle_scheduled_pump(pump_id, duration):
         
         mqtt.publish(f'mynode/pump_control', json.dumps(control_msg), qos=1)
         mqtt.publish(f'mynode/{pump_id}/control', json.dumps(control_msg), qos=1)
-        print(f"[SCHEDULE] Sent ON command via MQTT for pump {pump_id}")
-        
-        # Schedule turn off after duration
-        def turn_off_pump():
-            try:
-                print(f"[SCHEDULE] Initiating scheduled turn off for pump {pump_id}")
-                
-                with get_db() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE pumps 
-                        SET is_running = FALSE,
-                            last_update = CURRENT_TIMESTAMP 
-                        WHERE pump_id = ?
-                    ''', (pump_id,))
-                    conn.commit()
-                
-                off_msg = {
-                    'device_id': pump_id,
-                    'command': 'off',
-                    'scheduled': True,
-                    'timestamp': datetime.now().isoformat()
-                }
-                
-                mqtt.publish(f'mynode/pump_control', json.dumps(off_msg), qos=1)
-                mqtt.publish(f'mynode/{pump_id}/control', json.dumps(off_msg), qos=1)
-                
-                print(f"[SCHEDULE] Successfully turned off pump {pump_id}")
-                
-                # Remove the schedule from the scheduler's job list
-                job_id = f"{pump_id}_{current_time}"
-                if job_id in pump_scheduler.jobs:
-                    schedule.cancel_job(pump_scheduler.jobs[job_id])
-                    del pump_scheduler.jobs[job_id]
-                    print(f"[SCHEDULE] Cleaned up completed schedule job {job_id}")
-                
-            except Exception as e:
-                print(f"[SCHEDULE ERROR] Failed to turn off pump {pump_id}: {str(e)}")
+        scheduler_log.info("Sent ON command via MQTT for pump %s", pump_id)
         
-        # Set up the turn-off timer
-        timer = threading.Timer(duration * 60, turn_off_pump)
-        timer.daemon = True
-        timer.start()
-        
-        print(f"[SCHEDULE] Successfully initiated pump {pump_id} operation")
+        scheduler_log.info("Successfully initiated pump %s operation", pump_id)
         return True
         
     except Exception as e:
-        print(f"[SCHEDULE ERROR] Failed to handle scheduled pump {pump_id}: {str(e)}")
+        scheduler_log.error("Failed to handle scheduled pump %s: %s", pump_id, e)
         return False
 
+    finally:
+        # Next run of this or another of the pump's schedules
+        pump_scheduler.arm(pump_id)
+
 @app.route('/api/pump/<pump_id>/schedule', methods=['POST'])
 def add_schedule(pump_id):
     """Add a new pump schedule"""
@@ -1653,9 +3630,23 @@ def add_schedule(pump_id):
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
             
+        recurrence = data.get('recurrence', 'once')
+        if recurrence not in SCHEDULE_RECURRENCES:
+            return jsonify({'error': f"Recurrence must be one of: {', '.join(SCHEDULE_RECURRENCES)}"}), 400
+
+        interval_hours = None
+        if recurrence == 'hourly':
+            try:
+                interval_hours = int(data.get('interval_hours', 1))
+                if not 1 <= interval_hours <= 24:
+                    return jsonify({'error': 'Interval must be between 1 and 24 hours'}), 400
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f'Invalid interval: {str(e)}'}), 400
+
         try:
             schedule_datetime = datetime.strptime(f"{data['date']} {data['time']}", '%Y-%m-%d %H:%M')
-            if schedule_datetime < datetime.now():
+            # Recurring schedules may start in the past; they run from the next occurrence
+            if recurrence == 'once' and schedule_datetime < clock.now():
                 return jsonify({'error': 'Cannot schedule in the past'}), 400
         except ValueError as e:
             return jsonify({'error': f'Invalid date or time format: {str(e)}'}), 400
@@ -1667,7 +3658,7 @@ def add_schedule(pump_id):
         except (TypeError, ValueError) as e:
             return jsonify({'error': f'Invalid duration: {str(e)}'}), 400
         
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
             # Check if pump exists
@@ -1676,74 +3667,55 @@ def add_schedule(pump_id):
                 return jsonify({'error': 'Pump not found'}), 404
             
             # Check for conflicting schedules
-            cursor.execute('''
-                SELECT 1 FROM schedules 
-                WHERE pump_id = ? 
-                AND schedule_date = ? 
-                AND schedule_time = ?
-            ''', (pump_id, data['date'], data['time']))
+            cursor.execute(SCHEDULE_EXISTS_SQL, (pump_id, data['date'], data['time']))
             
             if cursor.fetchone():
                 return jsonify({'error': 'A schedule already exists for this time'}), 409
             
             # Add to database
             cursor.execute('''
-                INSERT INTO schedules (pump_id, schedule_date, schedule_time, duration)
-                VALUES (?, ?, ?, ?)
-            ''', (pump_id, data['date'], data['time'], duration))
-            
-            # Add to scheduler - just pass the required arguments
-            success = pump_scheduler.add_job(
-                pump_id=pump_id, 
-                schedule_time=data['time'], 
-                duration=duration
-            )
-            
-            if not success:
-                conn.rollback()
-                return jsonify({'error': 'Failed to add schedule to scheduler'}), 500
-            
+                INSERT INTO schedules (pump_id, schedule_date, schedule_time, duration,
+                                       recurrence, interval_hours)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (pump_id, data['date'], data['time'], duration, recurrence, interval_hours))
             conn.commit()
-            
-            return jsonify({
-                'status': 'success',
-                'message': 'Schedule added successfully'
-            })
+            resource_versions.bump(f'schedules:{pump_id}')
+
+        # The new schedule may now be the pump's next run
+        next_run = pump_scheduler.arm(pump_id)
+
+        return jsonify({
+            'status': 'success',
+            'message': 'Schedule added successfully',
+            'next_run': next_run.isoformat(timespec='minutes') if next_run else None
+        })
             
     except Exception as e:
-        logging.error(f"Error in add_schedule: {str(e)}")
+        scheduler_log.error("Error in add_schedule: %s", e)
         return jsonify({'error': f'Failed to add schedule: {str(e)}'}), 500
     
 
 @app.route('/api/pump/<pump_id>/schedules', methods=['GET'])
+# One-shot schedules drop out once their minute has passed, so the ETag turns over every minute
+@conditional('schedules:{pump_id}', vary_seconds=60)
 def get_schedules(pump_id):
     """Get all schedules for a pump"""
     try:
-        print("Getting schedules for pump:", pump_id)
+        web_log.debug("Getting schedules for pump: %s", pump_id)
         
         with get_db() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT * FROM schedules 
-                WHERE pump_id = ? 
-                AND (schedule_date > DATE('now') 
-                     OR (schedule_date = DATE('now') 
-                         AND schedule_time > TIME('now')))
-                ORDER BY schedule_date, schedule_time
-            ''', (pump_id,))
+            cursor.execute(PUMP_SCHEDULES_SQL, (pump_id,))
             
             schedules = [dict(row) for row in cursor.fetchall()]
-            print("Found schedules:", schedules)
+            web_log.debug("Found schedules: %s", schedules)
             
             response = jsonify(schedules)
-            print("Sending response:", response.get_data(as_text=True))
             return response
             
     except Exception as e:
-        print("Error in get_schedules:", str(e))
-        import traceback
-        traceback.print_exc()
+        web_log.exception("Error in get_schedules: %s", e)
         return jsonify({
             'error': f'Failed to fetch schedules: {str(e)}'
         }), 500
@@ -1754,35 +3726,30 @@ def get_schedules(pump_id):
 def delete_schedule(pump_id):
     """Delete a pump schedule with improved error handling"""
     try:
-        print(f"[DELETE] Attempting to delete schedule for pump {pump_id}")
+        scheduler_log.info("Attempting to delete schedule for pump %s", pump_id)
         
         if not request.is_json:
-            print("[DELETE] Error: Request is not JSON")
+            scheduler_log.warning("Delete schedule: request is not JSON")
             return jsonify({'error': 'Content-Type must be application/json'}), 400
         
         data = request.get_json()
-        print(f"[DELETE] Received data: {data}")
+        scheduler_log.debug("Delete schedule received data: %s", data)
         
         if not data or 'date' not in data or 'time' not in data:
-            print("[DELETE] Error: Missing required fields")
+            scheduler_log.warning("Delete schedule: missing required fields")
             return jsonify({'error': 'Missing required fields (date and time)'}), 400
         
         # Log the values we're using for deletion
-        print(f"[DELETE] Using pump_id: {pump_id}, date: {data['date']}, time: {data['time']}")
+        scheduler_log.debug("Deleting schedule for pump_id: %s, date: %s, time: %s", pump_id, data['date'], data['time'])
         
-        with get_db() as conn:
+        with get_db(write=True) as conn:
             cursor = conn.cursor()
             
             # First check if the schedule exists
-            cursor.execute('''
-                SELECT 1 FROM schedules 
-                WHERE pump_id = ? 
-                AND schedule_date = ?
-                AND schedule_time = ?
-            ''', (pump_id, data['date'], data['time']))
+            cursor.execute(SCHEDULE_EXISTS_SQL, (pump_id, data['date'], data['time']))
             
             if not cursor.fetchone():
-                print(f"[DELETE] Schedule not found for pump {pump_id}")
+                scheduler_log.warning("Schedule to delete not found for pump %s", pump_id)
                 return jsonify({'error': 'Schedule not found'}), 404
             
             # Delete from database
@@ -1793,103 +3760,737 @@ def delete_schedule(pump_id):
                 AND schedule_time = ?
             ''', (pump_id, data['date'], data['time']))
             
-            # Remove from scheduler
-            job_id = f"{pump_id}_{data['time']}"
-            if hasattr(pump_scheduler, 'jobs') and job_id in pump_scheduler.jobs:
-                try:
-                    schedule.cancel_job(pump_scheduler.jobs[job_id])
-                    del pump_scheduler.jobs[job_id]
-                    print(f"[DELETE] Removed job {job_id} from scheduler")
-                except Exception as e:
-                    print(f"[DELETE] Warning: Error removing job from scheduler: {str(e)}")
-            
             conn.commit()
-            print(f"[DELETE] Successfully deleted schedule for pump {pump_id}")
-            
-            return jsonify({
-                'status': 'success',
-                'message': 'Schedule deleted successfully'
-            })
+            resource_versions.bump(f'schedules:{pump_id}')
+            scheduler_log.info("Successfully deleted schedule for pump %s", pump_id)
+
+        # Re-arm in case the deleted schedule was the pump's next run
+        pump_scheduler.arm(pump_id)
+
+        return jsonify({
+            'status': 'success',
+            'message': 'Schedule deleted successfully'
+        })
             
     except Exception as e:
-        print(f"[DELETE] Error deleting schedule: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        scheduler_log.exception("Error deleting schedule: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
 
+class TopicTrie:
+    """MQTT topic filters compiled into a trie, one node per topic level.
+
+    '+' matches exactly one level and '#' matches the remaining levels
+    (including none), as in the MQTT spec. Matching walks the levels of the
+    incoming topic once, whatever the number of registered filters.
+    """
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, topic_filter, value):
+        node = self.root
+        for level in topic_filter.split('/'):
+            node = node.setdefault(level, {})
+        node.setdefault(None, []).append(value)
+
+    def match(self, topic):
+        matches = []
+        nodes = [self.root]
+        for level in topic.split('/'):
+            next_nodes = []
+            for node in nodes:
+                if '#' in node:
+                    matches.extend(node['#'].get(None, []))
+                for key in (level, '+'):
+                    if key in node:
+                        next_nodes.append(node[key])
+            nodes = next_nodes
+            if not nodes:
+                return matches
+        for node in nodes:
+            matches.extend(node.get(None, []))
+            # 'a/#' also matches the parent level 'a'
+            if '#' in node:
+                matches.extend(node['#'].get(None, []))
+        return matches
+
+
+class WorkerLane:
+    """Bounded worker pool for one class of MQTT handlers.
+
+    Each worker owns its own queue and a message always goes to the worker
+    picked by hashing its device_id, so messages from one device are
+    handled in arrival order while different devices interleave. When a
+    worker's queue is full the message is dropped rather than blocking the
+    MQTT network loop.
+
+    Under eventlet the workers are green threads: they interleave at I/O
+    and sleeps but share one OS thread, so a handler's sqlite3 calls still
+    pause everything else. Bulk writes are therefore made through
+    write_in_os_thread; short queries run inline.
+    """
+    def __init__(self, name, workers, max_queue):
+        self.name = name
+        self.queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self.threads = []
+        self.dropped = 0
+
+    def start(self):
+        if self.threads:
+            return
+        for number, work_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self._run_worker, args=(work_queue,),
+                                      name=f'mqtt-{self.name}-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for work_queue in self.queues:
+            work_queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+    def submit(self, device_id, item):
+        work_queue = self.queues[hash(device_id) % len(self.queues)]
+        try:
+            work_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def depth(self):
+        return sum(work_queue.qsize() for work_queue in self.queues)
+
+    def join(self):
+        """Wait until every queued message has been handled"""
+        for work_queue in self.queues:
+            work_queue.join()
+
+    def _run_worker(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                work_queue.task_done()
+                return
+            try:
+                topic_router.run(*item)
+            finally:
+                work_queue.task_done()
+
+
+class TopicRouter:
+    """Registry of MQTT topic handlers dispatched onto worker lanes.
+
+    Handlers are registered with @topic_router.route(topic_filter, lane)
+    and receive (topic, device_id, data). handle_mqtt_message only decodes
+    the payload and enqueues it, so database work, publishes and Socket.IO
+    emits run on the lanes instead of the MQTT network greenlet. The lanes
+    are green threads too; see WorkerLane for what that does and does not
+    isolate.
+    """
+    def __init__(self, lanes, max_queue):
+        self.trie = TopicTrie()
+        self.lanes = {name: WorkerLane(name, workers, max_queue)
+                      for name, workers in lanes.items()}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.observer = None  # called with (topic_filter, seconds since receipt, failed) after each message
+
+    def route(self, topic_filter, lane):
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown worker lane: {lane}")
+
+        def decorator(handler):
+            self.trie.insert(topic_filter.lower(), (topic_filter.lower(), lane, handler))
+            return handler
+        return decorator
+
+    def start(self):
+        for lane in self.lanes.values():
+            lane.start()
+
+    def stop(self):
+        for lane in self.lanes.values():
+            lane.stop()
+
+    def join(self):
+        for lane in self.lanes.values():
+            lane.join()
+
+    def dispatch(self, topic, device_id, data, received_at=None):
+        """Enqueue a message for every matching handler; False if none matched"""
+        routes = self.trie.match(topic)
+        queued_at = received_at if received_at is not None else time_module.monotonic()
+        for topic_filter, lane, handler in routes:
+            queued = self.lanes[lane].submit(
+                device_id, (topic_filter, handler, topic, device_id, data, queued_at))
+            if not queued:
+                mqtt_log.warning("%s lane full, dropped message on %s from %s", lane, topic, device_id)
+        return bool(routes)
+
+    def run(self, topic_filter, handler, topic, device_id, data, queued_at):
+        started = time_module.monotonic()
+        failed = False
+        try:
+            handler(topic, device_id, data)
+        except Exception as e:
+            failed = True
+            mqtt_log.exception("Error handling message on %s: %s", topic, e)
+        finished = time_module.monotonic()
+
+        with self.stats_lock:
+            stats = self.stats.setdefault(topic_filter, {
+                'count': 0, 'errors': 0, 'wait_total': 0.0,
+                'handler_total': 0.0, 'handler_max': 0.0
+            })
+            stats['count'] += 1
+            stats['errors'] += failed
+            stats['wait_total'] += started - queued_at
+            stats['handler_total'] += finished - started
+            stats['handler_max'] = max(stats['handler_max'], finished - started)
+        if self.observer is not None:
+            self.observer(topic_filter, finished - queued_at, failed)
+
+    def get_stats(self):
+        with self.stats_lock:
+            topics = {
+                topic_filter: {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'avg_wait_ms': round(stats['wait_total'] / stats['count'] * 1000, 3),
+                    'avg_handler_ms': round(stats['handler_total'] / stats['count'] * 1000, 3),
+                    'max_handler_ms': round(stats['handler_max'] * 1000, 3)
+                }
+                for topic_filter, stats in self.stats.items()
+            }
+        lanes = {
+            name: {'workers': len(lane.queues), 'depth': lane.depth(), 'dropped': lane.dropped}
+            for name, lane in self.lanes.items()
+        }
+        return {'lanes': lanes, 'topics': topics}
+
+
+topic_router = TopicRouter(
+    lanes=app.config['MQTT_WORKER_LANES'],
+    max_queue=app.config['MQTT_LANE_QUEUE_SIZE']
+)
+
+
+@topic_router.route('mynode/auth', lane='auth')
+def route_sensor_auth(topic, device_id, data):
+    if data.get('action') == 'auth_request':
+        handle_sensor_request(device_id, data)
+
+@topic_router.route('mynode/pump_auth', lane='auth')
+def route_pump_auth(topic, device_id, data):
+    if device_id.startswith('PUMP_'):
+        handle_pump_auth(device_id, data)
+
+@topic_router.route('mynode/telemetry', lane='telemetry')
+@topic_router.route('mynode/temperature', lane='telemetry')
+@topic_router.route('mynode/moisture', lane='telemetry')
+def route_sensor_data(topic, device_id, data):
+    handle_sensor_data(topic, device_id, data)
+
+@topic_router.route('mynode/telemetry/batch', lane='telemetry')
+def route_sensor_batch(topic, device_id, data):
+    handle_sensor_batch(device_id, data)
+
+@topic_router.route('mynode/water_level', lane='pump')
+def route_water_level(topic, device_id, data):
+    if device_id.startswith('PUMP_'):
+        handle_water_level(device_id, data)
+
+@topic_router.route('mynode/pump_status', lane='pump')
+def route_pump_status(topic, device_id, data):
+    if device_id.startswith('PUMP_'):
+        handle_pump_status(device_id, data)
+
+@topic_router.route('mynode/default/config/sleep', lane='config')
+def route_sleep_config(topic, device_id, data):
+    handle_sleep_config(device_id, data.get('action'), data)
+
+
+# Compact binary payloads
+# Devices may send a MessagePack map with the short keys below and an integer
+# epoch timestamp instead of JSON. It is decoded when the topic ends in
+# BINARY_TOPIC_SUFFIX (e.g. mynode/temperature/mp) or when the first byte is a
+# MessagePack map header, and expanded into the same dict as the JSON form.
+# The timestamp stays an epoch number; handlers read it with payload_timestamp().
+BINARY_TOPIC_SUFFIX = '/mp'
+
+PAYLOAD_FIELD_CODES = {
+    'd': 'device_id',
+    'ts': 'timestamp',
+    'T': 'temperature',
+    'M': 'moisture',
+    'W': 'water_level',
+    'v': 'value',
+    'a': 'action',
+    's': 'status',
+    'r': 'readings',
+    'q': 'seq',
+}
+
+def is_msgpack_map(payload):
+    """True for a fixmap (0x80-0x8f), map16 (0xde) or map32 (0xdf) header"""
+    return bool(payload) and (0x80 <= payload[0] <= 0x8f or payload[0] in (0xde, 0xdf))
+
+def decode_compact_payload(payload):
+    """MessagePack payload -> the dict the JSON path would have produced"""
+    data = expand_field_codes(msgpack.unpackb(payload))
+    readings = data.get('readings')
+    if isinstance(readings, list):
+        # Batch uploads carry a list of compact readings
+        data['readings'] = [expand_field_codes(entry) if isinstance(entry, dict) else entry
+                            for entry in readings]
+    return data
+
+def expand_field_codes(data):
+    return {PAYLOAD_FIELD_CODES.get(key, key): value for key, value in data.items()}
+
+def payload_timestamp(data):
+    """Device timestamp of a decoded payload as a naive UTC datetime, or None.
+
+    JSON payloads carry an ISO string (see parse_utc_isoformat), compact
+    ones epoch seconds. Raises ValueError/TypeError for a malformed value.
+    """
+    timestamp = data.get('timestamp')
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+    return parse_utc_isoformat(timestamp)
+
+def decode_payload(topic, payload):
+    """Decode a JSON or compact binary payload; returns (topic without suffix, data)"""
+    if topic.endswith(BINARY_TOPIC_SUFFIX):
+        return topic[:-len(BINARY_TOPIC_SUFFIX)], decode_compact_payload(payload)
+    if is_msgpack_map(payload):
+        return topic, decode_compact_payload(payload)
+    return topic, json.loads(payload)
+
+
+# Traffic capture
+CAPTURE_MAGIC = b'MQTTCAP1'
+CAPTURE_RECORD = struct.Struct('<dHI')  # receive time (epoch seconds), topic length, payload length
+
+class MessageCapture:
+    """Append-only recording of received MQTT messages for `flask replay-capture`.
+
+    The file starts with CAPTURE_MAGIC, then each message is a CAPTURE_RECORD
+    header followed by the UTF-8 topic and the raw payload. record() only
+    queues the message and a writer thread appends it, so the MQTT network
+    thread never waits on disk; when the queue is full messages are dropped
+    and counted.
+    """
+    def __init__(self, path=None, max_queue=10000):
+        self.path = path
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.running = False
+        self.thread = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self):
+        if not self.path or self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='mqtt-capture', daemon=True)
+        self.thread.start()
+        storage_log.info("Capturing MQTT traffic to %s", self.path)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def record(self, topic, payload):
+        try:
+            self.queue.put_nowait((time_module.time(), topic, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, 'ab') as capture_file:
+            if capture_file.tell() == 0:
+                capture_file.write(CAPTURE_MAGIC)
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                received, topic, payload = item
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                topic_bytes = topic.encode('utf-8')
+                capture_file.write(CAPTURE_RECORD.pack(received, len(topic_bytes), len(payload)))
+                capture_file.write(topic_bytes)
+                capture_file.write(payload)
+                self.recorded += 1
+                if self.queue.empty():
+                    capture_file.flush()
+
+    def stats(self):
+        return {
+            'file': self.path,
+            'running': self.running,
+            'recorded': self.recorded,
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped
+        }
+
+
+def read_capture(path):
+    """Yield (receive time, topic, payload) from a capture file, stopping at a truncated tail"""
+    with open(path, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f'{path} is not an MQTT capture file')
+        while True:
+            header = capture_file.read(CAPTURE_RECORD.size)
+            if len(header) < CAPTURE_RECORD.size:
+                return
+            received, topic_length, payload_length = CAPTURE_RECORD.unpack(header)
+            topic = capture_file.read(topic_length)
+            payload = capture_file.read(payload_length)
+            if len(topic) < topic_length or len(payload) < payload_length:
+                return
+            yield received, topic.decode('utf-8'), payload
+
+
+message_capture = MessageCapture(
+    path=app.config['MQTT_CAPTURE_FILE'],
+    max_queue=app.config['MQTT_CAPTURE_QUEUE_SIZE']
+)
+
+
 @mqtt.on_message()
 def handle_mqtt_message(client, userdata, message):
     """
-    Handle incoming MQTT messages for both sensors and pumps.
+    Decode incoming MQTT messages and hand them to the topic router.
+    Runs on the MQTT network thread, so nothing here may block.
     """
+    received_at = time_module.monotonic()
     try:
-        print(f"\n[MQTT] Received message on topic: {message.topic}")
+        mqtt_log.debug("Received message on topic: %s", message.topic)
+        if message_capture.running:
+            message_capture.record(message.topic, message.payload)
         
-        # Parse payload
+        # Parse payload (JSON or compact binary)
+        payload = message.payload
+        mqtt_log.debug("Raw payload: %s", payload)
         try:
-            payload = message.payload.decode()
-            print(f"[MQTT] Raw payload: {payload}")
-            data = json.loads(payload)
-        except json.JSONDecodeError:
-            print(f"[ERROR] Invalid JSON payload: {payload}")
+            topic, data = decode_payload(message.topic.lower(), payload)  # Normalize topic case
+        except (ValueError, msgpack.UnpackException) as e:
+            # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+            mqtt_log.warning("Invalid payload on %s: %s (%s)", message.topic, payload, e)
             return
         except Exception as e:
-            print(f"[ERROR] Error decoding message: {str(e)}")
+            mqtt_log.error("Error decoding message: %s", e)
             return
 
         # Get device ID from payload
-        device_id = data.get('device_id')
-        if not device_id:
-            print("[ERROR] No device_id in message")
+        if not isinstance(data, dict) or not data.get('device_id'):
+            mqtt_log.warning("No device_id in message")
             return
+        device_id = data['device_id']
 
-        # Handle messages based on topic
-        topic = message.topic.lower()  # Normalize topic case
+        if not topic_router.dispatch(topic, device_id, data, received_at):
+            mqtt_log.debug("No handler for topic: %s", message.topic)
 
-        # Handle sensor auth
-        if topic == 'mynode/auth':
-            if data.get('action') == 'auth_request':
-                handle_sensor_request(device_id, data)
-            return
+    except Exception as e:
+        mqtt_log.exception("Error processing message: %s", e)
 
-        # Handle pump auth
-        if topic == 'mynode/pump_auth':
-            if device_id.startswith('PUMP_'):
-                handle_pump_auth(device_id, data)
-            return
+# Flask-MQTT connects while this module is still being imported; with a
+# nearby broker the CONNACK can arrive before handle_connect is registered,
+# which would leave the server without subscriptions
+if mqtt.connected:
+    handle_connect(mqtt.client, None, None, 0)
 
-        # Handle sensor readings
-        if topic in ['mynode/temperature', 'mynode/moisture']:
-            handle_sensor_data(topic, device_id, data)
-            return
 
-        # Handle pump readings/status
-        if topic == 'mynode/water_level':
-            if device_id.startswith('PUMP_'):
-                handle_water_level(device_id, data)
-            return
+# Query plan regression checks
+# (caller, sql, params, scans that are expected because the table is small or
+# the scan is an index walk bounded by LIMIT)
+QUERY_PLAN_CHECKS = [
+    ('get_all_sensors', SENSOR_DEVICES_SQL, (), {'SCAN d'}),
+    ('discovery', UNCLAIMED_DEVICES_SQL, (), {'SCAN ds'}),
+    ('LatestValueCache.get', LATEST_READING_SQL, ('Sensor32_A1B2C3', 'temperature'), set()),
+    ('LatestValueCache.seed', SEED_LATEST_SQL, (),
+        {'SCAN d USING COVERING INDEX sqlite_autoindex_device_settings_1', 'SCAN types'}),
+    ('get_sensor_readings(sensor_id)', SENSOR_READINGS_BY_DEVICE_SQL, ('Sensor32_A1B2C3', 10), set()),
+    ('get_sensor_readings()', SENSOR_READINGS_SQL, (10,),
+        {'SCAN sr USING INDEX idx_sensor_readings_time'}),
+    ('get_pump_readings(pump_id)', PUMP_READINGS_BY_PUMP_SQL, ('PUMP_1234', 100), set()),
+    ('get_pump_readings()', PUMP_READINGS_SQL, (100,), set()),
+    ('get_latest_pump_readings', LATEST_PUMP_READINGS_SQL, (), {'SCAN p'}),
+    ('RuleIndex.rebuild', ACTIVE_RULES_SQL, (), {'SCAN pump_rules'}),
+    ('get_pump_rules', PUMP_RULES_SQL, ('PUMP_1234',), set()),
+    ('get_rule_history', RULE_HISTORY_SQL, ('PUMP_1234',), set()),
+    ('load_existing_schedules', NEXT_ONE_SHOT_PER_PUMP_SQL, ('2025-01-01', '2025-01-01', '08:00'),
+     {'SCAN p USING COVERING INDEX sqlite_autoindex_pumps_1'}),
+    ('load_existing_schedules', RECURRING_SCHEDULES_SQL, (),
+     {'SCAN schedules USING INDEX idx_schedules_recurring'}),
+    ('PumpScheduler.arm', NEXT_ONE_SHOT_SQL, ('PUMP_1234', '2025-01-01', '2025-01-01', '08:00'), set()),
+    ('PumpScheduler.arm', PUMP_RECURRING_SCHEDULES_SQL, ('PUMP_1234',), set()),
+    ('load_pump_timers', PUMP_TIMERS_SQL, (), {'SCAN pump_timers'}),
+    ('get_schedules', PUMP_SCHEDULES_SQL, ('PUMP_1234',), set()),
+    ('add_schedule/delete_schedule', SCHEDULE_EXISTS_SQL, ('PUMP_1234', '2025-01-01', '08:00'), set()),
+    ('get_reading_series', SENSOR_READINGS_RANGE_SQL, ('Sensor32_A1B2C3', '2025-01-01', '2025-01-02'), set()),
+    ('get_rollup_readings', ROLLUP_RANGE_SQL, ('Sensor32_A1B2C3', 'temperature', '1h', 0, 86400), set()),
+    ('RetentionPurger (readings)', purge_sql('sensor_readings', 'timestamp < ?'), ('2025-01-01', 2000), set()),
+    ('RetentionPurger (rule actions)', purge_sql('rule_actions', 'executed_at < ?'), ('2025-01-01', 2000), set()),
+    ('RetentionPurger (rollups)', purge_sql('sensor_rollups', 'resolution = ? AND bucket_start < ?'),
+     ('1m', 0, 2000), set()),
+    ('delete_sensor', purge_sql('sensor_readings', 'device_id = ? AND id <= ?'),
+     ('Sensor32_A1B2C3', 1000, 2000), set()),
+    ('delete_sensor', purge_sql('sensor_rollups', 'device_id = ? AND id <= ?'),
+     ('Sensor32_A1B2C3', 1000, 2000), set()),
+    ('ReadingArchive.archive_expired', ARCHIVE_OLDEST_SQL, (), set()),
+    ('ReadingArchive.archive_day', ARCHIVE_DAY_SQL, ('2025-01-01', '2025-01-02'), set()),
+    ('get_sensor_readings (archive)', SENSOR_INFO_SQL, (), {'SCAN ds'}),
+    ('get_pump_readings (archive)', PUMP_INFO_SQL, (), {'SCAN pumps'}),
+]
+
+def find_full_scans(conn, sql, params, expected_scans=()):
+    """Return the EXPLAIN QUERY PLAN steps that scan a table instead of searching an index"""
+    scans = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+        detail = row[-1]
+        if detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW' and detail not in expected_scans:
+            scans.append(detail)
+    return scans
+
+def check_query_plans(database=':memory:'):
+    """Build the schema in database and return (caller, unexpected scans) for every QUERY_PLAN_CHECKS entry"""
+    conn = sqlite3.connect(database)
+    try:
+        create_schema(conn.cursor())
+        return [(caller, find_full_scans(conn, sql, params, expected_scans))
+                for caller, sql, params, expected_scans in QUERY_PLAN_CHECKS]
+    finally:
+        conn.close()
 
-        if topic == 'mynode/pump_status':
-            if device_id.startswith('PUMP_'):
-                handle_pump_status(device_id, data)
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any production query would scan a whole table"""
+    failed = False
+    for caller, scans in check_query_plans():
+        if scans:
+            failed = True
+            print(f"[FAIL] {caller}: {'; '.join(scans)}")
+        else:
+            print(f"[OK]   {caller}")
+
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('compact-db')
+def compact_db_command():
+    """Switch an existing database to incremental auto-vacuum (one-off full VACUUM)"""
+    init_db()
+    with get_db(write=True) as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            print("[VACUUM] Incremental auto-vacuum is already enabled")
             return
+        print("[VACUUM] Rebuilding the database, this locks it until finished...")
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    print("[VACUUM] Done, the retention purger will now return freed space")
+
+@app.cli.command('backfill-rollups')
+@click.option('--chunk-size', default=50000, show_default=True,
+              help='sensor_readings rows aggregated per transaction')
+def backfill_rollups_command(chunk_size):
+    """Rebuild sensor_rollups from the existing sensor_readings history"""
+    init_db()
+    # Clear and snapshot in one write transaction: rows after max_id are
+    # rolled up by the live ingest path, everything up to it is done here
+    with get_db(write=True) as conn:
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sensor_readings').fetchone()[0]
+        conn.execute('DELETE FROM sensor_rollups')
+
+    last_id = 0
+    processed = 0
+    while last_id < max_id:
+        with get_db(write=True) as conn:
+            rows = conn.execute('''
+                SELECT id, device_id, sensor_type, value, timestamp
+                FROM sensor_readings
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, max_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            update_rollups(conn, [(r['device_id'], r['sensor_type'], r['value'], r['timestamp'])
+                                  for r in rows if r['timestamp']])
+        last_id = rows[-1]['id']
+        processed += len(rows)
+        print(f"[ROLLUP] Backfilled {processed} readings (up to id {last_id} of {max_id})")
+
+    print(f"[ROLLUP] Backfill complete: {processed} readings")
+
+CapturedMessage = namedtuple('CapturedMessage', 'topic payload')
+
+@app.cli.command('replay-capture')
+@click.argument('capture_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--speed', default='1', show_default=True,
+              help='Playback rate relative to the recording (1, 10, ...) or "max" for as fast as possible')
+@click.option('--database', default='replay.db', show_default=True,
+              help='SQLite file the replayed traffic is written to')
+def replay_capture_command(capture_file, speed, database):
+    """Play a capture through the ingestion pipeline and report throughput and handler latency"""
+    if speed == 'max':
+        rate = None
+    else:
+        try:
+            rate = float(speed)
+        except ValueError:
+            rate = 0
+        if rate <= 0:
+            raise click.BadParameter('must be a positive number or "max"', param_hint='--speed')
+
+    # Keep the replay away from the live database and devices: the broker
+    # connection is closed and outgoing publishes are only counted
+    db_pool.close_all()
+    db_pool.database = database
+    app.config['DATABASE'] = database
+    mqtt.client.loop_stop()
+    mqtt.client.disconnect()
+    outbound = {}
+
+    def count_publish(topic, payload=None, qos=0, retain=False):
+        outbound[topic] = outbound.get(topic, 0) + 1
+        return 0, 0
+    mqtt.publish = count_publish
+
+    latencies = []
+    errors = []
+    topic_router.observer = lambda topic_filter, latency, failed: (errors if failed else latencies).append(latency)
 
-        # Handle sleep config
-        if topic == 'mynode/default/config/sleep':
-            handle_sleep_config(device_id, data.get('action'), data)
+    init_db()
+    latest_cache.seed()
+    rule_index.rebuild()
+    timer_service.start()
+    ingest_queue.start()
+    topic_router.start()
+    # With "max" the replay waits for the workers instead of overflowing their queues
+    max_depth = app.config['MQTT_LANE_QUEUE_SIZE'] // 2
+
+    messages = 0
+    first_received = last_received = None
+    started = time_module.monotonic()
+    for received, topic, payload in read_capture(capture_file):
+        if first_received is None:
+            first_received = received
+        last_received = received
+        if rate is not None:
+            delay = started + (received - first_received) / rate - time_module.monotonic()
+            if delay > 0:
+                time_module.sleep(delay)
+        else:
+            while any(lane.depth() > max_depth * len(lane.queues) for lane in topic_router.lanes.values()):
+                time_module.sleep(0.001)
+        handle_mqtt_message(None, None, CapturedMessage(topic, payload))
+        messages += 1
+        if messages % 1000 == 0:
+            print(f"[REPLAY] {messages} messages sent")
+    topic_router.join()
+    elapsed = time_module.monotonic() - started
+    ingest_queue.stop()
+    timer_service.stop()
+    topic_router.stop()
+
+    if not messages:
+        print("[REPLAY] Capture is empty")
+        return
+    recorded_span = last_received - first_received
+    print(f"[REPLAY] {messages} messages in {elapsed:.2f}s: {messages / elapsed:.1f} msg/s "
+          f"(recorded over {recorded_span:.1f}s, {messages / recorded_span if recorded_span else 0:.1f} msg/s)")
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        print(f"[REPLAY] Handler latency over {len(latencies)} handled: p50 {p50:.2f} ms, p90 {p90:.2f} ms, "
+              f"p99 {p99:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+    dropped = sum(lane.dropped for lane in topic_router.lanes.values())
+    print(f"[REPLAY] Handler errors: {len(errors)}, dropped (lane full): {dropped}")
+    for topic_filter, stats in sorted(topic_router.get_stats()['topics'].items()):
+        print(f"[REPLAY]   {topic_filter}: {stats['count']} messages, avg wait {stats['avg_wait_ms']} ms, "
+              f"avg handler {stats['avg_handler_ms']} ms")
+    print(f"[REPLAY] Publishes suppressed: {sum(outbound.values())} "
+          f"({', '.join(f'{topic} x{count}' for topic, count in sorted(outbound.items())) or 'none'})")
+
+
+# Background services
+background_services_lock = threading.Lock()
+background_services_started = False
+
+def start_background_services():
+    """Create the schema, load state and start every worker thread; safe to call more than once"""
+    global background_services_started
+    with background_services_lock:
+        if background_services_started:
             return
+        background_services_started = True
+        init_db()
+        atexit.register(db_pool.close_all)
+        latest_cache.seed()
+        rule_index.rebuild()
+        load_pump_timers()
+        pump_scheduler.load_existing_schedules()
+        timer_service.start()
+        atexit.register(timer_service.stop)
+        ingest_queue.start()
+        atexit.register(ingest_queue.stop)
+        topic_router.start()
+        atexit.register(topic_router.stop)
+        message_capture.start()
+        atexit.register(message_capture.stop)
+        reading_archive.remove_partial_files()
+        retention_purger.start()
+        atexit.register(retention_purger.stop)
+        live_broadcaster.start()
 
-    except Exception as e:
-        print(f"[ERROR] Error processing message: {str(e)}")
-        import traceback
-        traceback.print_exc()
+def is_maintenance_command():
+    """True when imported by a `flask` CLI command other than `flask run`.
+
+    Flask loads the app inside the click context of the command being run;
+    `flask run` loads it from its own callback, every other command while
+    the `flask` group resolves the subcommand. Without a click context the
+    app was imported by `python app.py`, a WSGI server or a script. The
+    watcher process of `flask run --reload` serves nothing and counts as
+    maintenance too; its reloaded child starts the services.
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is None:
+        return False
+    if ctx.command.name != 'run':
+        return True
+    reload = ctx.params.get('reload')
+    if reload is None:
+        reload = get_debug_flag()
+    return bool(reload) and not is_running_from_reloader()
+
+# `python app.py`, `flask run` and WSGI servers all need the services as soon
+# as the module is loaded, since MQTT messages arrive before any request.
+# Maintenance commands (check-query-plans, replay-capture, ...) import the app
+# too but must not consume live traffic or fire pump timers.
+if app.config['BACKGROUND_SERVICES'] and not is_maintenance_command():
+    start_background_services()
 
 
 if __name__ == '__main__':
-    init_db()
-    pump_scheduler = PumpScheduler()
-    pump_scheduler.start()
-    socketio.run(app, host='0.0.0.0', port=5000, use_reloader=False, debug=True )
+    start_background_services()
+
+    # SIGTERM (service stop, benchmark teardown) leaves socketio.run in the
+    # main greenlet, so the atexit handlers above still flush buffered
+    # readings; a plain signal handler would raise in whichever green
+    # thread happens to be running
+    main_greenlet = eventlet.getcurrent()
+    signal.signal(signal.SIGTERM, lambda signum, frame: eventlet.hubs.get_hub().schedule_call_global(
+        0, main_greenlet.throw, SystemExit(0)))
+    socketio.run(app, host='0.0.0.0', port=app.config['HTTP_PORT'], use_reloader=False, debug=True )
     
@@ -0,0 +1,53 @@
+"""
+Shared fixtures: app.py is imported once per session against
+mini_broker.MiniBroker and a scratch database, exactly as a WSGI server
+would import it (no __main__ block).
+"""
+import os
+import sys
+import time
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.join(SERVER_DIR, 'Testing_system codes'))
+
+from mini_broker import MiniBroker
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    broker = MiniBroker()
+    port = broker.start()
+    workdir = tmp_path_factory.mktemp('server')
+    os.environ.update(FLASK_MQTT_BROKER_URL='127.0.0.1', FLASK_MQTT_BROKER_PORT=str(port),
+                      FLASK_DATABASE=str(workdir / 'sensor_data.db'),
+                      FLASK_ARCHIVE_DIR=str(workdir / 'archive'))
+    import app
+    yield app
+    # The log listener and the atexit shutdown outlive pytest's output capture
+    for handler in app.log_listener.handlers:
+        handler.setStream(sys.__stderr__)
+
+
+@pytest.fixture
+def client(server):
+    """Test client logged in as the default admin"""
+    client = server.app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def wait_for():
+    """Poll a condition until it returns something truthy or the timeout passes"""
+    def wait(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while True:
+            result = condition()
+            if result or time.monotonic() > deadline:
+                return result
+            time.sleep(0.05)
+    return wait
@@ -0,0 +1,78 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+DEVICE_ID = 'Sensor32_ARCHIVE'
+DAY = date(2019, 6, 1)
+
+
+@pytest.fixture
+def archive(server, tmp_path):
+    if server.pa is None:
+        pytest.skip('pyarrow is not installed')
+    return server.ReadingArchive(str(tmp_path / 'archive'), after_days=14, chunk_size=2, pause=0)
+
+
+@pytest.fixture
+def archived_day(server, archive):
+    with server.get_db(write=True) as conn:
+        conn.executemany('INSERT INTO sensor_readings (device_id, sensor_type, value, timestamp) VALUES (?, ?, ?, ?)', [
+            (DEVICE_ID, 'temperature', 20.5, '2019-06-01 08:00:00'),
+            (DEVICE_ID, 'moisture', 40.0, '2019-06-01 08:00:00'),
+            (DEVICE_ID, 'temperature', 22.0, '2019-06-01 12:30:00'),
+        ])
+        conn.commit()
+    assert archive.archive_day(DAY) == 3
+    return DAY
+
+
+def test_archived_readings_leave_sqlite(server, archived_day):
+    with server.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sensor_readings WHERE device_id = ?',
+                            (DEVICE_ID,)).fetchone()[0] == 0
+
+
+def test_read_range_round_trip(archive, archived_day):
+    points = archive.read_range(DEVICE_ID, datetime(2019, 6, 1), datetime(2019, 6, 2))
+    assert points == {
+        'temperature': [(1559376000, 20.5), (1559392200, 22.0)],
+        'moisture': [(1559376000, 40.0)],
+    }
+    # The end is exclusive and other devices have nothing
+    assert archive.read_range(DEVICE_ID, datetime(2019, 6, 1, 9), datetime(2019, 6, 1, 12, 30)) == {}
+    assert archive.read_range('Sensor32_OTHER', datetime(2019, 6, 1), datetime(2019, 6, 2)) == {}
+
+
+def test_latest_round_trip(archive, archived_day):
+    readings = archive.latest(2)
+    assert [(reading['device_id'], reading['sensor_type'], reading['value'], reading['timestamp'])
+            for reading in readings] == [
+        (DEVICE_ID, 'temperature', 22.0, '2019-06-01 12:30:00'),
+        (DEVICE_ID, 'temperature', 20.5, '2019-06-01 08:00:00'),
+    ]
+    assert [reading['value'] for reading in archive.latest(10, sensor_type='moisture')] == [40.0]
+    assert archive.latest(10, device_ids={'Sensor32_OTHER'}) == []
+
+
+def test_partition_left_by_a_crash_is_skipped_then_removed(archive, archived_day):
+    crashed = archive._device_dir(DAY, 'Sensor32_CRASHED')
+    os.makedirs(crashed)
+    open(os.path.join(crashed, 'part-1.parquet.tmp'), 'wb').close()
+
+    assert archive.read_range('Sensor32_CRASHED', datetime(2019, 6, 1), datetime(2019, 6, 2)) == {}
+    assert len(archive.latest(10)) == 3
+
+    assert archive.remove_partial_files() == 1
+    assert not os.path.exists(crashed)
+    assert os.path.isdir(archive._device_dir(DAY, DEVICE_ID))
+
+
+def test_days_past_retention_are_dropped(archive, archived_day):
+    # A day goes only once all of it is past the cutoff, here 2019-06-01 12:00
+    assert archive.drop_expired(30, now=datetime(2019, 7, 1, 12)) == 0
+    assert archive.days() == [DAY]
+    assert archive.drop_expired(None, now=datetime(2030, 1, 1)) == 0
+    assert archive.drop_expired(30, now=datetime(2019, 7, 2)) == 1
+    assert archive.days() == []
+    assert archive.read_range(DEVICE_ID, datetime(2019, 6, 1), datetime(2019, 6, 2)) == {}
@@ -0,0 +1,39 @@
+import click
+
+
+def test_import_starts_the_ingest_writer(server, wait_for):
+    assert server.background_services_started
+    server.ingest_queue.put('Sensor32_IMPORT', 'temperature', 21.5)
+
+    def stored():
+        with server.get_db() as conn:
+            return conn.execute('''
+                SELECT value FROM sensor_readings
+                WHERE device_id = ? AND sensor_type = ?
+            ''', ('Sensor32_IMPORT', 'temperature')).fetchone()
+
+    row = wait_for(stored)
+    assert row is not None and row['value'] == 21.5
+
+
+def test_import_starts_the_mqtt_workers(server):
+    assert all(lane.threads for lane in server.topic_router.lanes.values())
+
+
+def test_start_is_idempotent(server):
+    threads = {name: list(lane.threads) for name, lane in server.topic_router.lanes.items()}
+    server.start_background_services()
+    assert {name: lane.threads for name, lane in server.topic_router.lanes.items()} == threads
+
+
+def test_only_the_serving_paths_start_services(server):
+    assert server.is_maintenance_command() is False  # python app.py, WSGI servers, scripts
+    with click.Context(click.Command('check-query-plans'), info_name='check-query-plans'):
+        assert server.is_maintenance_command() is True
+    with click.Context(click.Group('flask'), info_name='flask'):
+        assert server.is_maintenance_command() is True  # app loaded while resolving a subcommand
+    with click.Context(click.Command('run'), info_name='run') as ctx:
+        ctx.params = {'reload': False}
+        assert server.is_maintenance_command() is False
+        ctx.params = {'reload': True}
+        assert server.is_maintenance_command() is True   # the reloader's watcher process
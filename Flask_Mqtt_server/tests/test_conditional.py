@@ -0,0 +1,73 @@
+import gzip
+import json
+
+import pytest
+
+PUMP_ID = 'PUMP_ETAG'
+SCHEDULES_URL = f'/api/pump/{PUMP_ID}/schedules'
+
+
+@pytest.fixture
+def compress_everything(server, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'COMPRESS_MIN_SIZE', 0)
+
+
+def test_matching_etag_is_answered_with_304(client):
+    response = client.get(SCHEDULES_URL)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(SCHEDULES_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+
+def test_etag_changes_with_the_resource_version(server, client):
+    etag = client.get(SCHEDULES_URL).headers['ETag']
+    server.resource_versions.bump(f'schedules:{PUMP_ID}')
+    response = client.get(SCHEDULES_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_schedules_etag_turns_over_every_minute(server, client, monkeypatch):
+    now = 1_700_000_000 // 60 * 60
+    monkeypatch.setattr(server.time_module, 'time', lambda: now)
+    etag = client.get(SCHEDULES_URL).headers['ETag']
+    monkeypatch.setattr(server.time_module, 'time', lambda: now + 59)
+    assert client.get(SCHEDULES_URL, headers={'If-None-Match': etag}).status_code == 304
+    monkeypatch.setattr(server.time_module, 'time', lambda: now + 60)
+    assert client.get(SCHEDULES_URL, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_gzip_is_negotiated(client, compress_everything):
+    response = client.get(SCHEDULES_URL, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'].endswith('-gzip"')
+    assert json.loads(gzip.decompress(response.data)) == []
+
+    # The compressed ETag revalidates too
+    response = client.get(SCHEDULES_URL, headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_brotli_is_preferred_when_installed(server, client, compress_everything):
+    if server.brotli is None:
+        pytest.skip('brotli is not installed')
+    response = client.get(SCHEDULES_URL, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(server.brotli.decompress(response.data)) == []
+
+
+def test_no_accept_encoding_means_identity(client, compress_everything):
+    response = client.get(SCHEDULES_URL)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == []
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get(SCHEDULES_URL, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import msgpack
+
+
+def test_epoch_timestamp_is_naive_utc(server):
+    assert server.payload_timestamp({'timestamp': 1700000000}) == datetime(2023, 11, 14, 22, 13, 20)
+
+
+def test_iso_timestamps_are_converted_to_naive_utc(server):
+    assert server.payload_timestamp({'timestamp': '2023-11-14T22:13:20Z'}) == datetime(2023, 11, 14, 22, 13, 20)
+    assert server.payload_timestamp({'timestamp': '2023-11-15T00:13:20+02:00'}) == datetime(2023, 11, 14, 22, 13, 20)
+    assert server.payload_timestamp({'timestamp': '2023-11-14T22:13:20'}) == datetime(2023, 11, 14, 22, 13, 20)
+
+
+def test_missing_timestamp(server):
+    assert server.payload_timestamp({}) is None
+
+
+def test_compact_payload_expands_to_the_json_form(server):
+    topic, data = server.decode_payload('mynode/telemetry/mp',
+                                        msgpack.packb({'d': 'Sensor32_MP', 'ts': 1700000000, 'T': 21.5}))
+    assert topic == 'mynode/telemetry'
+    assert data == {'device_id': 'Sensor32_MP', 'timestamp': 1700000000, 'temperature': 21.5}
+
+
+def insert_pump(server, pump_id):
+    with server.get_db(write=True) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO pumps (pump_id, name, tank_shape, tank_length, tank_width, tank_height)
+            VALUES (?, ?, 'box', 100, 100, 100)
+        ''', (pump_id, pump_id))
+        conn.commit()
+
+
+def last_update(server, pump_id):
+    with server.get_db() as conn:
+        value = conn.execute('SELECT last_update FROM pumps WHERE pump_id = ?', (pump_id,)).fetchone()[0]
+    return datetime.fromisoformat(value)
+
+
+def test_water_level_timestamps_share_one_time_base(server):
+    insert_pump(server, 'PUMP_TIMES')
+
+    server.handle_water_level('PUMP_TIMES', {'water_level': 40, 'timestamp': 1700000000})
+    assert last_update(server, 'PUMP_TIMES') == datetime(2023, 11, 14, 22, 13, 20)
+
+    server.handle_water_level('PUMP_TIMES', {'water_level': 40, 'timestamp': '2023-11-14T22:13:20Z'})
+    assert last_update(server, 'PUMP_TIMES') == datetime(2023, 11, 14, 22, 13, 20)
+
+    server.handle_water_level('PUMP_TIMES', {'water_level': 40})
+    assert abs(last_update(server, 'PUMP_TIMES') - datetime.utcnow()) < timedelta(seconds=5)
@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def pump_rule(server):
+    with server.get_db(write=True) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO pumps (pump_id, name, tank_shape, tank_length, tank_width, tank_height, is_running)
+            VALUES ('PUMP_RULES', 'Rule pump', 'box', 100, 100, 100, FALSE)
+        ''')
+        cursor = conn.execute('''
+            INSERT INTO pump_rules (pump_id, sensor_id, threshold_value, reading_type,
+                                    comparison_type, action, duration)
+            VALUES ('PUMP_RULES', 'Sensor32_RULES', 30, 'temperature', 'above', 'on', 0)
+        ''')
+        conn.commit()
+        rule_id = cursor.lastrowid
+    server.rule_index.rebuild()
+    yield 'PUMP_RULES'
+    with server.get_db(write=True) as conn:
+        conn.execute('DELETE FROM pump_rules WHERE id = ?', (rule_id,))
+        conn.commit()
+    server.rule_index.rebuild()
+
+
+def test_rule_and_timer_switches_reach_open_pages(server, pump_rule, monkeypatch):
+    published = []
+    monkeypatch.setattr(server.state_notifier, 'publish',
+                        lambda event, payload, key=None: published.append((event, key, payload)))
+
+    server.check_pump_rules('Sensor32_RULES', 'temperature', 35)
+    assert [(event, key) for event, key, _ in published] == [('pump_status', pump_rule)]
+
+    published.clear()
+    server.turn_off_pump(pump_rule)
+    assert [(event, key) for event, key, _ in published] == [('pump_status', pump_rule)]
+
+
+def test_turn_off_timer_is_armed_only_after_commit(server, pump_rule):
+    with server.get_db(write=True) as conn:
+        conn.execute('UPDATE pumps SET is_running = FALSE WHERE pump_id = ?', (pump_rule,))
+        conn.commit()
+    server.timer_service.cancel(('pump_off', pump_rule))
+
+    with server.get_db(write=True) as conn:
+        off_at = server.schedule_pump_off(conn.cursor(), pump_rule, 600)
+        conn.rollback()
+    assert server.timer_service.cancel(('pump_off', pump_rule)) is False
+
+    with server.get_db(write=True) as conn:
+        conn.execute("UPDATE pump_rules SET duration = 10 WHERE pump_id = ?", (pump_rule,))
+        conn.commit()
+    server.rule_index.rebuild()
+    server.check_pump_rules('Sensor32_RULES', 'temperature', 35)
+    with server.get_db() as conn:
+        stored = conn.execute('SELECT off_at FROM pump_timers WHERE pump_id = ?', (pump_rule,)).fetchone()
+    assert stored is not None and stored['off_at'] >= off_at
+    assert server.timer_service.cancel(('pump_off', pump_rule)) is True
@@ -0,0 +1,15 @@
+import sqlite3
+
+
+def test_hot_queries_use_their_indexes(server, tmp_path):
+    results = server.check_query_plans(str(tmp_path / 'plans.db'))
+
+    assert len(results) == len(server.QUERY_PLAN_CHECKS)
+    failures = {caller: scans for caller, scans in results if scans}
+    assert not failures, f"queries scanning a whole table: {failures}"
+
+
+def test_full_scans_are_reported(server):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE readings (device_id TEXT, value REAL)')
+    assert server.find_full_scans(conn, 'SELECT value FROM readings WHERE device_id = ?', ('x',)) == ['SCAN readings']
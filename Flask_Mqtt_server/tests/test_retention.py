@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+DEVICE_ID = 'Sensor32_PURGE'
+
+
+@pytest.fixture
+def purger(server):
+    purger = server.RetentionPurger({}, chunk_size=3, pause=0)
+    purger.running = True  # purge() stops between chunks once the purger is stopped
+    return purger
+
+
+@pytest.fixture
+def chunks(server, monkeypatch):
+    """Rows deleted by each purge chunk of this test (the service's own purger runs on its thread)"""
+    counts = []
+    write = server.write_in_os_thread
+    test_thread = threading.get_ident()
+
+    def spy(conn, func, *args):
+        result = write(conn, func, *args)
+        if threading.get_ident() == test_thread:
+            counts.append(result)
+        return result
+    monkeypatch.setattr(server, 'write_in_os_thread', spy)
+    return counts
+
+
+def insert_readings(server, count, timestamp='2020-01-01 00:00:00'):
+    with server.get_db(write=True) as conn:
+        conn.execute('DELETE FROM sensor_readings WHERE device_id = ?', (DEVICE_ID,))
+        conn.executemany('INSERT INTO sensor_readings (device_id, sensor_type, value, timestamp) VALUES (?, ?, ?, ?)',
+                         [(DEVICE_ID, 'temperature', float(i), timestamp) for i in range(count)])
+        conn.commit()
+
+
+def remaining(server):
+    with server.get_db() as conn:
+        return conn.execute('SELECT COUNT(*) FROM sensor_readings WHERE device_id = ?', (DEVICE_ID,)).fetchone()[0]
+
+
+@pytest.mark.parametrize('rows, expected_chunks', [
+    (7, [3, 3, 1]),     # the last chunk ends mid-way and finishes the purge
+    (6, [3, 3, 0]),     # an exact multiple needs one empty chunk to notice
+    (2, [2]),
+    (0, [0]),
+])
+def test_purge_deletes_in_chunks(server, purger, chunks, rows, expected_chunks):
+    insert_readings(server, rows)
+    assert purger.purge('sensor_readings', 'device_id = ?', (DEVICE_ID,)) == rows
+    assert chunks == expected_chunks
+    assert remaining(server) == 0
+    assert purger.deleted.get('sensor_readings', 0) == rows
+
+
+def test_purge_leaves_rows_outside_the_condition(server, purger):
+    insert_readings(server, 5)
+    assert purger.purge('sensor_readings', 'device_id = ? AND value >= ?', (DEVICE_ID, 3.0)) == 2
+    assert remaining(server) == 3
+
+
+def test_stopped_purger_finishes_the_current_chunk_only(server, purger, chunks):
+    insert_readings(server, 7)
+    purger.running = False
+    assert purger.purge('sensor_readings', 'device_id = ?', (DEVICE_ID,)) == 0
+    assert chunks == []
+    assert remaining(server) == 7
+
+
+def test_retention_cutoff(server, purger, chunks):
+    purger.retention = {'sensor_readings': 30}
+    insert_readings(server, 4, timestamp='2024-01-01 00:00:00')
+    now = server.datetime(2024, 1, 31, 0, 0, 1)
+    [(table, where, params)] = purger.retention_tasks(now)
+    assert purger.purge(table, f'device_id = ? AND {where}', (DEVICE_ID,) + params) == 4
+
+    insert_readings(server, 4, timestamp='2024-01-01 00:00:01')
+    [(table, where, params)] = purger.retention_tasks(now)
+    assert purger.purge(table, f'device_id = ? AND {where}', (DEVICE_ID,) + params) == 0
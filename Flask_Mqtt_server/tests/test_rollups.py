@@ -0,0 +1,40 @@
+from datetime import datetime
+
+
+def rollup(server, device_id, resolution):
+    with server.get_db() as conn:
+        return [dict(row) for row in conn.execute('''
+            SELECT bucket_start, min_value, max_value, mean_value, count, last_value
+            FROM sensor_rollups WHERE device_id = ? AND sensor_type = 'temperature' AND resolution = ?
+            ORDER BY bucket_start
+        ''', (device_id, resolution))]
+
+
+def test_batches_merge_into_the_same_buckets(server):
+    with server.get_db(write=True) as conn:
+        server.write_sensor_readings(conn, [
+            ('Sensor32_ROLLUP', 'temperature', 20.0, '2024-03-01 10:00:10'),
+            ('Sensor32_ROLLUP', 'temperature', 24.0, '2024-03-01 10:00:50'),
+            ('Sensor32_ROLLUP', 'temperature', 30.0, '2024-03-01 10:01:05'),
+        ])
+        conn.commit()
+    with server.get_db(write=True) as conn:
+        # A later batch, with a reading older than the bucket's last one
+        server.write_sensor_readings(conn, [('Sensor32_ROLLUP', 'temperature', 16.0, '2024-03-01 10:00:30')])
+        conn.commit()
+
+    minute = server.to_epoch('2024-03-01 10:00:00')
+    assert rollup(server, 'Sensor32_ROLLUP', '1m') == [
+        {'bucket_start': minute, 'min_value': 16.0, 'max_value': 24.0, 'mean_value': 20.0,
+         'count': 3, 'last_value': 24.0},
+        {'bucket_start': minute + 60, 'min_value': 30.0, 'max_value': 30.0, 'mean_value': 30.0,
+         'count': 1, 'last_value': 30.0},
+    ]
+    hour, = rollup(server, 'Sensor32_ROLLUP', '1h')
+    assert (hour['bucket_start'], hour['count'], hour['mean_value']) == (minute, 4, 22.5)
+
+
+def test_range_queries_pick_the_finest_rollup_that_fits(server):
+    assert server.pick_rollup_resolution(datetime(2024, 3, 1), datetime(2024, 3, 2), max_rows=2000) == '1m'
+    assert server.pick_rollup_resolution(datetime(2024, 3, 1), datetime(2024, 3, 8), max_rows=2000) == '1h'
+    assert server.pick_rollup_resolution(datetime(2024, 1, 1), datetime(2025, 1, 1), max_rows=2000) == '1d'
@@ -0,0 +1,47 @@
+import pytest
+
+RULES = [  # (comparison, threshold, is_active)
+    ('above', 30, True),
+    ('above', 35, True),
+    ('below', 15, True),
+    ('below', 10, True),
+    ('above', 20, False),
+]
+
+
+@pytest.fixture(scope='module')
+def rule_ids(server):
+    with server.get_db(write=True) as conn:
+        ids = [conn.execute('''
+            INSERT INTO pump_rules (pump_id, sensor_id, threshold_value, reading_type,
+                                    comparison_type, action, duration, is_active)
+            VALUES ('PUMP_INDEX', 'Sensor32_INDEX', ?, 'moisture', ?, 'on', 0, ?)
+        ''', (threshold, comparison, active)).lastrowid for comparison, threshold, active in RULES]
+        conn.commit()
+    server.rule_index.rebuild()
+    yield ids
+    with server.get_db(write=True) as conn:
+        conn.execute("DELETE FROM pump_rules WHERE pump_id = 'PUMP_INDEX'")
+        conn.commit()
+    server.rule_index.rebuild()
+
+
+@pytest.mark.parametrize('value, expected', [
+    (30, []),                 # 'above' is strict
+    (30.01, [0]),
+    (35, [0]),
+    (36, [0, 1]),
+    (25, []),                 # the inactive rule at 20 is not compiled
+    (15, []),                 # 'below' is strict
+    (14.99, [2]),
+    (10, [2]),
+    (9, [2, 3]),
+])
+def test_thresholds_on_the_boundary(server, rule_ids, value, expected):
+    matched = server.rule_index.match('Sensor32_INDEX', 'moisture', value)
+    assert [rule['id'] for rule in matched] == [rule_ids[i] for i in expected]
+
+
+def test_other_inputs_match_nothing(server, rule_ids):
+    assert server.rule_index.match('Sensor32_INDEX', 'temperature', 100) == []
+    assert server.rule_index.match('Sensor32_OTHER', 'moisture', 100) == []
@@ -0,0 +1,38 @@
+import json
+from datetime import timedelta
+
+
+def add_schedule(conn, pump_id, run_at, recurrence, duration):
+    return conn.execute('''
+        INSERT INTO schedules (pump_id, schedule_date, schedule_time, duration, recurrence)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (pump_id, run_at.strftime('%Y-%m-%d'), run_at.strftime('%H:%M'), duration, recurrence)).lastrowid
+
+
+def test_one_shot_on_the_minute_of_a_recurring_run_is_run_and_deleted(server, monkeypatch):
+    commands = []
+    monkeypatch.setattr(server.mqtt, 'publish',
+                        lambda topic, payload=None, qos=0, retain=False: commands.append((topic, json.loads(payload))))
+    run_at = (server.clock.now() + timedelta(hours=2)).replace(second=0, microsecond=0)
+    with server.get_db(write=True) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO pumps (pump_id, name, tank_shape, tank_length, tank_width, tank_height)
+            VALUES ('PUMP_SCHED', 'Scheduled pump', 'box', 100, 100, 100)
+        ''')
+        daily_id = add_schedule(conn, 'PUMP_SCHED', run_at - timedelta(days=1), 'daily', 5)
+        once_id = add_schedule(conn, 'PUMP_SCHED', run_at, 'once', 15)
+        conn.commit()
+
+    assert server.pump_scheduler.arm('PUMP_SCHED') == run_at
+    deadline, _, callback, _, kwargs = server.timer_service.timers[server.pump_scheduler.job_key('PUMP_SCHED')]
+    assert deadline == run_at.timestamp()
+    assert sorted(kwargs['due']) == sorted([(daily_id, 5, 'daily'), (once_id, 15, 'once')])
+
+    server.timer_service.cancel(server.pump_scheduler.job_key('PUMP_SCHED'))
+    assert callback(**kwargs)
+    with server.get_db() as conn:
+        remaining = [row['id'] for row in conn.execute('SELECT id FROM schedules WHERE pump_id = ?', ('PUMP_SCHED',))]
+    assert remaining == [daily_id]
+    assert {message['duration'] for _, message in commands if message.get('command') == 'on'} == {15}
+    server.timer_service.cancel(('pump_off', 'PUMP_SCHED'))
+    server.timer_service.cancel(server.pump_scheduler.job_key('PUMP_SCHED'))
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+
+def test_lttb_keeps_the_requested_number_of_points_and_both_ends(server):
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 25) + np.random.default_rng(1).normal(0, 0.1, 1000)
+
+    keep = server.lttb_indices(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+@pytest.mark.parametrize('threshold', [2, 1000, 5000])
+def test_lttb_returns_everything_when_there_is_nothing_to_drop(server, threshold):
+    x = np.arange(1000, dtype=np.float64)
+    assert len(server.lttb_indices(x, x, threshold)) == 1000
+
+
+@pytest.fixture(scope='module')
+def series_sensor(server):
+    now = datetime.utcnow().replace(microsecond=0)
+    with server.get_db(write=True) as conn:
+        server.write_sensor_readings(conn, [
+            ('Sensor32_SERIES', 'temperature', float(i % 17), (now - timedelta(seconds=5 * i)).strftime('%Y-%m-%d %H:%M:%S'))
+            for i in range(1, 501)
+        ])
+        conn.commit()
+    return 'Sensor32_SERIES'
+
+
+def get_series(client, sensor_id, **args):
+    return client.get('/api/get-readings', query_string={'sensor': sensor_id, **args})
+
+
+@pytest.mark.parametrize('max_points, expected', [(50, 50), (1, 3), (100000, 500)])
+def test_series_max_points(client, series_sensor, max_points, expected):
+    response = get_series(client, series_sensor, range='1h', max_points=max_points)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['resolution'] == 'raw'
+    temperature = body['series']['temperature']
+    assert len(temperature['timestamps']) == len(temperature['values']) == expected
+
+
+def test_series_accepts_utc_offsets(client, series_sensor):
+    end = datetime.utcnow() + timedelta(minutes=1)
+    response = get_series(client, series_sensor,
+                          start=(end - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                          end=(end + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M:%S+02:00'),
+                          max_points=50)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['end'] == end.strftime('%Y-%m-%d %H:%M:%S')
+    assert len(body['series']['temperature']['values']) == 50
+
+
+@pytest.mark.parametrize('args', [{'range': '5x'}, {'start': 'yesterday'},
+                                  {'start': '2024-03-02T00:00:00Z', 'end': '2024-03-01T00:00:00Z'}])
+def test_series_rejects_bad_ranges(client, series_sensor, args):
+    assert get_series(client, series_sensor, **args).status_code == 400
+
+
+def test_series_start_with_offset_and_default_end(client, series_sensor):
+    start = (datetime.utcnow() - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    response = get_series(client, series_sensor, start=start, max_points=50)
+    assert response.status_code == 200
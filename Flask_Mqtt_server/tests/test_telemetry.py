@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def acks(server, monkeypatch):
+    sent = []
+    monkeypatch.setattr(server.mqtt, 'publish',
+                        lambda topic, payload=None, qos=0, retain=False: sent.append((topic, json.loads(payload))))
+    return sent
+
+
+def test_repeated_telemetry_without_timestamp_is_stored_and_acked(server, acks, wait_for):
+    payload = {'device_id': 'Sensor32_REPEAT', 'temperature': 21.5, 'moisture': 40.0}
+    server.handle_sensor_data('mynode/telemetry', 'Sensor32_REPEAT', payload)
+    server.handle_sensor_data('mynode/telemetry', 'Sensor32_REPEAT', payload)
+
+    def stored():
+        with server.get_db() as conn:
+            return conn.execute('SELECT COUNT(*) FROM sensor_readings WHERE device_id = ?',
+                                ('Sensor32_REPEAT',)).fetchone()[0] == 4
+
+    assert wait_for(stored)
+    assert acks == [('mynode/ack', {'device_id': 'Sensor32_REPEAT', 'status': 'received'})] * 2
+
+
+def test_legacy_copy_on_the_other_topic_is_skipped_but_acked(server, acks, monkeypatch):
+    buffered = []
+    monkeypatch.setattr(server.ingest_queue, 'put_many', buffered.extend)
+    payload = {'device_id': 'Sensor32_LEGACY', 'temperature': 19.0, 'moisture': 55.0}
+
+    server.handle_sensor_data('mynode/temperature', 'Sensor32_LEGACY', payload)
+    server.handle_sensor_data('mynode/moisture', 'Sensor32_LEGACY', payload)
+    assert len(buffered) == 2
+
+    # The next report with unchanged values is a new reading
+    server.handle_sensor_data('mynode/temperature', 'Sensor32_LEGACY', payload)
+    assert len(buffered) == 4
+    assert len(acks) == 3
+
+
+@pytest.fixture
+def batch_device(server):
+    device_id = 'Sensor32_BATCH'
+    with server.get_db(write=True) as conn:
+        conn.execute('INSERT OR REPLACE INTO device_settings (device_id, sleep_duration) VALUES (?, 30)',
+                     (device_id,))
+        conn.execute('DELETE FROM sensor_readings WHERE device_id = ?', (device_id,))
+        conn.commit()
+    return device_id
+
+
+def send_batch(server, device_id, seqs):
+    server.handle_sensor_batch(device_id, {'device_id': device_id, 'readings': [
+        {'seq': seq, 'timestamp': 1_700_000_000 + seq * 60, 'temperature': 20.0 + seq}
+        for seq in seqs
+    ]})
+
+
+def stored_temperatures(server, device_id):
+    with server.get_db() as conn:
+        return sorted(row[0] for row in conn.execute(
+            "SELECT value FROM sensor_readings WHERE device_id = ? AND sensor_type = 'temperature'",
+            (device_id,)))
+
+
+def test_repeated_batch_is_acked_but_stored_once(server, acks, batch_device):
+    send_batch(server, batch_device, [1, 2, 3])
+    send_batch(server, batch_device, [1, 2, 3])
+    send_batch(server, batch_device, [2, 3, 4])
+
+    assert stored_temperatures(server, batch_device) == [21.0, 22.0, 23.0, 24.0]
+    assert [payload['seq'] for _, payload in acks] == [3, 3, 4]
+
+
+def test_seq_going_back_is_treated_as_a_restart(server, acks, batch_device):
+    send_batch(server, batch_device, [10, 11])
+    send_batch(server, batch_device, [1, 2])       # rebooted device counts from 1 again
+    send_batch(server, batch_device, [2, 3])       # and its resends are still deduplicated
+
+    assert stored_temperatures(server, batch_device) == [21.0, 22.0, 23.0, 30.0, 31.0]
+    assert [payload['seq'] for _, payload in acks] == [11, 2, 3]
+    with server.get_db() as conn:
+        assert conn.execute('SELECT last_batch_seq FROM device_settings WHERE device_id = ?',
+                            (batch_device,)).fetchone()[0] == 3
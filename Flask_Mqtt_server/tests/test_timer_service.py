@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def timers(server):
+    service = server.TimerService()
+    service.start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def fired():
+    return []
+
+
+def test_timers_fire_in_deadline_order(server, timers, fired, wait_for):
+    now = server.clock.time()
+    timers.call_at('late', now + 0.2, fired.append, 'late')
+    timers.call_at('early', now + 0.05, fired.append, 'early')
+    assert wait_for(lambda: len(fired) == 2)
+    assert fired == ['early', 'late']
+    assert timers.fired == 2
+    assert timers.timers == {}
+
+
+def test_cancelled_timer_never_fires(server, timers, fired, wait_for):
+    now = server.clock.time()
+    timers.call_at('cancelled', now + 0.05, fired.append, 'cancelled')
+    timers.call_at('kept', now + 0.1, fired.append, 'kept')
+    assert timers.cancel('cancelled')
+    assert not timers.cancel('cancelled')
+    assert wait_for(lambda: fired)
+    time.sleep(0.1)
+    assert fired == ['kept']
+
+
+def test_reschedule_moves_the_deadline(server, timers, fired, wait_for):
+    now = server.clock.time()
+    timers.call_at('moved', now + 60, fired.append, 'moved')
+    timers.call_at('fixed', now + 0.1, fired.append, 'fixed')
+    assert timers.reschedule('moved', now + 0.05)
+    assert wait_for(lambda: len(fired) == 2)
+    assert fired == ['moved', 'fixed']
+
+
+def test_reschedule_later_postpones_the_timer(server, timers, fired):
+    now = server.clock.time()
+    timers.call_at('postponed', now + 0.05, fired.append, 'postponed')
+    assert timers.reschedule('postponed', now + 60)
+    time.sleep(0.15)
+    assert fired == []
+    assert [timer['key'] for timer in timers.pending()] == ['postponed']
+
+
+def test_reschedule_of_unknown_key_is_refused(server, timers):
+    assert not timers.reschedule('missing', server.clock.time() + 1)
+    assert timers.timers == {}
+
+
+def test_same_key_replaces_the_timer(server, timers, fired, wait_for):
+    now = server.clock.time()
+    timers.call_at(('pump_off', 'PUMP_1'), now + 0.05, fired.append, 'first')
+    timers.call_at(('pump_off', 'PUMP_1'), now + 0.1, fired.append, 'second')
+    assert wait_for(lambda: fired)
+    time.sleep(0.1)
+    assert fired == ['second']
+
+
+def test_failing_callback_does_not_stop_the_thread(server, timers, fired, wait_for):
+    now = server.clock.time()
+    timers.call_at('broken', now + 0.02, lambda: 1 / 0)
+    timers.call_at('next', now + 0.05, fired.append, 'next')
+    assert wait_for(lambda: fired == ['next'])
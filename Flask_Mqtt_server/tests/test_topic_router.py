@@ -0,0 +1,37 @@
+import pytest
+
+FILTERS = ['mynode/sensors', 'mynode/+/status', 'mynode/#', '+/telemetry', 'mynode/pumps/#']
+
+
+@pytest.fixture
+def trie(server):
+    trie = server.TopicTrie()
+    for topic_filter in FILTERS:
+        trie.insert(topic_filter, topic_filter)
+    return trie
+
+
+@pytest.mark.parametrize('topic, expected', [
+    ('mynode/sensors', {'mynode/sensors', 'mynode/#'}),
+    ('mynode/pump/status', {'mynode/+/status', 'mynode/#'}),
+    ('mynode/a/b/status', {'mynode/#'}),                  # '+' is one level only
+    ('mynode', {'mynode/#'}),                             # '#' also matches the parent level
+    ('mynode/pumps', {'mynode/#', 'mynode/pumps/#'}),
+    ('mynode/pumps/PUMP_1/level', {'mynode/#', 'mynode/pumps/#'}),
+    ('mynode/telemetry', {'mynode/#', '+/telemetry'}),
+    ('other/telemetry', {'+/telemetry'}),
+    ('other/sensors', set()),
+])
+def test_wildcard_matching(trie, topic, expected):
+    assert set(trie.match(topic)) == expected
+
+
+def test_every_registration_is_returned(server):
+    trie = server.TopicTrie()
+    trie.insert('a/+', 'first')
+    trie.insert('a/+', 'second')
+    assert trie.match('a/b') == ['first', 'second']
+
+
+def test_router_dispatches_a_topic_once_per_handler(server):
+    assert len(server.topic_router.trie.match('mynode/telemetry')) == 1
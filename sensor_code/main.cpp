@@ -20,8 +20,7 @@ const char* mqtt_server = "broker.hivemq.com";
 const int mqtt_port = 1883;
 
 // MQTT Topics
-const char* MQTT_TOPIC_TEMP = "mynode/Temperature";
-const char* MQTT_TOPIC_HUM = "mynode/moisture";
+const char* MQTT_TOPIC_TELEMETRY = "mynode/telemetry";
 const char* MQTT_TOPIC_AUTH = "mynode/auth";
 const char* MQTT_TOPIC_ACK = "mynode/ack";
 const char* MQTT_TOPIC_SLEEP = "mynode/default/config/sleep";
@@ -209,8 +208,7 @@ void publishSensorData() {
     char jsonBuffer[200];
     serializeJson(doc, jsonBuffer);
     
-     if (mqtt.publish(MQTT_TOPIC_TEMP, jsonBuffer) && 
-        mqtt.publish(MQTT_TOPIC_HUM, jsonBuffer)) {
+     if (mqtt.publish(MQTT_TOPIC_TELEMETRY, jsonBuffer)) {
         Serial.printf("[DATA] Published - T: %.1f°C, H: %.1f%%\n", temperature, _moisture);
         dataSent = true;
         setState(STATE_WAIT_ACK);